@@ -1,27 +1,89 @@
 # Updated Phi-2 Inference Code
-import torch # type: ignore
-from transformers import AutoModelForCausalLM, AutoTokenizer # type: ignore
 import logging
+import threading
+from streaming import TokenStream
+from startup import get_startup_profile, lazy_import, load_pretrained
+from model_registry import get_model_registry
+
+torch = lazy_import("torch")
+transformers = lazy_import("transformers")
 
 class Phi2ExplorerIntegration:
-    def __init__(self, model_name="microsoft/phi-2", device=None):
-        """Initialize Phi-2 model with proper error handling."""
+    def __init__(self, model_name="microsoft/phi-2", device=None, lazy_load=True):
+        """Set up Phi-2; the model is loaded on first use or warm() unless lazy_load is False."""
+        self.model_name = model_name
+        self.requested_device = device
+        self._model = None
+        self._model_handle = None
+        self._load_lock = threading.Lock()
+        if not lazy_load:
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        """Load the model and tokenizer once, with proper error handling."""
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            self._device = self.requested_device or ("cuda" if torch.cuda.is_available() else "cpu")
+            logging.info(f"Using device: {self._device}")
+            # Shared with every other owner of the same checkpoint in the process
+            self._model_handle = get_model_registry().acquire(
+                self.model_name,
+                self._load_model,
+                variant=("AutoModelForCausalLM", self._device)
+            )
+            self._tokenizer = self._model_handle.tokenizer
+            self._model = self._model_handle.model
+
+    def _load_model(self):
         try:
-            self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
-            logging.info(f"Using device: {self.device}")
-            
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                trust_remote_code=True,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
+            tokenizer = transformers.AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True)
+            model = load_pretrained(
+                transformers.AutoModelForCausalLM,
+                self.model_name,
+                torch_dtype=torch.float16 if self._device == "cuda" else torch.float32,
+                trust_remote_code=True
             )
-            self.model.to(self.device)
-            
+            return model.to(self._device), tokenizer
+
         except Exception as e:
             logging.error(f"Error initializing Phi-2: {str(e)}")
             raise
 
+    def close(self):
+        """Release the model back to the registry, which unloads it when memory is needed."""
+        with self._load_lock:
+            if self._model_handle is not None:
+                self._model_handle.release()
+                self._model_handle = None
+                self._model = None
+
+    @property
+    def model(self):
+        self._ensure_loaded()
+        return self._model
+
+    @property
+    def tokenizer(self):
+        self._ensure_loaded()
+        return self._tokenizer
+
+    @property
+    def device(self):
+        self._ensure_loaded()
+        return self._device
+
+    def warm(self):
+        """Load the model and run one generation step; returns the startup time breakdown."""
+        self._ensure_loaded()
+        profile = get_startup_profile()
+        with profile.measure("first_inference", self.model_name):
+            self.generate_text("Hello", max_length=8)
+        logging.info(profile.format_report())
+        return profile.report()
+
     def generate_text(self, prompt, max_length=200, temperature=0.7, top_k=50):
         try:
             inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
@@ -38,6 +100,55 @@ class Phi2ExplorerIntegration:
             logging.error(f"Error generating text: {str(e)}")
             return f"Error: {str(e)}"
 
+    def stream_text(self, prompt, max_length=200, temperature=0.7, top_k=50):
+        """Start generation in the background and return a TokenStream of text deltas."""
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+        stream = TokenStream(
+            self.tokenizer,
+            inputs.input_ids[0].tolist(),
+            stop_token_ids=[self.tokenizer.eos_token_id]
+        )
+
+        def _generate():
+            try:
+                with torch.no_grad():
+                    self.model.generate(
+                        inputs.input_ids,
+                        max_length=max_length,
+                        temperature=temperature,
+                        top_k=top_k,
+                        pad_token_id=self.tokenizer.eos_token_id,
+                        streamer=stream,
+                        # Ends generation once the consumer closes the stream
+                        stopping_criteria=stream.stopping_criteria()
+                    )
+            except Exception as e:
+                logging.error(f"Error streaming text: {str(e)}")
+                stream.fail(e)
+
+        threading.Thread(target=_generate, daemon=True).start()
+        return stream
+
+    def generate_batch(self, prompts, max_length=200, temperature=0.7, top_k=50):
+        """Generate for several prompts with a single left-padded generate call."""
+        try:
+            self.tokenizer.padding_side = "left"
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+            inputs = self.tokenizer(list(prompts), return_tensors="pt", padding=True).to(self.device)
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    max_length=max_length,
+                    temperature=temperature,
+                    top_k=top_k,
+                    pad_token_id=self.tokenizer.pad_token_id
+                )
+            return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        except Exception as e:
+            logging.error(f"Error generating batch: {str(e)}")
+            return [f"Error: {str(e)}"] * len(prompts)
+
 # Test the implementation
 def test_phi2():
     try:
@@ -0,0 +1,308 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from dataclasses import dataclass, field
+from collections import deque
+from pathlib import Path
+import bisect
+import json
+import logging
+import os
+import socket
+import statistics
+import threading
+import time
+
+from batching import BatchSettings
+from metrics import MetricsRegistry, get_registry
+
+@dataclass
+class AutotuneSettings:
+    """Autotuner settings from optimization.dynamic_optimization and inference.batch_settings"""
+    enabled: bool = True
+    search: bool = True
+    warmup_iterations: int = 100
+    optimization_window: int = 1000
+    latency_slo_ms: float = 100.0
+    candidate_batch_sizes: List[int] = field(default_factory=lambda: [1, 2, 4, 8, 16, 32])
+    candidate_wait_ms: List[float] = field(default_factory=lambda: [1.0, 2.0, 5.0, 10.0])
+    state_path: str = "./cache/autotune.json"
+
+    @classmethod
+    def from_config(cls, dynamic_optimization: Dict[str, Any], batch_settings: Dict[str, Any]) -> "AutotuneSettings":
+        min_size = max(1, int(batch_settings.get("min_batch_size", 1)))
+        max_size = max(min_size, int(batch_settings.get("max_batch_size", 32)))
+        candidates = dynamic_optimization.get("candidate_batch_sizes")
+        if candidates is None:
+            # Powers of two between the configured bounds, plus the maximum itself
+            candidates, size = [], 1
+            while size < max_size:
+                if size >= min_size:
+                    candidates.append(size)
+                size *= 2
+            candidates.append(max_size)
+        candidates = sorted({int(c) for c in candidates if min_size <= int(c) <= max_size})
+        if not candidates:
+            raise ValueError("No candidate batch sizes within min_batch_size and max_batch_size")
+        return cls(
+            enabled=dynamic_optimization.get("enabled", True),
+            search=batch_settings.get("optimal_batch_size_search", True),
+            warmup_iterations=int(dynamic_optimization.get("warmup_iterations", 100)),
+            optimization_window=max(1, int(dynamic_optimization.get("optimization_window", 1000))),
+            latency_slo_ms=float(dynamic_optimization.get("latency_slo_ms", 100.0)),
+            candidate_batch_sizes=candidates,
+            candidate_wait_ms=sorted(float(w) for w in dynamic_optimization.get("candidate_wait_ms", [1.0, 2.0, 5.0, 10.0])),
+            state_path=dynamic_optimization.get("state_path", "./cache/autotune.json")
+        )
+
+class BatchAutotuner:
+    # Smoothing of the online per-batch latency profile
+    PROFILE_ALPHA = 0.1
+    # Spare capacity required before a batch size counts as sustainable
+    HEADROOM = 1.2
+
+    def __init__(
+        self,
+        batch_settings: BatchSettings,
+        settings: AutotuneSettings,
+        model_identity: str,
+        metrics: Optional[MetricsRegistry] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Warm up the model and tune the batcher's batch size and wait time.
+
+        At startup warmup() runs forward passes over representative shapes
+        at every candidate batch size, which both warms kernels/allocators
+        and measures how long a batch of each size takes. From that profile
+        the batch size with the best throughput whose latency stays within
+        latency_slo_ms is applied. Afterwards every optimization_window
+        requests the arrival rate is re-measured and the smallest batch size
+        that sustains it within the SLO is chosen, with a wait time long
+        enough to fill it. The tuned settings are persisted per host and
+        model, so a restart only warms up instead of searching again.
+
+        Args:
+            batch_settings: Settings shared with the batcher, tuned in place
+            settings: Autotuner settings
+            model_identity: Model key for persisted settings
+            metrics: Metrics registry for the chosen settings
+            logger: Optional logger instance
+        """
+        self.batch_settings = batch_settings
+        self.settings = settings
+        self.logger = logger or logging.getLogger(__name__)
+        self.state_key = f"{socket.gethostname()}|{model_identity}|cpus={os.cpu_count()}"
+        self.profile: Dict[int, float] = {}
+        self.retunes = 0
+
+        self._window = deque(maxlen=settings.optimization_window)
+        self._since_retune = 0
+        self._lock = threading.Lock()
+        # The state file is written by a background thread, never on a request
+        self._save_requested = threading.Event()
+        self._saver: Optional[threading.Thread] = None
+        self._closed = False
+
+        metrics = metrics or get_registry()
+        self._batch_size_gauge = metrics.gauge("autotune_batch_size", "Batch size chosen by the autotuner")
+        self._wait_gauge = metrics.gauge("autotune_max_wait_ms", "Batch wait time chosen by the autotuner")
+        self._rate_gauge = metrics.gauge("autotune_arrival_rate", "Requests per second seen by the autotuner")
+        self._retune_counter = metrics.counter("autotune_retunes_total", "Times the autotuner changed settings")
+
+    def wrap(self, batch_fn: Callable[[List[Any]], List[Any]]) -> Callable[[List[Any]], List[Any]]:
+        """Wrap the batch function so served batches keep the latency profile current"""
+        def _timed(items: List[Any]) -> List[Any]:
+            start = time.perf_counter()
+            results = batch_fn(items)
+            self._record_batch(len(items), time.perf_counter() - start)
+            return results
+        return _timed
+
+    def _bucket(self, size: int) -> int:
+        candidates = self.settings.candidate_batch_sizes
+        return candidates[min(bisect.bisect_left(candidates, size), len(candidates) - 1)]
+
+    def _record_batch(self, size: int, duration: float):
+        bucket = self._bucket(size)
+        with self._lock:
+            previous = self.profile.get(bucket)
+            if previous is None:
+                self.profile[bucket] = duration
+            else:
+                self.profile[bucket] = previous + self.PROFILE_ALPHA * (duration - previous)
+
+    def warmup(self, batch_fn: Callable[[List[Any]], List[Any]], samples: Sequence[Any]):
+        """
+        Run warmup passes and, unless persisted settings exist, the batch size search.
+
+        Args:
+            batch_fn: The model's batch function (called directly, not via the batcher)
+            samples: Representative inputs, ideally one per shape bucket
+        """
+        if not samples:
+            return
+        state = self._load_state()
+        if state is not None:
+            self.profile = {int(size): latency for size, latency in state.get("profile", {}).items()}
+            self._apply(int(state["max_batch_size"]), float(state["max_wait_ms"]))
+            sizes = [self.batch_settings.max_batch_size]
+            self.logger.info(f"Loaded tuned batch settings for {self.state_key}")
+        else:
+            sizes = self.settings.candidate_batch_sizes if self.settings.search else [self.batch_settings.max_batch_size]
+
+        # Spread the warmup budget across batch sizes and shapes
+        passes = max(2, self.settings.warmup_iterations // (len(sizes) * len(samples)))
+        start_time = time.time()
+        for size in sizes:
+            timings = []
+            for sample in samples:
+                batch = [sample] * size
+                batch_fn(batch)
+                for _ in range(passes - 1):
+                    start = time.perf_counter()
+                    batch_fn(batch)
+                    timings.append(time.perf_counter() - start)
+            if timings and state is None:
+                self.profile[size] = statistics.median(timings)
+        self.logger.info(f"Warmup finished in {time.time() - start_time:.2f}s")
+
+        if state is None and self.settings.search and self.profile:
+            self._apply(*self._choose(arrival_rate=None))
+            self._schedule_save()
+
+    def _choose(self, arrival_rate: Optional[float]):
+        """Pick (batch size, wait ms) from the latency profile and arrival rate"""
+        slo = self.settings.latency_slo_ms / 1000.0
+        waits = self.settings.candidate_wait_ms
+        with self._lock:
+            profile = dict(self.profile)
+
+        feasible = {size: latency for size, latency in profile.items() if latency + waits[0] / 1000.0 <= slo}
+        if not feasible:
+            # Nothing meets the SLO: the fastest batch is the best we can do
+            size = min(profile, key=profile.get)
+            return size, waits[0]
+
+        chosen = None
+        current = self._bucket(self.batch_settings.max_batch_size)
+        saturated = current in profile and arrival_rate and arrival_rate * self.HEADROOM > current / profile[current]
+        if arrival_rate and not saturated:
+            sustainable = [size for size, latency in feasible.items() if size / latency >= self.HEADROOM * arrival_rate]
+            if sustainable:
+                chosen = min(sustainable)
+        # A saturated batcher hides the real demand, so go for peak throughput
+        if chosen is None:
+            chosen = max(feasible, key=lambda size: size / feasible[size])
+
+        # Wait long enough to fill the batch at the current rate, within the SLO
+        budget_ms = (slo - feasible[chosen]) * 1000.0
+        if arrival_rate:
+            target_ms = (chosen - 1) / arrival_rate * 1000.0
+        else:
+            target_ms = self.batch_settings.max_wait_ms
+        allowed = [wait for wait in waits if wait <= min(target_ms, budget_ms)]
+        return chosen, allowed[-1] if allowed else waits[0]
+
+    def _apply(self, batch_size: int, wait_ms: float):
+        settings = self.batch_settings
+        changed = (settings.max_batch_size, settings.max_wait_ms) != (batch_size, wait_ms)
+        settings.max_batch_size = batch_size
+        settings.max_wait_ms = wait_ms
+        self._batch_size_gauge.set(batch_size)
+        self._wait_gauge.set(wait_ms)
+        if changed:
+            self.logger.info(f"Autotuner set max_batch_size={batch_size}, max_wait_ms={wait_ms}")
+        return changed
+
+    def observe(self, latency: float):
+        """Record one completed request; re-tunes once per optimization_window requests"""
+        with self._lock:
+            self._window.append((time.monotonic(), latency))
+            self._since_retune += 1
+            if self._since_retune < self.settings.optimization_window:
+                return
+            self._since_retune = 0
+            window = list(self._window)
+        self._retune(window)
+
+    def _retune(self, window: List[Any]):
+        span = window[-1][0] - window[0][0]
+        arrival_rate = (len(window) - 1) / span if span > 0 else None
+        if arrival_rate is not None:
+            self._rate_gauge.set(arrival_rate)
+
+        latencies = sorted(latency for _, latency in window)
+        p99 = latencies[int(0.99 * (len(latencies) - 1))]
+        if p99 * 1000.0 > self.settings.latency_slo_ms:
+            self.logger.warning(f"p99 latency {p99 * 1000.0:.1f}ms exceeds the {self.settings.latency_slo_ms}ms SLO")
+
+        if self._apply(*self._choose(arrival_rate)):
+            self.retunes += 1
+            self._retune_counter.inc()
+            self._schedule_save()
+
+    @property
+    def chosen_settings(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.batch_settings.max_batch_size,
+            "max_wait_ms": self.batch_settings.max_wait_ms,
+            "profile_ms": {size: latency * 1000.0 for size, latency in sorted(self.profile.items())},
+            "retunes": self.retunes
+        }
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        path = Path(self.settings.state_path)
+        if not path.exists():
+            return None
+        try:
+            state = json.loads(path.read_text()).get(self.state_key)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable autotune state: {str(e)}")
+            return None
+        if state is None or state.get("max_batch_size") not in self.settings.candidate_batch_sizes:
+            return None
+        return state
+
+    def _schedule_save(self):
+        """Have the background saver persist the current settings"""
+        with self._lock:
+            if self._closed:
+                return
+            if self._saver is None:
+                self._saver = threading.Thread(target=self._save_loop, name="autotune-state", daemon=True)
+                self._saver.start()
+        self._save_requested.set()
+
+    def _save_loop(self):
+        while True:
+            self._save_requested.wait()
+            self._save_requested.clear()
+            if self._closed:
+                return
+            self._save_state()
+
+    def close(self):
+        """Stop the background saver, persisting the latest settings if any were scheduled"""
+        with self._lock:
+            saver, self._saver = self._saver, None
+            self._closed = True
+        if saver is not None:
+            self._save_requested.set()
+            saver.join()
+            self._save_state()
+
+    def _save_state(self):
+        path = Path(self.settings.state_path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            states = json.loads(path.read_text()) if path.exists() else {}
+            states[self.state_key] = {
+                "max_batch_size": self.batch_settings.max_batch_size,
+                "max_wait_ms": self.batch_settings.max_wait_ms,
+                "profile": {str(size): latency for size, latency in self.profile.items()},
+                "updated": time.time()
+            }
+            tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(states, indent=2))
+            os.replace(tmp, path)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Could not persist autotune state: {str(e)}")
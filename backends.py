@@ -0,0 +1,377 @@
+from typing import Any, Dict, List, Optional, Sequence
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from pathlib import Path
+import hashlib
+import logging
+import os
+import statistics
+import threading
+import time
+
+import torch # type: ignore
+
+@dataclass
+class BackendSettings:
+    """Execution backend settings from optimization.compiler_optimizations"""
+    backend: str = "eager"
+    compile_mode: str = "reduce-overhead"
+    compile_backend: str = "inductor"
+    artifact_dir: str = "./cache/compiled"
+    verify: bool = True
+    atol: float = 1e-3
+    rtol: float = 1e-3
+
+    @classmethod
+    def from_config(cls, compiler_optimizations: Dict[str, Any]) -> "BackendSettings":
+        default = "torch_compile" if compiler_optimizations.get("use_torch_compile", False) else "eager"
+        backend = compiler_optimizations.get("execution_backend", default)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown execution backend: {backend}")
+        return cls(
+            backend=backend,
+            compile_mode=compiler_optimizations.get("compile_mode", "reduce-overhead"),
+            compile_backend=compiler_optimizations.get("backend", "inductor"),
+            artifact_dir=compiler_optimizations.get("artifact_dir", "./cache/compiled"),
+            verify=compiler_optimizations.get("verify_outputs", True),
+            atol=float(compiler_optimizations.get("atol", 1e-3)),
+            rtol=float(compiler_optimizations.get("rtol", 1e-3))
+        )
+
+def artifact_key(model_identity: str, dtype: Any, width: int, backend: str) -> str:
+    """File-safe key of a compiled artifact: model@revision, dtype, shape bucket and backend"""
+    digest = hashlib.blake2b(f"{model_identity}|{dtype}|{width}|{backend}|torch={torch.__version__}".encode(), digest_size=12)
+    return f"{backend}-w{width}-{digest.hexdigest()}"
+
+def _tensor_outputs(outputs: Any) -> Dict[str, torch.Tensor]:
+    """Tensor fields of a model output, in order; per-layer tuples become name.0, name.1, ..."""
+    if isinstance(outputs, dict):
+        tensors = {}
+        for name, value in outputs.items():
+            if torch.is_tensor(value):
+                tensors[name] = value
+            elif isinstance(value, (tuple, list)) and value and all(torch.is_tensor(item) for item in value):
+                # e.g. hidden_states and attentions when the config asks for them
+                tensors.update({f"{name}.{index}": item for index, item in enumerate(value)})
+        return tensors
+    if isinstance(outputs, (tuple, list)):
+        return {f"output_{index}": value for index, value in enumerate(outputs) if torch.is_tensor(value)}
+    return {"output_0": outputs}
+
+class _PositionalModel(torch.nn.Module):
+    """Adapter giving keyword-driven models a positional, tuple-returning forward for tracing and export"""
+
+    def __init__(self, model: torch.nn.Module, input_names: Sequence[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = list(input_names)
+
+    def forward(self, *args):
+        outputs = self.model(**dict(zip(self.input_names, args)))
+        return tuple(_tensor_outputs(outputs).values())
+
+def _compare_outputs(
+    expected: Dict[str, torch.Tensor],
+    actual: Dict[str, torch.Tensor],
+    atol: float,
+    rtol: float
+) -> Dict[str, Any]:
+    report = {"match": True, "max_abs_diff": {}}
+    for name, value in expected.items():
+        if name not in actual:
+            report["match"] = False
+            report["max_abs_diff"][name] = None
+            continue
+        other = actual[name].to(value.device, value.dtype)
+        if other.shape != value.shape:
+            report["match"] = False
+            report["max_abs_diff"][name] = None
+            continue
+        report["max_abs_diff"][name] = (other - value).abs().max().item() if value.numel() else 0.0
+        if not torch.allclose(other, value, atol=atol, rtol=rtol):
+            report["match"] = False
+    return report
+
+# Marks a shape bucket whose compiled outputs did not match eager
+_EAGER_FALLBACK = object()
+
+class ExecutionBackend(ABC):
+    name = "base"
+
+    def __init__(self, model: torch.nn.Module, model_identity: str, settings: BackendSettings, logger: Optional[logging.Logger] = None):
+        """
+        Runs a model's forward pass on padded inputs.
+
+        Backends that specialize on input shapes prepare one artifact per
+        padding width (the shape bucket) on first use and cache it on disk
+        under artifact_dir, so a restart loads it instead of recompiling.
+        With verify enabled the first batch of every bucket is also run
+        eagerly; if the outputs differ beyond atol/rtol the bucket falls
+        back to eager execution. A bucket whose preparation fails (e.g. a
+        torch.compile error on first use) falls back to eager as well, and
+        the error is kept in failures.
+
+        Args:
+            model: Eager model in eval mode
+            model_identity: Model name and revision for artifact keys
+            settings: Backend settings
+            logger: Optional logger instance
+        """
+        self.model = model
+        self.model_identity = model_identity
+        self.settings = settings
+        self.logger = logger or logging.getLogger(__name__)
+        self.dtype = next(model.parameters()).dtype
+        self.artifact_dir = Path(settings.artifact_dir)
+        self._prepared: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self.failures: Dict[int, str] = {}
+
+    def _artifact_path(self, width: int, suffix: str) -> Path:
+        self.artifact_dir.mkdir(parents=True, exist_ok=True)
+        return self.artifact_dir / (artifact_key(self.model_identity, self.dtype, width, self.name) + suffix)
+
+    def _runner(self, inputs: Dict[str, torch.Tensor]) -> Any:
+        width = inputs["input_ids"].shape[-1]
+        runner = self._prepared.get(width)
+        if runner is None:
+            with self._lock:
+                runner = self._prepared.get(width)
+                if runner is None:
+                    start = time.time()
+                    try:
+                        runner = self.prepare(inputs)
+                        self.logger.info(f"Prepared {self.name} backend for width {width} in {time.time() - start:.2f}s")
+                        if self.settings.verify and self.name != "eager":
+                            runner = self._verify(runner, inputs, width)
+                    except Exception as e:
+                        # Remembered per bucket so a broken compile is not retried on every batch
+                        self.failures[width] = f"{type(e).__name__}: {str(e)}"
+                        self.logger.error(f"Preparing {self.name} backend for width {width} failed, using eager for this shape: {str(e)}")
+                        runner = _EAGER_FALLBACK
+                    self._prepared[width] = runner
+        return runner
+
+    def _verify(self, runner: Any, inputs: Dict[str, torch.Tensor], width: int) -> Any:
+        with torch.inference_mode():
+            report = _compare_outputs(
+                _tensor_outputs(self.model(**inputs)),
+                self.run(runner, inputs),
+                self.settings.atol,
+                self.settings.rtol
+            )
+        if report["match"]:
+            return runner
+        self.logger.error(
+            f"{self.name} outputs differ from eager for width {width} "
+            f"(max abs diff {report['max_abs_diff']}), using eager for this shape"
+        )
+        return _EAGER_FALLBACK
+
+    @abstractmethod
+    def prepare(self, example_inputs: Dict[str, torch.Tensor]) -> Any:
+        """Build (or load) the runner for the shape bucket of example_inputs"""
+
+    @abstractmethod
+    def run(self, runner: Any, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        pass
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        with torch.inference_mode():
+            runner = self._runner(inputs)
+            if runner is _EAGER_FALLBACK:
+                return _tensor_outputs(self.model(**inputs))
+            return self.run(runner, inputs)
+
+class EagerBackend(ExecutionBackend):
+    name = "eager"
+
+    def prepare(self, example_inputs: Dict[str, torch.Tensor]) -> Any:
+        return self.model
+
+    def run(self, runner: Any, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        return _tensor_outputs(runner(**inputs))
+
+class TorchCompileBackend(ExecutionBackend):
+    name = "torch_compile"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Inductor keeps compiled kernels and FX graphs in this directory across restarts
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(self.artifact_dir / "inductor"))
+        self.compiled = torch.compile(
+            self.model,
+            mode=self.settings.compile_mode,
+            backend=self.settings.compile_backend
+        )
+
+    def prepare(self, example_inputs: Dict[str, torch.Tensor]) -> Any:
+        # Portable cache artifacts let a restart skip compiling this bucket
+        path = self._artifact_path(example_inputs["input_ids"].shape[-1], ".bin")
+        loaded = False
+        if path.exists() and hasattr(torch.compiler, "load_cache_artifacts"):
+            try:
+                torch.compiler.load_cache_artifacts(path.read_bytes())
+                loaded = True
+            except Exception as e:
+                self.logger.warning(f"Ignoring stale compile cache {path.name}: {str(e)}")
+
+        with torch.inference_mode():
+            self.compiled(**example_inputs)
+
+        if not loaded and hasattr(torch.compiler, "save_cache_artifacts"):
+            artifacts = torch.compiler.save_cache_artifacts()
+            if artifacts is not None:
+                path.write_bytes(artifacts[0])
+        return self.compiled
+
+    def run(self, runner: Any, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        return _tensor_outputs(runner(**inputs))
+
+class TorchScriptBackend(ExecutionBackend):
+    name = "torchscript"
+
+    def prepare(self, example_inputs: Dict[str, torch.Tensor]) -> Any:
+        names = list(example_inputs)
+        with torch.inference_mode():
+            output_names = list(_tensor_outputs(self.model(**example_inputs)))
+        path = self._artifact_path(example_inputs["input_ids"].shape[-1], ".pt")
+        if path.exists():
+            module = torch.jit.load(str(path), map_location=example_inputs["input_ids"].device)
+        else:
+            module = torch.jit.trace(
+                _PositionalModel(self.model, names),
+                tuple(example_inputs[name] for name in names),
+                check_trace=False
+            )
+            module = torch.jit.freeze(module.eval())
+            tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+            torch.jit.save(module, str(tmp))
+            os.replace(tmp, path)
+        return module, names, output_names
+
+    def run(self, runner: Any, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        module, names, output_names = runner
+        return dict(zip(output_names, module(*(inputs[name] for name in names))))
+
+class OnnxRuntimeBackend(ExecutionBackend):
+    name = "onnxruntime"
+
+    def __init__(self, *args, **kwargs):
+        import onnxruntime # type: ignore
+        super().__init__(*args, **kwargs)
+        self.onnxruntime = onnxruntime
+
+    def prepare(self, example_inputs: Dict[str, torch.Tensor]) -> Any:
+        names = list(example_inputs)
+        with torch.inference_mode():
+            output_names = list(_tensor_outputs(self.model(**example_inputs)))
+        path = self._artifact_path(example_inputs["input_ids"].shape[-1], ".onnx")
+        if not path.exists():
+            tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+            torch.onnx.export(
+                _PositionalModel(self.model, names),
+                tuple(example_inputs[name] for name in names),
+                str(tmp),
+                input_names=names,
+                output_names=output_names,
+                # The width is fixed per artifact; only the batch dimension varies
+                dynamic_axes={name: {0: "batch"} for name in names + output_names}
+            )
+            os.replace(tmp, path)
+        options = self.onnxruntime.SessionOptions()
+        options.graph_optimization_level = self.onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = self.onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        return session, names, output_names
+
+    def run(self, runner: Any, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        session, names, output_names = runner
+        feeds = {name: inputs[name].cpu().numpy() for name in names}
+        outputs = session.run(output_names, feeds)
+        return {name: torch.from_numpy(value) for name, value in zip(output_names, outputs)}
+
+BACKENDS = {
+    "eager": EagerBackend,
+    "torch_compile": TorchCompileBackend,
+    "torchscript": TorchScriptBackend,
+    "onnxruntime": OnnxRuntimeBackend
+}
+
+def create_backend(
+    model: torch.nn.Module,
+    model_identity: str,
+    settings: BackendSettings,
+    logger: Optional[logging.Logger] = None
+) -> ExecutionBackend:
+    """Instantiate the configured backend, falling back to eager if its runtime is missing or fails to start"""
+    logger = logger or logging.getLogger(__name__)
+    try:
+        return BACKENDS[settings.backend](model, model_identity, settings, logger=logger)
+    except ImportError as e:
+        logger.warning(f"{settings.backend} backend unavailable ({str(e)}), using eager")
+    except Exception as e:
+        # e.g. torch.compile refusing an unsupported Python or platform
+        logger.error(f"Failed to create {settings.backend} backend, using eager: {str(e)}")
+    return EagerBackend(model, model_identity, settings, logger=logger)
+
+def check_equivalence(
+    backend: ExecutionBackend,
+    reference: ExecutionBackend,
+    inputs: Dict[str, torch.Tensor],
+    atol: float = 1e-3,
+    rtol: float = 1e-3
+) -> Dict[str, Any]:
+    """
+    Compare a backend's outputs with a reference (normally eager) on the same inputs.
+
+    Returns:
+        Per-output maximum absolute difference and whether all outputs match
+    """
+    return {"backend": backend.name, **_compare_outputs(reference(inputs), backend(inputs), atol, rtol)}
+
+def compare_backends(
+    model: torch.nn.Module,
+    model_identity: str,
+    inputs: Dict[str, torch.Tensor],
+    backends: Sequence[str],
+    settings: Optional[BackendSettings] = None,
+    iterations: int = 20,
+    logger: Optional[logging.Logger] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Measure each backend's latency and check its outputs against eager.
+
+    Returns:
+        Per backend: preparation time, median and p95 latency in ms and the
+        equivalence report; unavailable backends report the error instead
+    """
+    # Measure each backend as is, without the per-bucket eager fallback
+    settings = replace(settings or BackendSettings(), verify=False)
+    eager = EagerBackend(model, model_identity, settings, logger=logger)
+    results = {}
+    for name in backends:
+        try:
+            backend = BACKENDS[name](model, model_identity, settings, logger=logger)
+            start = time.perf_counter()
+            backend(inputs)
+            prepare_s = time.perf_counter() - start
+            width = inputs["input_ids"].shape[-1]
+            if width in backend.failures:
+                # Timing the eager fallback would misreport this backend
+                results[name] = {"error": backend.failures[width]}
+                continue
+            timings: List[float] = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                backend(inputs)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            results[name] = {
+                "prepare_seconds": prepare_s,
+                "latency_p50_ms": statistics.median(timings) * 1000,
+                "latency_p95_ms": timings[int(0.95 * (len(timings) - 1))] * 1000,
+                "equivalence": check_equivalence(backend, eager, inputs, settings.atol, settings.rtol)
+            }
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+    return results
@@ -0,0 +1,225 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from dataclasses import dataclass, field
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+import time
+
+import tracing
+
+@dataclass
+class BatchSettings:
+    """Scheduler settings derived from inference.batch_settings"""
+    max_batch_size: int = 32
+    max_wait_ms: float = 5.0
+    max_concurrent_batches: int = 1
+    enabled: bool = True
+
+    @classmethod
+    def from_config(cls, batch_settings: Dict[str, Any]) -> "BatchSettings":
+        """
+        Build settings from the inference.batch_settings config section.
+
+        With dynamic_batching enabled batches grow up to max_batch_size;
+        otherwise the static batch_size is used as the cap. min_batch_size
+        only raises that cap here; it bounds the autotuner's search, since a
+        batch is always dispatched once max_wait_ms has passed.
+        """
+        min_size = max(1, int(batch_settings.get("min_batch_size", 1)))
+        if batch_settings.get("dynamic_batching", True):
+            max_size = int(batch_settings.get("max_batch_size", 32))
+        else:
+            max_size = int(batch_settings.get("batch_size", 1))
+        return cls(
+            max_batch_size=max(min_size, max_size),
+            max_wait_ms=float(batch_settings.get("max_wait_ms", 5.0)),
+            max_concurrent_batches=max(1, int(batch_settings.get("max_concurrent_batches", 1))),
+            enabled=batch_settings.get("enabled", True) and max_size > 1
+        )
+
+@dataclass
+class BatchStats:
+    """Counters describing queue depth and batch fill"""
+    requests: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    last_batch_size: int = 0
+    total_batch_fill: float = 0.0
+    batch_size_histogram: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+    @property
+    def average_batch_fill(self) -> float:
+        """Mean fraction of max_batch_size used per dispatched batch"""
+        return self.total_batch_fill / self.batches if self.batches else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "last_batch_size": self.last_batch_size,
+            "average_batch_size": self.average_batch_size,
+            "average_batch_fill": self.average_batch_fill,
+            "batch_size_histogram": dict(self.batch_size_histogram)
+        }
+
+class DynamicBatcher:
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Sequence[Any]],
+        settings: Optional[BatchSettings] = None,
+        logger: Optional[logging.Logger] = None,
+        name: str = "dynamic-batcher"
+    ):
+        """
+        Micro-batching scheduler that coalesces concurrent requests.
+
+        Requests are queued until either max_batch_size of them are waiting
+        or max_wait_ms has passed since the oldest one arrived. The batch is
+        then run through a single batch_fn call and every caller receives
+        only the result at its own position. With max_concurrent_batches
+        above one, up to that many batches run at once (e.g. one per model
+        replica) while the next batch keeps filling.
+
+        Args:
+            batch_fn: Callable mapping a list of items to a list of results
+            settings: Batch scheduling settings
+            logger: Optional logger instance
+            name: Name used for the worker thread
+        """
+        self.batch_fn = batch_fn
+        self.settings = settings or BatchSettings()
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = BatchStats()
+        self._stats_lock = threading.Lock()
+
+        # Bound the number of batches in flight when dispatching concurrently
+        self._slots = None
+        self._dispatcher = None
+        if self.settings.max_concurrent_batches > 1:
+            self._slots = threading.Semaphore(self.settings.max_concurrent_batches)
+            self._dispatcher = ThreadPoolExecutor(
+                max_workers=self.settings.max_concurrent_batches,
+                thread_name_prefix=name
+            )
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return a future resolving to its own result"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Batcher is closed")
+            # Remember sampled traces so the dispatch can record queue wait
+            traces = tracing.active_traces()
+            self._queue.append((item, future, time.monotonic(), (traces, tracing.now()) if traces else None))
+            self.stats.queue_depth = len(self._queue)
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+            self._cond.notify()
+        return future
+
+    def infer(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Blocking helper: submit an item and wait for its result"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _next_batch(self) -> List[Any]:
+        """Wait for the next batch according to size and deadline rules"""
+        max_size = self.settings.max_batch_size
+        max_wait = self.settings.max_wait_ms / 1000.0
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+
+            deadline = self._queue[0][2] + max_wait
+            while len(self._queue) < max_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = [self._queue.popleft() for _ in range(min(max_size, len(self._queue)))]
+            self.stats.queue_depth = len(self._queue)
+            return batch
+
+    def _run(self):
+        while True:
+            if self._slots is not None:
+                self._slots.acquire()
+            batch = self._next_batch()
+            if not batch:
+                if self._slots is not None:
+                    self._slots.release()
+                return
+            # Drop requests whose callers already gave up
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                if self._slots is not None:
+                    self._slots.release()
+            elif self._dispatcher is None:
+                self._dispatch(batch)
+            else:
+                self._dispatcher.submit(self._dispatch_and_release, batch)
+
+    def _dispatch_and_release(self, batch: List[Any]):
+        try:
+            self._dispatch(batch)
+        finally:
+            self._slots.release()
+
+    def _dispatch(self, batch: List[Any]):
+        items = [entry[0] for entry in batch]
+        size = len(items)
+        traces = []
+        for entry in batch:
+            if entry[3] is not None:
+                tracing.record_span("batch_queue_wait", entry[3][1], traces=entry[3][0])
+                traces.extend(entry[3][0])
+        try:
+            with tracing.activate(traces), tracing.span("batch_inference", batch_size=size):
+                results = self.batch_fn(items)
+            if len(results) != size:
+                raise ValueError(
+                    f"Batch function returned {len(results)} results for {size} inputs"
+                )
+        except Exception as e:
+            self.logger.error(f"Batched inference failed: {str(e)}")
+            with self._stats_lock:
+                self.stats.failed_batches += 1
+            for entry in batch:
+                entry[1].set_exception(e)
+            return
+        finally:
+            with self._stats_lock:
+                self.stats.batches += 1
+                self.stats.requests += size
+                self.stats.last_batch_size = size
+                self.stats.total_batch_fill += size / self.settings.max_batch_size
+                self.stats.batch_size_histogram[size] = self.stats.batch_size_histogram.get(size, 0) + 1
+
+        for entry, result in zip(batch, results):
+            entry[1].set_result(result)
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop accepting work, flush queued requests and join the worker"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        if self._dispatcher is not None:
+            self._dispatcher.shutdown(wait=True)
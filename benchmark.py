@@ -0,0 +1,894 @@
+"""
+Offline benchmark suite.
+
+Runs without network access against a stub ModelWrapper with a fixed
+simulated cost and against small randomly initialised models built from
+local configs, and writes machine-readable JSON:
+
+    python benchmark.py run --output results.json
+    python benchmark.py compare baseline.json results.json --threshold 0.1
+
+compare exits non-zero when a metric regressed by more than the threshold.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import gc
+import importlib.util
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from pipeline import InferencePipeline, ModelWrapper, ProcessedInput
+
+logger = logging.getLogger("benchmark")
+
+SEED = 1234
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def _latency_summary(latencies: Sequence[float], elapsed: float) -> Dict[str, float]:
+    return {
+        "requests": len(latencies),
+        "latency_p50_ms": _percentile(latencies, 0.5) * 1000,
+        "latency_p95_ms": _percentile(latencies, 0.95) * 1000,
+        "latency_p99_ms": _percentile(latencies, 0.99) * 1000,
+        "latency_mean_ms": statistics.fmean(latencies) * 1000,
+        "throughput_per_second": len(latencies) / elapsed if elapsed else 0.0
+    }
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def measure_allocations(fn: Callable[[], Any]) -> Dict[str, int]:
+    """Peak and net Python heap allocations of one call (traced separately from timing)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"alloc_peak_bytes": peak, "alloc_net_bytes": current}
+
+class StubModelWrapper(ModelWrapper):
+    def __init__(self, base_ms: float = 2.0, per_item_ms: float = 0.1, output_values: int = 0):
+        """
+        Model stand-in with a fixed cost per call plus a cost per item.
+
+        The cost is spent sleeping, like a forward pass that releases the
+        GIL, so pipeline overheads are measured against a known model time.
+        output_values adds a list of that many scores to every output.
+        """
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.output_values = output_values
+        self.items = 0
+
+    def infer(self, processed_input: ProcessedInput) -> Any:
+        return self.infer_batch([processed_input])[0]
+
+    def infer_batch(self, processed_inputs: List[ProcessedInput]) -> List[Any]:
+        self.items += len(processed_inputs)
+        time.sleep((self.base_ms + self.per_item_ms * len(processed_inputs)) / 1000)
+        outputs = [{"label": len(item.data) % 2} for item in processed_inputs]
+        if self.output_values:
+            for index, output in enumerate(outputs):
+                output["scores"] = [(index + i) / self.output_values for i in range(self.output_values)]
+        return outputs
+
+    @property
+    def model_identity(self) -> str:
+        return f"stub-{self.base_ms}-{self.per_item_ms}"
+
+def build_tokenizer():
+    """Byte-level tokenizer built in memory, so nothing is downloaded"""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers # type: ignore
+    from transformers import PreTrainedTokenizerFast # type: ignore
+
+    vocab = {char: index for index, char in enumerate(sorted(pre_tokenizers.ByteLevel.alphabet()))}
+    vocab["<|endoftext|>"] = len(vocab)
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        eos_token="<|endoftext|>",
+        pad_token="<|endoftext|>"
+    )
+
+class TinyEncoderWrapper(ModelWrapper):
+    def __init__(self, hidden_size: int = 64, num_layers: int = 2, max_length: int = 128):
+        """Randomly initialised BERT-style encoder with bucketed padding"""
+        import torch # type: ignore
+        from transformers import BertConfig, BertModel # type: ignore
+        from padding import BucketedPadder
+
+        torch.manual_seed(SEED)
+        self.tokenizer = build_tokenizer()
+        config = BertConfig(
+            vocab_size=len(self.tokenizer),
+            hidden_size=hidden_size,
+            num_hidden_layers=num_layers,
+            num_attention_heads=4,
+            intermediate_size=hidden_size * 4,
+            max_position_embeddings=max_length
+        )
+        self.torch = torch
+        self.model = BertModel(config).eval()
+        self.padder = BucketedPadder(self.tokenizer, max_length=max_length, strategy="bucket")
+
+    def infer(self, processed_input: ProcessedInput) -> Any:
+        return self.infer_batch([processed_input])[0]
+
+    def infer_batch(self, processed_inputs: List[ProcessedInput]) -> List[Any]:
+        encoded = self.padder.encode([item.data for item in processed_inputs])
+        results = [None] * len(processed_inputs)
+        for group in self.padder.group(encoded):
+            inputs = self.padder.pad([encoded[index] for index in group])
+            with self.torch.inference_mode():
+                pooled = self.model(
+                    input_ids=inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"]
+                ).pooler_output
+            for row, index in enumerate(group):
+                results[index] = pooled[row].tolist()
+        return results
+
+    @property
+    def model_identity(self) -> str:
+        return "tiny-bert"
+
+def build_tiny_phi(hidden_size: int = 128, num_layers: int = 2):
+    """Randomly initialised Phi model, two layers by default, sized for CPU benchmarking"""
+    import torch # type: ignore
+    from transformers import PhiConfig, PhiForCausalLM # type: ignore
+
+    torch.manual_seed(SEED)
+    tokenizer = build_tokenizer()
+    config = PhiConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        max_position_embeddings=512,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        bos_token_id=tokenizer.eos_token_id
+    )
+    return PhiForCausalLM(config).eval(), tokenizer
+
+def build_draft_phi(target: Any) -> Any:
+    """One-layer early-exit copy of a tiny Phi model, sharing its embeddings and head, as a speculative draft"""
+    import copy
+    from transformers import PhiForCausalLM # type: ignore
+
+    config = copy.deepcopy(target.config)
+    config.num_hidden_layers = 1
+    draft = PhiForCausalLM(config).eval()
+    draft.load_state_dict(target.state_dict(), strict=False)
+    return draft
+
+def load_interface_module():
+    """Import ui/interface.py by path; the top-level ui.py shadows the ui directory"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ui", "interface.py")
+    spec = importlib.util.spec_from_file_location("phi2_interface", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def benchmark_config(batch_size: int, cache: bool) -> Dict[str, Any]:
+    """Repository config with side effects (exporters, tracing, disk cache, autotuning) switched off"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")) as f:
+        config = json.load(f)
+    inference = config.setdefault("inference", {})
+    inference["batch_settings"] = {
+        "enabled": batch_size > 1,
+        "max_batch_size": batch_size,
+        "min_batch_size": 1,
+        "max_wait_ms": 2.0
+    }
+    caching = inference.setdefault("caching", {})
+    caching.update(enabled=cache, persistence={"enabled": False})
+    monitoring = config.setdefault("monitoring", {})
+    monitoring["metrics"] = {"enabled": True, "exporters": []}
+    monitoring["profiling"] = {"enabled": False}
+    # Measure the requested batch size rather than what the autotuner picks
+    config.setdefault("optimization", {})["dynamic_optimization"] = {"enabled": False}
+    return config
+
+def _texts(count: int, seed: int = SEED) -> List[str]:
+    rng = random.Random(seed)
+    words = ["model", "token", "batch", "cache", "latency", "vector", "prompt", "layer", "stream", "queue"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(4, 40))) + f" {i}" for i in range(count)]
+
+def run_pipeline_load(pipeline: InferencePipeline, inputs: Sequence[str], concurrency: int) -> Dict[str, float]:
+    """Send inputs through the pipeline from concurrency client threads"""
+    latencies = [0.0] * len(inputs)
+
+    def _one(index: int):
+        start = time.perf_counter()
+        pipeline.process_input(inputs[index])
+        latencies[index] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        list(clients.map(_one, range(len(inputs))))
+    return _latency_summary(latencies, time.perf_counter() - start)
+
+def bench_pipeline(
+    wrapper_factory: Callable[[], ModelWrapper],
+    batch_sizes: Sequence[int],
+    concurrency_levels: Sequence[int],
+    requests: int
+) -> Dict[str, Dict[str, float]]:
+    results = {}
+    wrapper = wrapper_factory()
+    for batch_size in batch_sizes:
+        for concurrency in concurrency_levels:
+            pipeline = InferencePipeline(wrapper, benchmark_config(batch_size, cache=False), logger=logger)
+            try:
+                # Warm up code paths and allocator before measuring
+                run_pipeline_load(pipeline, _texts(min(requests, 16), seed=0), concurrency)
+                inputs = _texts(requests)
+                summary = run_pipeline_load(pipeline, inputs, concurrency)
+                summary.update(measure_allocations(lambda: run_pipeline_load(pipeline, _texts(16, seed=1), concurrency)))
+                results[f"batch{batch_size}_conc{concurrency}"] = summary
+            finally:
+                pipeline.close()
+    return results
+
+def bench_cache(requests: int) -> Dict[str, Dict[str, float]]:
+    """Latency of requests answered from the result cache versus the model"""
+    pipeline = InferencePipeline(StubModelWrapper(), benchmark_config(1, cache=True), logger=logger)
+    try:
+        inputs = _texts(requests)
+        miss = run_pipeline_load(pipeline, inputs, concurrency=1)
+        hit = run_pipeline_load(pipeline, inputs, concurrency=1)
+        hit.update(measure_allocations(lambda: run_pipeline_load(pipeline, inputs, concurrency=1)))
+        return {"miss": miss, "hit": hit}
+    finally:
+        pipeline.close()
+
+def bench_coalescing(requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """A burst of identical requests with and without in-flight coalescing, result cache off"""
+    results = {}
+    for coalesce in (False, True):
+        wrapper = StubModelWrapper(base_ms=20.0)
+        config = benchmark_config(1, cache=False)
+        config["inference"]["caching"]["coalesce_requests"] = coalesce
+        pipeline = InferencePipeline(wrapper, config, logger=logger)
+        try:
+            summary = run_pipeline_load(pipeline, ["popular input"] * requests, concurrency)
+            summary["model_items"] = wrapper.items
+            results["coalesced" if coalesce else "uncoalesced"] = summary
+        finally:
+            pipeline.close()
+    return results
+
+class _InlineResultWriter:
+    """Persists each result on the request thread, as writing predictions inline did"""
+
+    def __init__(self, path: str, level: int = 6, fsync_interval: float = 5.0):
+        import threading
+        self._file = open(path, "wb")
+        self._lock = threading.Lock()
+        self._level = level
+        self._fsync_interval = fsync_interval
+        self._last_sync = time.monotonic()
+
+    def submit(self, record: Dict[str, Any]):
+        import gzip
+        from outputs import json_default
+        data = gzip.compress((json.dumps(record, default=json_default) + "\n").encode("utf-8"), self._level)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            if time.monotonic() - self._last_sync >= self._fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_sync = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+def bench_result_writer(requests: int, concurrency: int, output_values: int) -> Dict[str, Dict[str, float]]:
+    """Request latency with results not persisted, gzipped and written inline, or handed to the background writer"""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("none", "inline", "background"):
+            config = benchmark_config(1, cache=False)
+            output = config.setdefault("output", {})
+            output["compression"] = {"enabled": True, "algorithm": "gzip", "level": 6}
+            output["writer"] = {**output.get("writer", {}), "enabled": mode == "background", "directory": os.path.join(directory, mode)}
+            pipeline = InferencePipeline(StubModelWrapper(base_ms=1.0, output_values=output_values), config, logger=logger)
+            if mode == "inline":
+                os.makedirs(os.path.join(directory, mode))
+                pipeline.result_writer = _InlineResultWriter(os.path.join(directory, mode, "predictions.jsonl.gz"))
+            try:
+                run_pipeline_load(pipeline, _texts(16, seed=0), concurrency)
+                summary = run_pipeline_load(pipeline, _texts(requests), concurrency)
+                writer_stats = pipeline.writer_stats
+            finally:
+                pipeline.close()
+            if mode == "background":
+                summary["blocked_submits"] = writer_stats["blocked_submits"]
+            results[mode] = summary
+    return results
+
+def bench_vector_index(vectors: int, dim: int, queries: int, k: int = 10) -> Dict[str, Dict[str, float]]:
+    """Insert, search and memory-mapped reload of exact and IVF indexes over clustered vectors"""
+    import numpy as np # type: ignore
+    from vector_index import IndexSettings, create_index, load_index
+
+    rng = np.random.default_rng(SEED)
+    centers = rng.standard_normal((4096, dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), vectors)] + 0.5 * rng.standard_normal((vectors, dim)).astype(np.float32)
+    query = data[rng.integers(0, vectors, queries)] + 0.1 * rng.standard_normal((queries, dim)).astype(np.float32)
+
+    def _search_ms(index, batch: np.ndarray, repeats: int = 5) -> float:
+        index.search(batch, k)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            index.search(batch, k)
+        return (time.perf_counter() - start) / repeats * 1000
+
+    results = {}
+    exact = None
+    with tempfile.TemporaryDirectory() as directory:
+        for name, settings in (
+            ("flat", IndexSettings(type="flat")),
+            ("ivf", IndexSettings(type="ivf", nlist=1024, nprobe=16))
+        ):
+            index = create_index(dim, settings, logger=logger)
+            start = time.perf_counter()
+            index.add(data)
+            add_seconds = time.perf_counter() - start
+            ids = index.search(query, k)[1]
+            if exact is None:
+                exact = ids
+            path = os.path.join(directory, f"{name}.npz")
+            index.save(path)
+            start = time.perf_counter()
+            loaded = load_index(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            results[name] = {
+                "add_seconds": add_seconds,
+                "search_1_ms": _search_ms(index, query[:1]),
+                f"search_{queries}_ms": _search_ms(index, query),
+                "recall_at_10": float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ids, exact)])),
+                "mmap_load_ms": load_ms,
+                "mmap_search_1_ms": _search_ms(loaded, query[:1])
+            }
+            del index, loaded
+    return results
+
+class HashingEncoder:
+    """Bag-of-words encoder summing a fixed random vector per word, standing in for a sentence encoder"""
+
+    def __init__(self, dim: int = 256):
+        import numpy as np # type: ignore
+
+        self.np = np
+        self.dim = dim
+        self._vectors: Dict[str, Any] = {}
+
+    def _vector(self, word: str) -> Any:
+        if word not in self._vectors:
+            rng = self.np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+            self._vectors[word] = rng.standard_normal(self.dim).astype(self.np.float32)
+        return self._vectors[word]
+
+    def embed(self, texts: List[str]) -> Any:
+        embeddings = self.np.zeros((len(texts), self.dim), dtype=self.np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                embeddings[row] += self._vector(word)
+        return embeddings
+
+def bench_semantic_cache(entry_counts: Sequence[int], queries: int, threshold: float = 0.92) -> Dict[str, Dict[str, float]]:
+    """Semantic cache lookup latency and hit rates on paraphrased and unrelated prompts"""
+    from semantic_cache import SemanticCache
+
+    rng = random.Random(SEED)
+    vocabulary = [f"w{index}" for index in range(5000)]
+
+    def _prompt() -> str:
+        return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(12, 40)))
+
+    def _paraphrase(prompt: str) -> str:
+        # Reordered words and one extra word, which an exact key never matches
+        words = prompt.split()
+        index = rng.randrange(len(words) - 1)
+        words[index], words[index + 1] = words[index + 1], words[index]
+        return " ".join(words + ["please"])
+
+    results = {}
+    for entries in entry_counts:
+        cache = SemanticCache(HashingEncoder(), threshold=threshold, max_entries=entries)
+        try:
+            prompts = [_prompt() for _ in range(entries)]
+            start = time.perf_counter()
+            for prompt in prompts:
+                cache.put(prompt, "standard", {"text": prompt})
+            cache.flush()
+            insert_seconds = time.perf_counter() - start
+            paraphrases = [_paraphrase(rng.choice(prompts)) for _ in range(queries)]
+            unrelated = [_prompt() for _ in range(queries)]
+
+            start = time.perf_counter()
+            hits = [cache.lookup([prompt], ["standard"])[0] for prompt in paraphrases]
+            lookup_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            cache.lookup(paraphrases, ["standard"] * queries)
+            batch_seconds = time.perf_counter() - start
+            false_hits = cache.lookup(unrelated, ["standard"] * queries)
+            results[f"entries{entries}"] = {
+                "insert_ms": insert_seconds / entries * 1000,
+                "lookup_1_ms": lookup_seconds / queries * 1000,
+                f"lookup_{queries}_ms": batch_seconds * 1000,
+                "paraphrase_hit_rate": sum(hit is not None for hit in hits) / queries,
+                "unrelated_match_rate": sum(hit is not None for hit in false_hits) / queries
+            }
+        finally:
+            cache.close()
+    return results
+
+def bench_outputs(records: int, seq_length: int, hidden_size: int) -> Dict[str, Dict[str, float]]:
+    """Postprocess and persist hidden-state sized outputs as JSON lists versus NumPy views and .npz"""
+    import tempfile
+    import torch # type: ignore
+    from outputs import json_default, load_arrays, save_arrays, split_arrays
+
+    outputs = [{"last_hidden_state": torch.randn(1, seq_length, hidden_size)} for _ in range(records)]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for tensor_format, save_format in (("list", "json"), ("numpy", "npz")):
+            config = benchmark_config(1, cache=False)
+            config["output"] = {"format": {"tensor_format": tensor_format}, "save_format": save_format}
+            pipeline = InferencePipeline(StubModelWrapper(), config, logger=logger)
+            try:
+                metadata = {"timestamp": time.time()}
+                start = time.perf_counter()
+                processed = [pipeline.postprocess_output(output, metadata).processed_output for output in outputs]
+                postprocess = time.perf_counter() - start
+
+                path = os.path.join(directory, f"outputs.{save_format}")
+                start = time.perf_counter()
+                if save_format == "json":
+                    with open(path, "w") as f:
+                        for output in processed:
+                            f.write(json.dumps(output, default=json_default) + "\n")
+                else:
+                    arrays = {}
+                    for index, output in enumerate(processed):
+                        arrays.update(split_arrays(output, prefix=str(index))[1])
+                    save_arrays(path, arrays)
+                save = time.perf_counter() - start
+
+                start = time.perf_counter()
+                if save_format == "json":
+                    with open(path) as f:
+                        loaded = [json.loads(line) for line in f]
+                else:
+                    loaded = load_arrays(path)
+                load = time.perf_counter() - start
+                del loaded
+                results[f"{tensor_format}_{save_format}"] = {
+                    "postprocess_ms": postprocess * 1000,
+                    "save_ms": save * 1000,
+                    "load_ms": load * 1000,
+                    "file_bytes": os.path.getsize(path),
+                    "alloc_peak_bytes": measure_allocations(
+                        lambda: [pipeline.postprocess_output(output, metadata) for output in outputs]
+                    )["alloc_peak_bytes"]
+                }
+            finally:
+                pipeline.close()
+    return results
+
+def bench_columnar(records: int) -> Dict[str, Dict[str, float]]:
+    """Retained allocations and throughput of per-request versus columnar batch pre- and postprocessing"""
+    pipeline = InferencePipeline(StubModelWrapper(), benchmark_config(batch_size=1, cache=False), logger=logger)
+    inputs = _texts(records)
+    outputs = [{"label": index % 2} for index in range(records)]
+
+    def _single():
+        return [pipeline.postprocess_output(output, pipeline.preprocess_input(text)) for text, output in zip(inputs, outputs)]
+
+    def _batch():
+        return pipeline.postprocess_batch(outputs, pipeline.preprocess_batch(inputs))
+
+    results = {}
+    try:
+        for name, fn in (("single", _single), ("batch", _batch)):
+            fn()
+            gc.collect()
+            blocks = sys.getallocatedblocks()
+            allocations = measure_allocations(lambda: results.setdefault("_held", fn()))
+            held_blocks = sys.getallocatedblocks() - blocks
+            del results["_held"]
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                "blocks_per_request": held_blocks / records,
+                "bytes_per_request": allocations["alloc_net_bytes"] / records,
+                "requests_per_second": records / elapsed if elapsed else 0.0
+            }
+    finally:
+        pipeline.close()
+    return results
+
+def bench_generation(prompts: int, max_new_tokens: int, batch_sizes: Sequence[int]) -> Dict[str, Dict[str, float]]:
+    """Decode throughput of Phi2Interface on a tiny randomly initialised Phi model"""
+    interface_module = load_interface_module()
+    ModelConfig, Phi2Interface = interface_module.ModelConfig, interface_module.Phi2Interface
+
+    model, tokenizer = build_tiny_phi()
+    inputs = _texts(prompts)
+    results = {}
+    for batch_size in batch_sizes:
+        interface = Phi2Interface(
+            device="cpu",
+            use_cache=False,
+            max_batch_size=batch_size,
+            prefix_cache_bytes=None,
+            model=model,
+            tokenizer=tokenizer
+        )
+        try:
+            configs = []
+            for text in inputs:
+                config = ModelConfig(temperature=0.0, max_length=len(tokenizer(text)["input_ids"]) + max_new_tokens)
+                configs.append(config)
+            interface.generate_batch(inputs[:2], configs[:2])
+
+            start = time.perf_counter()
+            responses = interface.generate_batch(inputs, configs)
+            elapsed = time.perf_counter() - start
+            generated = sum(
+                response["token_count"] - len(tokenizer(text)["input_ids"])
+                for response, text in zip(responses, inputs)
+            )
+            results[f"batch{batch_size}"] = {
+                "prompts": prompts,
+                "generated_tokens": generated,
+                "elapsed_seconds": elapsed,
+                "tokens_per_second": generated / elapsed if elapsed else 0.0
+            }
+        finally:
+            interface.close()
+    return results
+
+def bench_speculative(prompts: int, max_new_tokens: int, draft_lengths: Sequence[int]) -> Dict[str, Dict[str, float]]:
+    """Greedy Phi2Interface decode with and without speculative decoding on tiny Phi models"""
+    from speculative import SpeculativeSettings
+
+    interface_module = load_interface_module()
+    ModelConfig, ModelMode, Phi2Interface = interface_module.ModelConfig, interface_module.ModelMode, interface_module.Phi2Interface
+
+    import torch # type: ignore
+
+    # Deep enough that a target pass costs more than the per-call overhead
+    model, tokenizer = build_tiny_phi(hidden_size=512, num_layers=8)
+    # A random early-exit draft agrees with the target little better than
+    # chance; shrinking the later layers' residuals stands in for a trained
+    # draft that predicts most of the target's tokens
+    with torch.no_grad():
+        for layer in model.model.layers[1:]:
+            for linear in (layer.self_attn.dense, layer.mlp.fc2):
+                linear.weight.mul_(0.03)
+                linear.bias.mul_(0.03)
+    draft = build_draft_phi(model)
+    inputs = _texts(prompts)
+    config = ModelConfig(temperature=0.0, max_length=512)
+    config.max_new_tokens = max_new_tokens
+    results = {}
+    reference = None
+    for num_draft_tokens in [0] + list(draft_lengths):
+        interface = Phi2Interface(
+            device="cpu",
+            use_cache=False,
+            prefix_cache_bytes=None,
+            model=model,
+            tokenizer=tokenizer,
+            # 0 draft tokens decodes one target pass per token through the same loop
+            speculative=SpeculativeSettings(enabled=True, num_draft_tokens={"coding": num_draft_tokens}),
+            draft_model=draft
+        )
+        try:
+            if num_draft_tokens:
+                interface.generate_response(inputs[0], config, ModelMode.CODING)
+            start = time.perf_counter()
+            responses = [interface.generate_response(text, config, ModelMode.CODING) for text in inputs]
+            elapsed = time.perf_counter() - start
+            texts = [response["text"] for response in responses]
+            if reference is None:
+                reference = texts
+            elif texts != reference:
+                logger.warning(f"Speculative output with {num_draft_tokens} draft tokens differs from plain greedy decoding")
+            generated = sum(response["token_count"] for response in responses) - sum(
+                len(tokenizer(interface._format_prompt_for_mode(text, ModelMode.CODING))["input_ids"]) for text in inputs
+            )
+            summary = {
+                "generated_tokens": generated,
+                "elapsed_seconds": elapsed,
+                "tokens_per_second": generated / elapsed if elapsed else 0.0
+            }
+            if num_draft_tokens:
+                stats = interface.speculative_decoder.snapshot()["coding"]
+                summary.update(
+                    acceptance_rate=stats["acceptance_rate"],
+                    tokens_per_target_pass=stats["tokens_per_target_pass"],
+                    speedup=summary["tokens_per_second"] / results["plain"]["tokens_per_second"]
+                )
+            results[f"draft{num_draft_tokens}" if num_draft_tokens else "plain"] = summary
+        finally:
+            interface.close()
+    return results
+
+def bench_backends(batch_size: int, iterations: int) -> Dict[str, Dict[str, Any]]:
+    """Forward latency of each execution backend on the tiny encoder, checked against eager"""
+    from backends import BACKENDS, BackendSettings, compare_backends
+
+    wrapper = TinyEncoderWrapper()
+    inputs = {
+        name: tensor.clone()
+        for name, tensor in wrapper.padder.pad(wrapper.padder.encode(_texts(batch_size))).items()
+    }
+    # Fresh artifact directory so preparation time includes compiling
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        report = compare_backends(
+            wrapper.model,
+            wrapper.model_identity,
+            inputs,
+            list(BACKENDS),
+            settings=BackendSettings(artifact_dir=artifact_dir),
+            iterations=iterations,
+            logger=logger
+        )
+    results = {}
+    for name, entry in report.items():
+        if "error" in entry:
+            logger.warning(f"Skipping {name} backend: {entry['error']}")
+            continue
+        results[name] = {
+            "prepare_seconds": entry["prepare_seconds"],
+            "latency_p50_ms": entry["latency_p50_ms"],
+            "latency_p95_ms": entry["latency_p95_ms"],
+            "outputs_match": entry["equivalence"]["match"]
+        }
+    return results
+
+def bench_quantization(batch_size: int, iterations: int) -> Dict[str, Dict[str, Any]]:
+    """Latency, weight memory and output agreement of each quantization mode against float"""
+    from quantization import QuantizationSettings, compare_quantization
+
+    encoder = TinyEncoderWrapper(hidden_size=128)
+    phi, phi_tokenizer = build_tiny_phi()
+    texts = _texts(batch_size * 2)
+    groups = {
+        "tiny_encoder": (
+            lambda: TinyEncoderWrapper(hidden_size=128).model,
+            [
+                {name: encoder.padder.pad(encoder.padder.encode(texts[start:start + batch_size]))[name].clone()
+                 for name in ("input_ids", "attention_mask")}
+                for start in range(0, len(texts), batch_size)
+            ],
+            [QuantizationSettings(method="dynamic"), QuantizationSettings(method="static"),
+             QuantizationSettings(method="weight_only", bits=8), QuantizationSettings(method="weight_only", bits=4, group_size=32)]
+        ),
+        "tiny_phi": (
+            lambda: build_tiny_phi()[0],
+            [dict(phi_tokenizer(texts[start:start + batch_size], padding=True, return_tensors="pt"))
+             for start in range(0, len(texts), batch_size)],
+            [QuantizationSettings(method="dynamic"), QuantizationSettings(method="weight_only", bits=8),
+             QuantizationSettings(method="weight_only", bits=4, group_size=32)]
+        )
+    }
+    del phi
+    results = {}
+    for name, (load_float, inputs, modes) in groups.items():
+        report = compare_quantization(load_float, modes, inputs, iterations=iterations, logger=logger)
+        for mode, entry in report.items():
+            if "error" in entry:
+                logger.warning(f"Skipping {name} {mode}: {entry['error']}")
+                continue
+            summary = {key: entry[key] for key in ("latency_p50_ms", "latency_p95_ms", "weight_bytes")}
+            for output, agreement in entry.get("agreement", {}).items():
+                # Lower is better, like every metric compare() doesn't mark otherwise
+                summary[f"{output}_cosine_distance"] = 1.0 - agreement["cosine_similarity"]
+                if "top1_agreement" in agreement:
+                    summary[f"{output}_top1_disagreement"] = 1.0 - agreement["top1_agreement"]
+            results[f"{name}_{mode}"] = summary
+    return results
+
+_COLD_START_TARGETS = {
+    # torch and transformers are imported lazily, so this excludes them
+    "pipeline_import": "import pipeline",
+    "stub_pipeline": "from benchmark import StubModelWrapper, benchmark_config; from pipeline import InferencePipeline\n"
+                     "InferencePipeline(StubModelWrapper(), benchmark_config(1, cache=False)).close()",
+    "tiny_encoder_pipeline": "from benchmark import TinyEncoderWrapper, benchmark_config; from pipeline import InferencePipeline\n"
+                             "InferencePipeline(TinyEncoderWrapper(), benchmark_config(1, cache=False)).close()",
+    "tiny_phi_interface": "from benchmark import build_tiny_phi, load_interface_module\n"
+                          "model, tokenizer = build_tiny_phi()\n"
+                          "load_interface_module().Phi2Interface(device='cpu', model=model, tokenizer=tokenizer).close()"
+}
+
+def bench_cold_start(repeats: int) -> Dict[str, Dict[str, float]]:
+    """Wall time from a fresh interpreter to a ready pipeline, imports included"""
+    results = {}
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))}
+    for name, code in _COLD_START_TARGETS.items():
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=root, env=env, check=True, capture_output=True)
+            timings.append(time.perf_counter() - start)
+        results[name] = {"cold_start_seconds": statistics.median(timings)}
+    return results
+
+def environment() -> Dict[str, Any]:
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": SEED,
+        "timestamp": time.time()
+    }
+    try:
+        import torch # type: ignore
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    try:
+        info["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+def run_suite(quick: bool = False, suites: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Run the selected benchmark groups and return the results document"""
+    random.seed(SEED)
+    requests = 64 if quick else 512
+    batch_sizes = [1, 8] if quick else [1, 8, 32]
+    concurrency_levels = [1, 8] if quick else [1, 4, 16]
+    selected = set(suites or ["pipeline_stub", "pipeline_tiny_encoder", "cache", "generation", "backends", "quantization", "speculative", "coalescing", "outputs", "result_writer", "vector_index", "semantic_cache", "columnar", "cold_start"])
+
+    groups = {
+        "pipeline_stub": lambda: bench_pipeline(StubModelWrapper, batch_sizes, concurrency_levels, requests),
+        "pipeline_tiny_encoder": lambda: bench_pipeline(TinyEncoderWrapper, batch_sizes, concurrency_levels, requests // 2),
+        "cache": lambda: bench_cache(requests),
+        "generation": lambda: bench_generation(8 if quick else 32, 16 if quick else 64, [1, 8]),
+        "backends": lambda: bench_backends(8, 20 if quick else 100),
+        "quantization": lambda: bench_quantization(8, 5 if quick else 20),
+        "outputs": lambda: bench_outputs(16 if quick else 64, 128, 768),
+        "columnar": lambda: bench_columnar(5000 if quick else 50000),
+        "vector_index": lambda: bench_vector_index(200_000 if quick else 1_000_000, 128, 64),
+        "semantic_cache": lambda: bench_semantic_cache([1000, 10000] if quick else [1000, 10000, 100000], 64),
+        "result_writer": lambda: bench_result_writer(requests * 2, 8, 2048),
+        "coalescing": lambda: bench_coalescing(64 if quick else 256, 16),
+        "speculative": lambda: bench_speculative(4 if quick else 16, 32 if quick else 64, [2, 4, 6]),
+        "cold_start": lambda: bench_cold_start(1 if quick else 3)
+    }
+
+    # Peak RSS only grows, so the value after each group bounds what it needed
+    results: Dict[str, Any] = {"memory": {}}
+    for name, bench in groups.items():
+        if name in selected:
+            results[name] = bench()
+            results["memory"][name] = {"peak_rss_bytes": peak_rss_bytes()}
+    return {"environment": environment(), "results": results}
+
+def _higher_is_better(metric: str) -> bool:
+    return metric.endswith(("_per_second", "speedup", "acceptance_rate", "tokens_per_target_pass", "recall_at_10", "hit_rate"))
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+_COUNT_METRICS = ("requests", "prompts", "generated_tokens")
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1) -> List[Dict[str, Any]]:
+    """
+    Compare two result documents metric by metric.
+
+    Returns:
+        One entry per shared metric with the relative change and whether it
+        is a regression (worse by more than threshold)
+    """
+    base, new = _flatten(baseline["results"]), _flatten(current["results"])
+    report = []
+    for name in sorted(base.keys() & new.keys()):
+        metric = name.rsplit(".", 1)[-1]
+        if metric in _COUNT_METRICS or base[name] == 0:
+            continue
+        change = (new[name] - base[name]) / abs(base[name])
+        worse = -change if _higher_is_better(metric) else change
+        report.append({
+            "metric": name,
+            "baseline": base[name],
+            "current": new[name],
+            "change": change,
+            "regression": worse > threshold
+        })
+    return report
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark suite")
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.add_argument("--quick", action="store_true", help="Fewer requests and configurations")
+    run_parser.add_argument("--suite", action="append", help="Only run the named group (repeatable)")
+    run_parser.add_argument("--baseline", help="Compare against this baseline after running")
+    run_parser.add_argument("--threshold", type=float, default=0.1)
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == "run":
+        document = run_suite(quick=args.quick, suites=args.suite)
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Wrote {args.output}")
+        if not args.baseline:
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        current = document
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+
+    report = compare(baseline, current, args.threshold)
+    regressions = [entry for entry in report if entry["regression"]]
+    for entry in report:
+        flag = "REGRESSION" if entry["regression"] else "ok"
+        print(f"{flag:>10}  {entry['metric']}: {entry['baseline']:.4g} -> {entry['current']:.4g} ({entry['change']:+.1%})")
+    print(f"{len(regressions)} regression(s) over {args.threshold:.0%} in {len(report)} metrics")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass
+from pathlib import Path
+import csv
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from outputs import ArrayShards, convert_tensors, json_default, load_arrays, split_arrays
+
+@dataclass
+class BulkSettings:
+    """Bulk job settings from the inference.bulk, output.compression and output.save_format config"""
+    batch_size: int = 32
+    window_size: int = 4096
+    checkpoint_interval: int = 10000
+    queue_depth: int = 4
+    text_field: str = "text"
+    compress: bool = False
+    compression_level: int = 6
+    save_format: str = "json"
+    array_shard_bytes: int = 256 * 1024 * 1024
+
+    @classmethod
+    def from_config(
+        cls,
+        bulk: Dict[str, Any],
+        compression: Dict[str, Any],
+        batch_size: int = 32,
+        save_format: str = "json"
+    ) -> "BulkSettings":
+        algorithm = compression.get("algorithm", "gzip")
+        if compression.get("enabled", False) and algorithm != "gzip":
+            raise ValueError(f"Unsupported output compression: {algorithm}")
+        return cls(
+            batch_size=int(bulk.get("batch_size", batch_size)),
+            window_size=int(bulk.get("window_size", 4096)),
+            checkpoint_interval=int(bulk.get("checkpoint_interval", 10000)),
+            queue_depth=int(bulk.get("queue_depth", 4)),
+            text_field=bulk.get("text_field", "text"),
+            compress=compression.get("enabled", False),
+            compression_level=int(compression.get("level", 6)),
+            save_format=save_format,
+            array_shard_bytes=int(bulk.get("array_shard_mb", 256)) * 1024 * 1024
+        )
+
+def iter_records(path: str, text_field: str = "text") -> Iterator[Dict[str, Any]]:
+    """Lazily read records from a JSONL or CSV file (optionally gzipped)"""
+    with open(path, "rb") as f:
+        # Compressed bulk outputs keep their .jsonl name, so sniff the gzip magic
+        opener = gzip.open if f.read(2) == b"\x1f\x8b" else open
+    suffix = Path(str(path)[:-3] if str(path).endswith(".gz") else path).suffix.lower()
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        if suffix == ".csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    yield record if isinstance(record, dict) else {text_field: record}
+
+_DONE = object()
+
+class _Checkpointed:
+    """Output file that can be cut back to the last checkpoint on resume"""
+
+    def __init__(self, path: Path, compress: bool, level: int, offset: int):
+        self.compress = compress
+        self.level = level
+        mode = "r+b" if path.exists() else "wb"
+        self.raw = open(path, mode)
+        self.raw.truncate(offset)
+        self.raw.seek(offset)
+        self.stream = self._open_member()
+
+    def _open_member(self):
+        # Each checkpoint closes a complete gzip member; concatenated
+        # members form a valid gzip file that can be truncated between them
+        if self.compress:
+            return gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=self.level)
+        return self.raw
+
+    def write(self, data: bytes):
+        self.stream.write(data)
+
+    def checkpoint(self) -> int:
+        """Make everything written so far durable and return the file offset"""
+        if self.compress:
+            self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        offset = self.raw.tell()
+        self.stream = self._open_member()
+        return offset
+
+    def close(self) -> int:
+        offset = self.checkpoint()
+        if self.compress:
+            self.stream.close()
+            # Drop the empty member opened by the final checkpoint
+            self.raw.truncate(offset)
+        self.raw.close()
+        return offset
+
+def iter_outputs(output_path: str, mmap: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Read a bulk output file back, resolving array references.
+
+    With a binary save_format each line's arrays live in the shard named
+    by its "arrays" field; they are returned as views of the
+    memory-mapped shard, so large outputs can be scanned without loading
+    them into memory.
+    """
+    directory = Path(str(output_path) + ".arrays")
+    shard_name, shard = None, {}
+
+    def _resolve(value: Any) -> Any:
+        if isinstance(value, dict):
+            if set(value) == {"__array__"}:
+                return shard[value["__array__"]]
+            return {key: _resolve(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [_resolve(item) for item in value]
+        return value
+
+    for line in iter_records(output_path):
+        if "arrays" in line:
+            if line["arrays"] != shard_name:
+                shard_name = line["arrays"]
+                shard = load_arrays(str(directory / shard_name), mmap=mmap)
+            line["output"] = _resolve(line["output"])
+        yield line
+
+class BulkRunner:
+    def __init__(self, pipeline: Any, settings: BulkSettings, logger: Optional[logging.Logger] = None):
+        """
+        Streaming offline inference over JSONL or CSV files.
+
+        Records are read lazily in windows of window_size, sorted by length
+        within the window and cut into batches of similar length. Three
+        threads overlap reading/preprocessing, batched inference and
+        postprocessing/writing, connected by bounded queues, so memory stays
+        flat regardless of input size. Results are written in input order;
+        progress is checkpointed so a killed job resumes where it stopped.
+        A record without text gets an {"index", "error"} line in place of its
+        output.
+
+        With a binary save_format (npz or arrow) the arrays in each result
+        stay binary: they are written to shard files in an "<output>.arrays"
+        directory and the JSONL line refers to them (see iter_outputs).
+
+        Args:
+            pipeline: InferencePipeline providing the pre/postprocessing stages
+            settings: Bulk job settings
+            logger: Optional logger instance
+        """
+        self.pipeline = pipeline
+        self.settings = settings
+        self.logger = logger or logging.getLogger(__name__)
+        self._stop = threading.Event()
+
+    def _put(self, q: queue.Queue, item: Any):
+        """Blocking put that gives up once the job is stopping"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue) -> Any:
+        """Blocking get that returns the end marker once the job is stopping"""
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _DONE
+
+    def run(self, input_path: str, output_path: str, resume: bool = True) -> Dict[str, Any]:
+        """
+        Process input_path into output_path.
+
+        Returns:
+            Summary with record counts and elapsed time
+        """
+        output = Path(output_path)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint_path = output.with_name(output.name + ".ckpt")
+
+        state = {"records": 0, "offset": 0}
+        if resume and checkpoint_path.exists() and output.exists():
+            state = json.loads(checkpoint_path.read_text())
+            self.logger.info(f"Resuming bulk job after {state['records']} records")
+
+        start_time = time.time()
+        batches = queue.Queue(maxsize=self.settings.queue_depth)
+        results = queue.Queue(maxsize=self.settings.queue_depth)
+        errors = []
+        self._stop.clear()
+
+        def _guard(target, *args):
+            def _run():
+                try:
+                    target(*args)
+                except BaseException as e:
+                    errors.append(e)
+                    self._stop.set()
+            return threading.Thread(target=_run, daemon=True)
+
+        reader = _guard(self._read_stage, input_path, state["records"], batches)
+        inferer = _guard(self._infer_stage, batches, results)
+        reader.start()
+        inferer.start()
+
+        try:
+            written, invalid = self._write_stage(results, output, checkpoint_path, state, errors)
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            reader.join()
+            inferer.join()
+        if errors:
+            raise errors[0]
+
+        checkpoint_path.unlink(missing_ok=True)
+        summary = {
+            "records": written,
+            "resumed_from": state["records"],
+            "invalid_records": invalid,
+            "elapsed_seconds": time.time() - start_time
+        }
+        self.logger.info(f"Bulk job finished: {summary}")
+        return summary
+
+    def _read_stage(self, input_path: str, skip: int, batches: queue.Queue):
+        """Read windows, preprocess, sort by length and emit batches"""
+        window: List[Tuple[int, Any]] = []
+        for index, record in enumerate(iter_records(input_path, self.settings.text_field)):
+            if index < skip:
+                continue
+            window.append((index, record))
+            if len(window) >= self.settings.window_size:
+                self._emit_window(window, batches)
+                window = []
+            if self._stop.is_set():
+                return
+        if window:
+            self._emit_window(window, batches)
+        self._put(batches, _DONE)
+
+    def _emit_window(self, window: List[Tuple[int, Any]], batches: queue.Queue):
+        # Records without text get an error line instead of failing the job,
+        # so the output stays aligned with the input
+        field = self.settings.text_field
+        valid = [item for item in window if item[1].get(field)]
+        if len(valid) < len(window):
+            self._put(batches, ([item for item in window if not item[1].get(field)], None))
+        if not valid:
+            return
+        inputs = self.pipeline.preprocess_batch([record[field] for _, record in valid])
+        order = inputs.length_order()
+        size = self.settings.batch_size
+        for start in range(0, len(order), size):
+            rows = order[start:start + size]
+            self._put(batches, ([valid[row] for row in rows.tolist()], inputs.take(rows)))
+
+    def _infer_stage(self, batches: queue.Queue, results: queue.Queue):
+        """Run one batched forward pass per batch"""
+        while True:
+            batch = self._get(batches)
+            if batch is _DONE:
+                break
+            records, inputs = batch
+            model_outputs = self.pipeline.model_wrapper.infer_batch(inputs) if inputs is not None else None
+            self._put(results, (records, inputs, model_outputs))
+        self._put(results, _DONE)
+
+    def _write_stage(
+        self,
+        results: queue.Queue,
+        output: Path,
+        checkpoint_path: Path,
+        state: Dict[str, int],
+        errors: List[BaseException]
+    ) -> Tuple[int, int]:
+        """
+        Postprocess results and write them back in input order.
+
+        Returns:
+            Records written in total and records of this run without text
+        """
+        writer = _Checkpointed(output, self.settings.compress, self.settings.compression_level, state["offset"])
+        shards = None
+        if self.settings.save_format != "json":
+            shards = ArrayShards(
+                Path(str(output) + ".arrays"), self.settings.save_format, self.settings.array_shard_bytes
+            )
+            shards.discard_from(state["records"])
+        next_index = state["records"]
+        pending: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        since_checkpoint = 0
+        invalid = 0
+        try:
+            while True:
+                batch = self._get(results)
+                if batch is _DONE:
+                    break
+                records, inputs, model_outputs = batch
+                if inputs is None:
+                    for index, record in records:
+                        line = {"index": index, "error": f"Empty {self.settings.text_field} field"}
+                        if "id" in record:
+                            line["id"] = record["id"]
+                        pending[index] = (line, {})
+                    invalid += len(records)
+                else:
+                    final_outputs = self.pipeline.postprocess_batch(model_outputs, inputs)
+                    for (index, record), output_value in zip(records, final_outputs.processed_outputs):
+                        arrays = {}
+                        if shards is not None:
+                            output_value, arrays = split_arrays(
+                                convert_tensors(output_value, "numpy"), prefix=str(index)
+                            )
+                        line = {"index": index, "output": output_value}
+                        if "id" in record:
+                            line["id"] = record["id"]
+                        pending[index] = (line, arrays)
+
+                # Flush the contiguous run of results that is now complete
+                while next_index in pending:
+                    line, arrays = pending.pop(next_index)
+                    if arrays:
+                        line["arrays"] = shards.add(next_index, arrays)
+                    writer.write((json.dumps(line, default=json_default) + "\n").encode("utf-8"))
+                    next_index += 1
+                    since_checkpoint += 1
+                    if since_checkpoint >= self.settings.checkpoint_interval:
+                        if shards is not None:
+                            shards.flush()
+                        self._save_checkpoint(checkpoint_path, next_index, writer.checkpoint())
+                        since_checkpoint = 0
+        finally:
+            if shards is not None:
+                shards.flush()
+            offset = writer.close()
+            self._save_checkpoint(checkpoint_path, next_index, offset)
+
+        if pending and not errors:
+            raise RuntimeError(f"{len(pending)} results could not be written in order")
+        if invalid:
+            self.logger.warning(f"Skipped {invalid} records without {self.settings.text_field}")
+        return next_index, invalid
+
+    @staticmethod
+    def _save_checkpoint(path: Path, records: int, offset: int):
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"records": records, "offset": offset}))
+        os.replace(tmp, path)
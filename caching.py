@@ -0,0 +1,349 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from dataclasses import dataclass
+from collections import OrderedDict
+from concurrent.futures import Future
+import asyncio
+import hashlib
+import json
+import sys
+import threading
+import time
+
+@dataclass
+class CacheSettings:
+    """Cache settings derived from the inference.caching config section"""
+    enabled: bool = False
+    max_entries: int = 1000
+    max_bytes: Optional[int] = None
+    ttl_seconds: Optional[float] = None
+    coalesce_requests: bool = True
+
+    @classmethod
+    def from_config(cls, caching: Dict[str, Any]) -> "CacheSettings":
+        cache_type = caching.get("cache_type", "lru")
+        if cache_type != "lru":
+            raise ValueError(f"Unsupported cache_type: {cache_type}")
+        return cls(
+            enabled=caching.get("enabled", False),
+            max_entries=int(caching.get("cache_size", 1000)),
+            max_bytes=caching.get("max_bytes"),
+            ttl_seconds=caching.get("ttl_seconds"),
+            coalesce_requests=caching.get("coalesce_requests", True)
+        )
+
+@dataclass
+class CacheStats:
+    """Hit, miss and eviction counters"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.__dict__, "hit_rate": self.hit_rate}
+
+_MISSING = object()
+
+class LRUCache:
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        size_fn: Optional[Callable[[Any], int]] = None
+    ):
+        """
+        Thread-safe LRU cache with optional TTL and byte budget.
+
+        Lookups, inserts and evictions are O(1): entries live in an
+        OrderedDict that is reordered on access and trimmed from the least
+        recently used end whenever either limit is exceeded.
+
+        Args:
+            max_entries: Maximum number of entries
+            max_bytes: Optional limit on the estimated size of stored values
+            ttl_seconds: Optional time-to-live per entry
+            size_fn: Function estimating the size of a value in bytes
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size_fn = size_fn or estimate_size
+        self.stats = CacheStats()
+
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value and mark it most recently used"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.stats.misses += 1
+                return default
+
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """
+        Insert or replace a value, evicting LRU entries over the limits.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl_seconds: Time-to-live for this entry, overriding the cache default
+        """
+        size = self.size_fn(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Larger than the whole budget; caching it would flush everything
+            return
+        ttl_seconds = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds else None
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self.stats.bytes += size
+            self.stats.entries = len(self._data)
+
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self.stats.bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._data)))
+                self.stats.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self.stats.bytes -= size
+        self.stats.entries = len(self._data)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.stats.entries = 0
+            self.stats.bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and (
+                entry[2] is None or entry[2] > time.monotonic()
+            )
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self.stats.snapshot()
+
+@dataclass
+class CoalescingStats:
+    """Requests that ran versus requests that waited on an identical one"""
+    leaders: int = 0
+    coalesced: int = 0
+    in_flight: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+class _Flight:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self):
+        self.future: Future = Future()
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self, counter: Optional[Any] = None):
+        """
+        Coalesces concurrent calls with the same key into one computation.
+
+        The first caller for a key (the leader) runs the computation; callers
+        arriving while it is in flight wait for its result instead of
+        starting their own, and all of them see its exception if it fails.
+        The key is released as soon as the result is set, so results are
+        only shared between overlapping calls; keeping them around is the
+        cache's job. Sync and async callers share the same in-flight map.
+
+        Args:
+            counter: Optional metrics counter incremented per coalesced call
+        """
+        self.stats = CoalescingStats()
+        self._counter = counter
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Attach to the call in flight for key, or start one.
+
+        Returns:
+            The shared future and whether this caller is the leader, which
+            must resolve it through complete()
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats.leaders += 1
+                self.stats.in_flight = len(self._flights)
+            else:
+                flight.waiters += 1
+                self.stats.coalesced += 1
+        if not leader and self._counter is not None:
+            self._counter.inc()
+        return flight.future, leader
+
+    def complete(self, key: Hashable, result: Any = None, exception: Optional[BaseException] = None):
+        """Release key and hand the leader's result (or exception) to every waiter"""
+        with self._lock:
+            flight = self._flights.pop(key, None)
+            self.stats.in_flight = len(self._flights)
+        if flight is None:
+            return
+        if exception is not None:
+            flight.future.set_exception(exception)
+        else:
+            flight.future.set_result(result)
+
+    def _cancel(self, key: Hashable):
+        with self._lock:
+            flight = self._flights.pop(key, None)
+            self.stats.in_flight = len(self._flights)
+        if flight is not None:
+            flight.future.cancel()
+
+    def _leave(self, key: Hashable, future: Future):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.future is future:
+                flight.waiters -= 1
+
+    def _waiters(self, key: Hashable) -> int:
+        with self._lock:
+            flight = self._flights.get(key)
+            return flight.waiters if flight is not None else 0
+
+    def run(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Return fn(), or the result of the identical call already in flight"""
+        future, leader = self.join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.complete(key, exception=e)
+            raise
+        self.complete(key, result)
+        return result
+
+    async def run_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async version of run; fn returns the coroutine to await.
+
+        Cancelling a waiting caller only detaches it. Cancelling the leader
+        cancels the computation if nobody else is waiting for it; otherwise
+        it keeps running for the remaining waiters.
+        """
+        future, leader = self.join(key)
+        if not leader:
+            try:
+                # Shielded so a cancelled waiter doesn't cancel the shared future
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                self._leave(key, future)
+                raise
+
+        task = asyncio.ensure_future(fn())
+
+        def _done(task: "asyncio.Future"):
+            if task.cancelled():
+                self._cancel(key)
+            elif task.exception() is not None:
+                self.complete(key, exception=task.exception())
+            else:
+                self.complete(key, task.result())
+        task.add_done_callback(_done)
+
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters(key) == 0:
+                task.cancel()
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return self.stats.snapshot()
+
+def make_cache_key(processed_input: Any, model_identity: str, **params: Any) -> str:
+    """
+    Hash normalized input, model identity and any generation parameters.
+
+    Callers pass the already preprocessed input, so inputs that normalize
+    to the same text share a key.
+    """
+    payload = json.dumps(
+        [model_identity, processed_input, params],
+        sort_keys=True,
+        default=repr,
+        ensure_ascii=False
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+def estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    """Approximate the memory held by a value, including containers and arrays"""
+    _seen = _seen if _seen is not None else set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    # Tensors and arrays report their buffer sizes directly
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes) + sys.getsizeof(value)
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return value.element_size() * value.nelement() + sys.getsizeof(value)
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(
+            estimate_size(k, _seen) + estimate_size(v, _seen)
+            for k, v in value.items()
+        )
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += estimate_size(vars(value), _seen)
+    elif hasattr(type(value), "__slots__"):
+        size += sum(
+            estimate_size(getattr(value, name), _seen)
+            for name in type(value).__slots__
+            if hasattr(value, name)
+        )
+    return size
@@ -0,0 +1,308 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+import time
+
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+# Steps reported in every preprocessed input's metadata
+PREPROCESSING_STEPS = ("strip", "lowercase")
+
+def input_text(input_data: Union[str, Dict[str, Any]]) -> str:
+    """Text of a raw input: a dictionary's "text" field, anything else as a string"""
+    if isinstance(input_data, dict):
+        return input_data.get("text", "")
+    return str(input_data)
+
+def _input_metadata(item: Any) -> Dict[str, Any]:
+    return {
+        "original_length": item.original_length,
+        "processed_length": len(item.data),
+        "preprocessing_steps": list(PREPROCESSING_STEPS),
+        "timestamp": item.timestamp
+    }
+
+# Metadata keys held in ProcessedInput's own slots
+_SLOTTED_METADATA = ("timestamp", "original_length")
+
+class ProcessedInput:
+    """
+    One preprocessed input.
+
+    The metadata dictionary is built from the slots when it is read rather
+    than for every request. Keys passed in metadata that the slots do not
+    reproduce are kept and merged back in when it is read.
+    """
+    __slots__ = ("data", "timestamp", "original_length", "_extra")
+
+    def __init__(
+        self,
+        data: Any,
+        metadata: Optional[Dict[str, Any]] = None,
+        timestamp: Optional[float] = None,
+        original_length: Optional[int] = None
+    ):
+        metadata = metadata or {}
+        self.data = data
+        self.timestamp = timestamp if timestamp is not None else metadata.get("timestamp", time.time())
+        self.original_length = original_length if original_length is not None else metadata.get("original_length")
+        self._extra = None
+        if metadata:
+            derived = _input_metadata(self)
+            extra = {
+                key: value for key, value in metadata.items()
+                if key not in _SLOTTED_METADATA and (key not in derived or derived[key] != value)
+            }
+            self._extra = extra or None
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        metadata = _input_metadata(self)
+        if self._extra:
+            metadata.update(self._extra)
+        return metadata
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, ProcessedInput):
+            return NotImplemented
+        return (self.data, self.metadata, self.timestamp) == (other.data, other.metadata, other.timestamp)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"data": self.data, "metadata": self.metadata, "timestamp": self.timestamp}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        # Also restores objects pickled before ProcessedInput had slots
+        self.__init__(state["data"], state["metadata"], state["timestamp"])
+
+    def __repr__(self) -> str:
+        return f"ProcessedInput(data={self.data!r}, timestamp={self.timestamp!r}, original_length={self.original_length!r})"
+
+class InputRow:
+    """View of one row of an InputBatch with the attributes of a ProcessedInput"""
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch: "InputBatch", index: int):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def data(self) -> str:
+        return self.batch.texts[self.index]
+
+    @property
+    def timestamp(self) -> float:
+        return float(self.batch.timestamps[self.index])
+
+    @property
+    def original_length(self) -> int:
+        return int(self.batch.original_lengths[self.index])
+
+    metadata = property(_input_metadata)
+
+    def __reduce__(self):
+        # Pickle the row on its own, not the batch behind it
+        return ProcessedInput, (self.data, None, self.timestamp, self.original_length)
+
+class InputBatch:
+    """
+    Preprocessed inputs stored column by column.
+
+    texts holds the normalized strings and original_lengths, lengths and
+    timestamps are NumPy arrays, so a batch costs a few objects whatever
+    its size. Indexing or iterating yields InputRow views, so a batch can
+    be passed wherever a list of ProcessedInput is expected, such as
+    ModelWrapper.infer_batch.
+
+    The arrays only pay off across many rows: a one-row batch retains
+    about 14 heap blocks against about 5 for a ProcessedInput and its
+    ModelOutput, so single requests stay on those records.
+    """
+    __slots__ = ("texts", "original_lengths", "lengths", "timestamps")
+
+    def __init__(
+        self,
+        texts: List[str],
+        original_lengths: "np.ndarray",
+        lengths: "np.ndarray",
+        timestamps: "np.ndarray"
+    ):
+        self.texts = texts
+        self.original_lengths = original_lengths
+        self.lengths = lengths
+        self.timestamps = timestamps
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index: int) -> InputRow:
+        if index < 0:
+            index += len(self.texts)
+        if not 0 <= index < len(self.texts):
+            raise IndexError("InputBatch index out of range")
+        return InputRow(self, index)
+
+    def __iter__(self) -> Iterator[InputRow]:
+        return (InputRow(self, index) for index in range(len(self.texts)))
+
+    def take(self, indices: Sequence[int]) -> "InputBatch":
+        """New batch holding the given rows, in that order"""
+        indices = np.asarray(indices, dtype=np.intp)
+        texts = self.texts
+        return InputBatch(
+            [texts[index] for index in indices.tolist()],
+            self.original_lengths[indices],
+            self.lengths[indices],
+            self.timestamps[indices]
+        )
+
+    def length_order(self) -> "np.ndarray":
+        """Row order by processed length, ties kept in input order"""
+        return np.argsort(self.lengths, kind="stable")
+
+class ModelOutput:
+    """
+    Result of one request.
+
+    Like ProcessedInput, the metadata dictionary is only built when read.
+    """
+    __slots__ = ("raw_output", "processed_output", "inference_time", "_metadata", "_input", "_output_format")
+
+    def __init__(
+        self,
+        raw_output: Any,
+        processed_output: Any,
+        inference_time: float,
+        metadata: Optional[Dict[str, Any]] = None,
+        processed_input: Optional[Any] = None,
+        output_format: Any = None
+    ):
+        self.raw_output = raw_output
+        self.processed_output = processed_output
+        self.inference_time = inference_time
+        self._metadata = metadata
+        self._input = processed_input
+        self._output_format = output_format
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        if self._metadata is None:
+            self._metadata = {
+                "input_metadata": self._input.metadata if self._input is not None else {},
+                "output_format": self._output_format
+            }
+            self._input = None
+        return self._metadata
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "raw_output": self.raw_output,
+            "processed_output": self.processed_output,
+            "inference_time": self.inference_time,
+            "metadata": self.metadata
+        }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        # Also restores objects pickled before ModelOutput had slots
+        self.__init__(state["raw_output"], state["processed_output"], state["inference_time"], state["metadata"])
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, ModelOutput):
+            return NotImplemented
+        return (
+            (self.raw_output, self.processed_output, self.inference_time, self.metadata)
+            == (other.raw_output, other.processed_output, other.inference_time, other.metadata)
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"ModelOutput(raw_output={self.raw_output!r}, processed_output={self.processed_output!r}, "
+            f"inference_time={self.inference_time!r})"
+        )
+
+class OutputRow:
+    """View of one row of an OutputBatch with the attributes of a ModelOutput"""
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch: "OutputBatch", index: int):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def raw_output(self) -> Any:
+        return self.batch.raw_outputs[self.index]
+
+    @property
+    def processed_output(self) -> Any:
+        return self.batch.processed_outputs[self.index]
+
+    @property
+    def inference_time(self) -> float:
+        return float(self.batch.inference_times[self.index])
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return {"input_metadata": self.batch.inputs[self.index].metadata, "output_format": self.batch.output_format}
+
+    def __reduce__(self):
+        return ModelOutput, (self.raw_output, self.processed_output, self.inference_time, self.metadata)
+
+class OutputBatch:
+    """Postprocessed outputs of an InputBatch, column by column; rows are OutputRow views"""
+    __slots__ = ("raw_outputs", "processed_outputs", "inference_times", "inputs", "output_format")
+
+    def __init__(
+        self,
+        raw_outputs: Sequence[Any],
+        processed_outputs: List[Any],
+        inference_times: "np.ndarray",
+        inputs: InputBatch,
+        output_format: Any = None
+    ):
+        self.raw_outputs = raw_outputs
+        self.processed_outputs = processed_outputs
+        self.inference_times = inference_times
+        self.inputs = inputs
+        self.output_format = output_format
+
+    def __len__(self) -> int:
+        return len(self.processed_outputs)
+
+    def __getitem__(self, index: int) -> OutputRow:
+        if index < 0:
+            index += len(self.processed_outputs)
+        if not 0 <= index < len(self.processed_outputs):
+            raise IndexError("OutputBatch index out of range")
+        return OutputRow(self, index)
+
+    def __iter__(self) -> Iterator[OutputRow]:
+        return (OutputRow(self, index) for index in range(len(self.processed_outputs)))
+
+def preprocess(input_data: Union[str, Dict[str, Any]], lowercase: bool = True) -> ProcessedInput:
+    """Validate and normalize (strip, optionally lowercase) one raw input"""
+    if not input_data:
+        raise ValueError("Empty input data")
+    text = input_text(input_data)
+    processed = text.strip()
+    if lowercase:
+        processed = processed.lower()
+    return ProcessedInput(processed, timestamp=time.time(), original_length=len(text))
+
+def preprocess_batch(inputs: Sequence[Union[str, Dict[str, Any]]], lowercase: bool = True) -> InputBatch:
+    """
+    Validate and normalize many raw inputs into one InputBatch.
+
+    The batch shares a single timestamp, and lengths are gathered straight
+    into arrays without any per-input objects besides the texts.
+    """
+    for index, input_data in enumerate(inputs):
+        if not input_data:
+            raise ValueError(f"Empty input data at index {index}")
+    originals = [input_text(input_data) for input_data in inputs]
+    texts = [text.strip().lower() for text in originals] if lowercase else [text.strip() for text in originals]
+    count = len(texts)
+    return InputBatch(
+        texts,
+        np.fromiter(map(len, originals), dtype=np.int64, count=count),
+        np.fromiter(map(len, texts), dtype=np.int64, count=count),
+        np.full(count, time.time())
+    )
@@ -0,0 +1,164 @@
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass
+import logging
+import threading
+
+from outputs import to_numpy
+from startup import lazy_import, load_pretrained
+
+torch = lazy_import("torch")
+transformers = lazy_import("transformers")
+np = lazy_import("numpy")
+
+POOLING_MODES = ("cls", "mean")
+EMBEDDING_DTYPES = ("float32", "float16")
+
+@dataclass
+class EmbeddingSettings:
+    """
+    Sentence embedding settings from the model.embeddings config section.
+
+    With enabled set, infer() and infer_batch() return {"embedding": vector}
+    for every input; embed() works either way.
+    """
+    enabled: bool = False
+    pooling: str = "mean"
+    normalize: bool = True
+    dtype: str = "float32"
+    batch_size: int = 64
+
+    @classmethod
+    def from_config(cls, embeddings: Dict[str, Any]) -> "EmbeddingSettings":
+        settings = cls(**{k: v for k, v in embeddings.items() if k in cls.__dataclass_fields__})
+        if settings.pooling not in POOLING_MODES:
+            raise ValueError(f"Unsupported embedding pooling: {settings.pooling}")
+        if settings.dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {settings.dtype}")
+        if settings.batch_size < 1:
+            raise ValueError(f"Embedding batch_size must be positive, got {settings.batch_size}")
+        return settings
+
+def hidden_states(outputs: Any) -> "torch.Tensor":
+    """Token-level hidden states of an encoder output (the first tensor output for exported backends)"""
+    if "last_hidden_state" in outputs:
+        return outputs["last_hidden_state"]
+    return next(value for value in outputs.values() if torch.is_tensor(value) and value.dim() == 3)
+
+def pool(
+    hidden: "torch.Tensor",
+    attention_mask: "torch.Tensor",
+    pooling: str = "mean",
+    normalize: bool = True
+) -> "torch.Tensor":
+    """
+    One float32 vector per sequence.
+
+    cls takes the first token's hidden state; mean averages the hidden
+    states of real tokens, ignoring padding. normalize scales the vectors
+    to unit length, so inner products are cosine similarities.
+    """
+    hidden = hidden.float()
+    if pooling == "cls":
+        pooled = hidden[:, 0]
+    else:
+        mask = attention_mask.to(hidden.device, hidden.dtype).unsqueeze(-1)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1.0)
+    if normalize:
+        pooled = torch.nn.functional.normalize(pooled, dim=-1)
+    return pooled
+
+class TextEncoder:
+    def __init__(
+        self,
+        name: str,
+        device: str = "auto",
+        pooling: str = "mean",
+        normalize: bool = True,
+        max_length: int = 128,
+        batch_size: int = 64,
+        model: Optional[Any] = None,
+        tokenizer: Optional[Any] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Small standalone sentence encoder, e.g. a MiniLM checkpoint.
+
+        The model is loaded through the model registry on the first embed()
+        call, unless model and tokenizer are passed in. Anything with the
+        same embed(texts) method, such as a ModelWrapper, can be used where
+        a TextEncoder is expected.
+
+        Args:
+            name: Hub id or local checkpoint directory
+            device: Device to run on ("auto" picks CUDA when available)
+            pooling: "cls" or "mean"
+            normalize: Scale embeddings to unit length
+            max_length: Tokens kept per text
+            batch_size: Texts per forward pass
+            model: Optional already loaded encoder
+            tokenizer: Optional tokenizer for model
+            logger: Optional logger instance
+        """
+        if pooling not in POOLING_MODES:
+            raise ValueError(f"Unsupported embedding pooling: {pooling}")
+        self.name = name
+        self.device = device
+        self.pooling = pooling
+        self.normalize = normalize
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.logger = logger or logging.getLogger(__name__)
+        self._model, self._tokenizer = model, tokenizer
+        self._handle = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._model is not None and self._tokenizer is not None:
+            return
+        from model_registry import get_model_registry
+
+        with self._lock:
+            if self._model is None or self._tokenizer is None:
+                if self.device == "auto":
+                    self.device = "cuda" if torch.cuda.is_available() else "cpu"
+                self._handle = get_model_registry().acquire(
+                    self.name, self._load, variant=("AutoModel", "float32", self.device)
+                )
+                self._model, self._tokenizer = self._handle.model, self._handle.tokenizer
+
+    def _load(self):
+        model = load_pretrained(transformers.AutoModel, self.name, torch_dtype=torch.float32, logger=self.logger)
+        tokenizer = transformers.AutoTokenizer.from_pretrained(self.name)
+        return model.to(self.device).eval(), tokenizer
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        """
+        Embed texts in batches of similar length.
+
+        Returns:
+            C-contiguous float32 (len(texts), hidden_size) matrix in input order
+        """
+        self._ensure_loaded()
+        model, tokenizer = self._model, self._tokenizer
+        embeddings = np.empty((len(texts), model.config.hidden_size), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                rows = order[start:start + self.batch_size]
+                inputs = tokenizer(
+                    [texts[index] for index in rows],
+                    padding=True,
+                    truncation=True,
+                    max_length=self.max_length,
+                    return_tensors="pt"
+                ).to(model.device)
+                outputs = model(**inputs)
+                embeddings[rows] = to_numpy(pool(hidden_states(outputs), inputs["attention_mask"], self.pooling, self.normalize))
+        return embeddings
+
+    def close(self):
+        """Release the registry's model"""
+        if self._handle is not None:
+            self._handle.release()
+            self._handle = None
+            self._model = self._tokenizer = None
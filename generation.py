@@ -0,0 +1,500 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+from concurrent.futures import Future, InvalidStateError
+from collections import deque
+import logging
+import threading
+import time
+
+import torch # type: ignore
+import torch.nn.functional as F # type: ignore
+
+from prefix_cache import PrefixCache
+
+@dataclass
+class GenerationResult:
+    """Output of one prompt generated through the batching engine"""
+    text: str
+    prompt_tokens: int
+    generated_tokens: List[int]
+    generation_time: float
+    time_to_first_token: Optional[float]
+    finish_reason: str
+
+@dataclass
+class _Request:
+    prompt_ids: List[int]
+    config: Any
+    future: Future
+    on_token: Optional[Callable[[int], None]] = None
+    start_time: float = field(default_factory=time.time)
+    first_token_time: Optional[float] = None
+    generated: List[int] = field(default_factory=list)
+    finish_reason: Optional[str] = None
+
+@dataclass
+class EngineStats:
+    """Counters for the continuous batching loop"""
+    requests: int = 0
+    completed: int = 0
+    cancelled: int = 0
+    decode_steps: int = 0
+    prefills: int = 0
+    generated_tokens: int = 0
+    active_sequences: int = 0
+    pending_requests: int = 0
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.generated_tokens / self.decode_steps if self.decode_steps else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.__dict__, "average_batch_size": self.average_batch_size}
+
+def _filter_logits(
+    logits: torch.Tensor,
+    history: torch.Tensor,
+    history_mask: torch.Tensor,
+    temperature: torch.Tensor,
+    top_k: torch.Tensor,
+    top_p: torch.Tensor,
+    repetition_penalty: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Apply the sampling parameters; returns filtered logits in descending order, their token ids and the greedy rows"""
+    logits = logits.float()
+
+    if bool((repetition_penalty != 1.0).any()):
+        # Point padded history slots at the row's last real token so they
+        # do not penalize the pad id
+        history = torch.where(history_mask.bool(), history, history[:, -1:])
+        scores = logits.gather(1, history)
+        penalty = repetition_penalty[:, None]
+        scores = torch.where(scores < 0, scores * penalty, scores / penalty)
+        logits = logits.scatter(1, history, scores)
+
+    greedy = temperature <= 0
+    logits = logits / temperature.clamp(min=1e-5)[:, None]
+
+    sorted_logits, sorted_index = logits.sort(dim=-1, descending=True)
+    vocab_size = logits.shape[-1]
+    ranks = torch.arange(vocab_size, device=logits.device)[None, :]
+    k = torch.where(top_k > 0, top_k, torch.full_like(top_k, vocab_size))[:, None]
+    remove = ranks >= k
+    sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+
+    probs = sorted_logits.softmax(dim=-1)
+    remove = remove | ((probs.cumsum(dim=-1) - probs) > top_p[:, None])
+    return sorted_logits.masked_fill(remove, float("-inf")), sorted_index, greedy
+
+def sample_next_tokens(
+    logits: torch.Tensor,
+    history: torch.Tensor,
+    history_mask: torch.Tensor,
+    temperature: torch.Tensor,
+    top_k: torch.Tensor,
+    top_p: torch.Tensor,
+    repetition_penalty: torch.Tensor
+) -> torch.Tensor:
+    """
+    Sample one token per row with per-row sampling parameters.
+
+    Args:
+        logits: Next-token logits of shape (batch, vocab)
+        history: Token ids seen so far per row, left padded
+        history_mask: 1 where history holds a real token
+        temperature: Per-row temperature; values <= 0 select greedily
+        top_k: Per-row top-k; 0 disables the filter
+        top_p: Per-row nucleus threshold
+        repetition_penalty: Per-row repetition penalty
+
+    Returns:
+        Tensor of shape (batch,) with the sampled token ids
+    """
+    sorted_logits, sorted_index, greedy = _filter_logits(
+        logits, history, history_mask, temperature, top_k, top_p, repetition_penalty
+    )
+    choice = torch.multinomial(sorted_logits.softmax(dim=-1), num_samples=1)
+    sampled = sorted_index.gather(1, choice).squeeze(1)
+    return torch.where(greedy, sorted_index[:, 0], sampled)
+
+def next_token_probs(
+    logits: torch.Tensor,
+    history: torch.Tensor,
+    history_mask: torch.Tensor,
+    temperature: torch.Tensor,
+    top_k: torch.Tensor,
+    top_p: torch.Tensor,
+    repetition_penalty: torch.Tensor
+) -> torch.Tensor:
+    """
+    The distribution sample_next_tokens draws from, over the whole vocabulary.
+
+    Takes the same arguments as sample_next_tokens. Greedy rows are one-hot
+    on their argmax token.
+
+    Returns:
+        Tensor of shape (batch, vocab) with rows summing to one
+    """
+    sorted_logits, sorted_index, greedy = _filter_logits(
+        logits, history, history_mask, temperature, top_k, top_p, repetition_penalty
+    )
+    probs = torch.zeros_like(sorted_logits).scatter(1, sorted_index, sorted_logits.softmax(dim=-1))
+    one_hot = F.one_hot(sorted_index[:, 0], probs.shape[-1]).to(probs.dtype)
+    return torch.where(greedy[:, None], one_hot, probs)
+
+def to_legacy_cache(past_key_values: Any) -> Tuple:
+    """Convert a transformers Cache object to per-layer (key, value) tuples"""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    if hasattr(past_key_values, "layers"):
+        return tuple((layer.keys, layer.values) for layer in past_key_values.layers)
+    return past_key_values
+
+def from_legacy_cache(legacy: Tuple) -> Any:
+    """Wrap per-layer (key, value) tuples in a DynamicCache when available"""
+    try:
+        from transformers import DynamicCache # type: ignore
+    except ImportError:
+        return legacy
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(legacy)
+    cache = DynamicCache()
+    for layer_idx, (key, value) in enumerate(legacy):
+        cache.update(key, value, layer_idx)
+    return cache
+
+def _pad_past(legacy: Tuple, length: int) -> Tuple:
+    """Left pad every key/value tensor along the sequence dimension"""
+    return tuple(
+        tuple(F.pad(t, (0, 0, length - t.shape[2], 0)) for t in layer)
+        for layer in legacy
+    )
+
+class ContinuousBatchingEngine:
+    def __init__(
+        self,
+        model: Any,
+        tokenizer: Any,
+        max_batch_size: int = 8,
+        prefix_cache: Optional[PrefixCache] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Continuous batching decode loop for causal language models.
+
+        Prompts are left padded and prefilled together, then decoded one
+        token per step for every active sequence in a single forward pass.
+        Sequences leave the batch as soon as they finish and queued prompts
+        are admitted between steps, merging their KV cache into the running
+        batch. Each sequence keeps its own sampling parameters. With a
+        prefix cache, prompts sharing a cached prefix only prefill the
+        remaining tokens.
+
+        Args:
+            model: Causal language model
+            tokenizer: Matching tokenizer
+            max_batch_size: Maximum number of sequences decoded together
+            prefix_cache: Optional cache of prompt prefix KV states
+            logger: Optional logger instance
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.prefix_cache = prefix_cache
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = EngineStats()
+
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else (self.eos_token_id or 0)
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Batch state, aligned row by row with self._active
+        self._active: List[_Request] = []
+        self._past = None
+        self._mask = None
+        self._tokens = None
+        self._next_tokens = None
+
+        self._worker = threading.Thread(target=self._run, name="generation-engine", daemon=True)
+        self._worker.start()
+
+    def submit(
+        self,
+        prompt: str,
+        config: Any,
+        on_token: Optional[Callable[[int], None]] = None
+    ) -> Future:
+        """
+        Queue a prompt; the future resolves to a GenerationResult.
+
+        If given, on_token is called from the engine thread with every
+        sampled token id as soon as it is produced. Cancelling the future
+        stops the sequence at the next step and frees its batch row.
+        """
+        if getattr(config, "num_return_sequences", 1) != 1:
+            raise ValueError("Batched generation returns one sequence per prompt")
+        prompt_ids = self.tokenizer(prompt)["input_ids"]
+        return self.submit_ids(prompt_ids, config, on_token)
+
+    def submit_ids(
+        self,
+        prompt_ids: List[int],
+        config: Any,
+        on_token: Optional[Callable[[int], None]] = None
+    ) -> Future:
+        """Queue an already tokenized prompt"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Generation engine is closed")
+            self._pending.append(_Request(prompt_ids=prompt_ids, config=config, future=future, on_token=on_token))
+            self.stats.requests += 1
+            self.stats.pending_requests = len(self._pending)
+            self._cond.notify()
+        return future
+
+    def generate_batch(self, prompts: Sequence[str], configs: Sequence[Any]) -> List[GenerationResult]:
+        """Generate for several prompts at once, returning results in input order"""
+        futures = [self.submit(prompt, config) for prompt, config in zip(prompts, configs)]
+        return [future.result() for future in futures]
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._active and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending and not self._active:
+                    return
+                admitted = []
+                while self._pending and len(self._active) + len(admitted) < self.max_batch_size:
+                    request = self._pending.popleft()
+                    if request.future.cancelled():
+                        self.stats.cancelled += 1
+                    else:
+                        admitted.append(request)
+                self.stats.pending_requests = len(self._pending)
+
+            try:
+                with torch.no_grad():
+                    if admitted:
+                        self._prefill(admitted)
+                    self._retire()
+                    if self._active:
+                        self._decode_step()
+                        self._retire()
+            except Exception as e:
+                self.logger.error(f"Batched generation failed: {str(e)}")
+                for request in self._active + admitted:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                self._reset_state()
+
+    def _forward(self, input_ids, attention_mask, position_ids, past=None):
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=from_legacy_cache(past) if past is not None else None,
+            use_cache=True
+        )
+        return outputs.logits[:, -1, :], to_legacy_cache(outputs.past_key_values)
+
+    def _prefill(self, requests: List[_Request]):
+        """Prefill new prompts, reusing cached prefixes, then merge them into the batch"""
+        fresh = []
+        for request in requests:
+            matched, cached_kv = (0, None)
+            if self.prefix_cache is not None:
+                matched, cached_kv = self.prefix_cache.match(request.prompt_ids)
+            if cached_kv is None:
+                fresh.append(request)
+            else:
+                self._prefill_group([request], cached_kv, matched)
+        if fresh:
+            self._prefill_group(fresh)
+
+    def _prefill_group(self, requests: List[_Request], cached_kv: Optional[Tuple] = None, cached_length: int = 0):
+        """Left pad and prefill prompts, starting after cached_length cached tokens"""
+        device = self.model.device
+        suffixes = [r.prompt_ids[cached_length:] for r in requests]
+        length = max(len(suffix) for suffix in suffixes)
+        ids = torch.full((len(requests), length), self.pad_token_id, dtype=torch.long)
+        mask = torch.zeros((len(requests), length), dtype=torch.long)
+        for row, suffix in enumerate(suffixes):
+            ids[row, length - len(suffix):] = torch.tensor(suffix)
+            mask[row, length - len(suffix):] = 1
+        ids, mask = ids.to(device), mask.to(device)
+
+        if cached_kv is not None:
+            # Only a single request is prefilled on top of a cached prefix
+            prefix = torch.tensor([requests[0].prompt_ids[:cached_length]], dtype=torch.long, device=device)
+            mask = torch.cat([torch.ones_like(prefix), mask], dim=1)
+            position_ids = torch.arange(cached_length, cached_length + length, device=device)[None, :]
+            logits, past = self._forward(ids, mask, position_ids, cached_kv)
+            ids = torch.cat([prefix, ids], dim=1)
+        else:
+            position_ids = (mask.cumsum(-1) - 1).clamp(min=0)
+            logits, past = self._forward(ids, mask, position_ids)
+
+        next_tokens = self._sample(logits, ids, mask, requests)
+        self.stats.prefills += 1
+
+        if self.prefix_cache is not None:
+            for row, request in enumerate(requests):
+                start = mask.shape[1] - len(request.prompt_ids)
+                self.prefix_cache.insert(
+                    request.prompt_ids,
+                    tuple(tuple(t[row:row + 1, :, start:].clone() for t in layer) for layer in past)
+                )
+
+        self._append_to_batch(past, mask, ids, next_tokens)
+        self._active.extend(requests)
+        self._record(requests, next_tokens)
+
+    def _append_to_batch(self, past: Tuple, mask: torch.Tensor, ids: torch.Tensor, next_tokens: torch.Tensor):
+        """Merge freshly prefilled rows into the running batch state"""
+        if not self._active:
+            self._past, self._mask, self._tokens, self._next_tokens = past, mask, ids, next_tokens
+            return
+
+        length = mask.shape[1]
+        total = max(self._mask.shape[1], length)
+        self._past = tuple(
+            tuple(torch.cat([a, b], dim=0) for a, b in zip(layer_a, layer_b))
+            for layer_a, layer_b in zip(_pad_past(self._past, total), _pad_past(past, total))
+        )
+        self._mask = torch.cat([F.pad(self._mask, (total - self._mask.shape[1], 0)), F.pad(mask, (total - length, 0))])
+        self._tokens = torch.cat([
+            F.pad(self._tokens, (total - self._tokens.shape[1], 0), value=self.pad_token_id),
+            F.pad(ids, (total - length, 0), value=self.pad_token_id)
+        ])
+        self._next_tokens = torch.cat([self._next_tokens, next_tokens])
+
+    def warm_prefixes(self, prefixes: Sequence[str]):
+        """Precompute and cache the KV state of known prompt prefixes"""
+        if self.prefix_cache is None:
+            return
+        with torch.no_grad():
+            for prefix in prefixes:
+                prefix_ids = self.tokenizer(prefix)["input_ids"]
+                if len(prefix_ids) < self.prefix_cache.min_match_tokens:
+                    continue
+                ids = torch.tensor([prefix_ids], dtype=torch.long, device=self.model.device)
+                mask = torch.ones_like(ids)
+                position_ids = torch.arange(ids.shape[1], device=ids.device)[None, :]
+                _, past = self._forward(ids, mask, position_ids)
+                self.prefix_cache.insert(prefix_ids, past)
+
+    def _decode_step(self):
+        """Feed the pending token of every active sequence and sample the next"""
+        ids = self._next_tokens[:, None]
+        self._mask = torch.cat([self._mask, torch.ones_like(ids)], dim=1)
+        self._tokens = torch.cat([self._tokens, ids], dim=1)
+        position_ids = self._mask.sum(-1, keepdim=True) - 1
+
+        logits, self._past = self._forward(ids, self._mask, position_ids, self._past)
+        self._next_tokens = self._sample(logits, self._tokens, self._mask, self._active)
+        self.stats.decode_steps += 1
+        self._record(self._active, self._next_tokens)
+
+    def _sample(self, logits, history, mask, requests: List[_Request]) -> torch.Tensor:
+        device = logits.device
+        configs = [r.config for r in requests]
+        return sample_next_tokens(
+            logits,
+            history,
+            mask,
+            temperature=torch.tensor([c.temperature for c in configs], device=device),
+            top_k=torch.tensor([c.top_k or 0 for c in configs], device=device),
+            top_p=torch.tensor([c.top_p for c in configs], device=device),
+            repetition_penalty=torch.tensor([c.repetition_penalty for c in configs], device=device)
+        )
+
+    def _record(self, requests: List[_Request], tokens: torch.Tensor):
+        """Append sampled tokens and mark sequences that hit a stop condition"""
+        now = time.time()
+        for request, token in zip(requests, tokens.tolist()):
+            if request.first_token_time is None:
+                request.first_token_time = now
+            request.generated.append(token)
+            self.stats.generated_tokens += 1
+            if request.on_token is not None:
+                request.on_token(token)
+            max_new_tokens = getattr(request.config, "max_new_tokens", None)
+            if token == self.eos_token_id:
+                request.finish_reason = "eos"
+            elif len(request.prompt_ids) + len(request.generated) >= request.config.max_length:
+                request.finish_reason = "length"
+            elif max_new_tokens is not None and len(request.generated) >= max_new_tokens:
+                request.finish_reason = "length"
+
+    def _retire(self):
+        """Drop finished or cancelled rows from the batch state and resolve their futures"""
+        # Futures stay pending while generating, so callers can cancel a
+        # sequence at any step and free its row
+        for request in self._active:
+            if request.finish_reason is None and request.future.cancelled():
+                request.finish_reason = "cancelled"
+        keep = [row for row, r in enumerate(self._active) if r.finish_reason is None]
+        if len(keep) == len(self._active):
+            return
+
+        for request in self._active:
+            if request.finish_reason is not None:
+                self._complete(request)
+
+        if not keep:
+            self._reset_state()
+            return
+
+        index = torch.tensor(keep, device=self._mask.device)
+        self._active = [self._active[row] for row in keep]
+        self._mask = self._mask.index_select(0, index)
+        self._tokens = self._tokens.index_select(0, index)
+        self._next_tokens = self._next_tokens.index_select(0, index)
+        self._past = tuple(tuple(t.index_select(0, index) for t in layer) for layer in self._past)
+
+        # Drop leading columns that are padding for every remaining row
+        start = int((self._mask.sum(0) > 0).nonzero()[0])
+        if start:
+            self._mask = self._mask[:, start:]
+            self._tokens = self._tokens[:, start:]
+            self._past = tuple(tuple(t[:, :, start:] for t in layer) for layer in self._past)
+        self.stats.active_sequences = len(self._active)
+
+    def _complete(self, request: _Request):
+        generated = request.generated
+        if request.finish_reason == "eos":
+            generated = generated[:-1]
+        text = self.tokenizer.decode(request.prompt_ids + generated, skip_special_tokens=True)
+        try:
+            request.future.set_result(GenerationResult(
+                text=text,
+                prompt_tokens=len(request.prompt_ids),
+                generated_tokens=generated,
+                generation_time=time.time() - request.start_time,
+                time_to_first_token=(
+                    request.first_token_time - request.start_time
+                    if request.first_token_time is not None else None
+                ),
+                finish_reason=request.finish_reason
+            ))
+        except InvalidStateError:
+            # Cancelled by the caller, possibly after its last token
+            self.stats.cancelled += 1
+            return
+        self.stats.completed += 1
+
+    def _reset_state(self):
+        self._active = []
+        self._past = self._mask = self._tokens = self._next_tokens = None
+        self.stats.active_sequences = 0
@@ -0,0 +1,489 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+@dataclass
+class MetricsSettings:
+    """Metrics settings from the monitoring.metrics config section"""
+    enabled: bool = True
+    collection_interval: float = 1.0
+    exporters: List[str] = field(default_factory=list)
+    tracked_metrics: List[str] = field(default_factory=lambda: ["latency", "throughput"])
+    prometheus_host: str = "127.0.0.1"
+    prometheus_port: int = 9100
+    json_path: str = "./logs/metrics.json"
+
+    @classmethod
+    def from_config(cls, metrics: Dict[str, Any]) -> "MetricsSettings":
+        exporters = list(metrics.get("exporters", []))
+        unknown = set(exporters) - {"prometheus", "json"}
+        if unknown:
+            raise ValueError(f"Unsupported metrics exporters: {sorted(unknown)}")
+        return cls(
+            enabled=metrics.get("enabled", True),
+            collection_interval=float(metrics.get("collection_interval", 1.0)),
+            exporters=exporters,
+            tracked_metrics=list(metrics.get("tracked_metrics", ["latency", "throughput"])),
+            prometheus_host=metrics.get("prometheus_host", "127.0.0.1"),
+            prometheus_port=int(metrics.get("prometheus_port", 9100)),
+            json_path=metrics.get("json_path", "./logs/metrics.json")
+        )
+
+def synchronize(device: Any = None):
+    """
+    Wait for queued device work so a host-side timer covers it.
+
+    CPU work is synchronous, so this is a no-op there. torch is only
+    consulted if something already imported it.
+    """
+    device_type = getattr(device, "type", str(device or "cpu")).split(":")[0]
+    if device_type == "cpu":
+        return
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    if device_type == "cuda" and torch.cuda.is_available():
+        torch.cuda.synchronize(device)
+    elif device_type == "mps" and hasattr(torch, "mps"):
+        torch.mps.synchronize()
+
+class Histogram:
+    # Log-spaced buckets from 1 microsecond to ~17 minutes with ~5% width,
+    # so quantile estimates carry at most ~2.5% relative error
+    MIN_VALUE = 1e-6
+    GROWTH = 1.05
+    NUM_BUCKETS = 430
+
+    _LOG_MIN = math.log(MIN_VALUE)
+    _INV_LOG_GROWTH = 1.0 / math.log(GROWTH)
+
+    def __init__(self):
+        """
+        Streaming histogram of non-negative values (seconds for latencies).
+
+        observe() is O(1): the bucket index comes straight from the log of
+        the value, so memory stays fixed no matter how many values are seen.
+        """
+        self.counts = [0] * (self.NUM_BUCKETS + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if value <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = min(int((math.log(value) - self._LOG_MIN) * self._INV_LOG_GROWTH) + 1, self.NUM_BUCKETS)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the q-quantile (0 <= q <= 1), or None if nothing was observed"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * (self.count - 1)
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen > rank:
+                    break
+            low, high = self.min, self.max
+        if index == 0:
+            return min(self.MIN_VALUE, high)
+        # Geometric midpoint of the bucket, clamped to the observed range
+        estimate = self.MIN_VALUE * self.GROWTH ** (index - 0.5)
+        return max(low, min(high, estimate))
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.mean,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99)
+        }
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def snapshot(self) -> float:
+        return self.value
+
+class _Timer:
+    __slots__ = ("histogram", "device", "start", "elapsed")
+
+    def __init__(self, histogram: Histogram, device: Any):
+        self.histogram = histogram
+        self.device = device
+        self.elapsed = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.device is not None:
+            synchronize(self.device)
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed)
+        return False
+
+class _NullTimer:
+    elapsed = 0.0
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def null_timer(histogram: Histogram, device: Any = None) -> _NullTimer:
+    """Stand-in for MetricsRegistry.timer that records nothing"""
+    return _NULL_TIMER
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        """
+        Process-wide store of histograms, counters and gauges.
+
+        Metrics are identified by name plus labels (e.g. stage, model).
+        Look a metric up once and keep the returned object on hot paths;
+        the lookup itself takes a lock.
+
+        Args:
+            enabled: When False, timers are no-ops
+        """
+        self.enabled = enabled
+        self._metrics: Dict[str, Dict[Labels, Any]] = {}
+        self._kinds: Dict[str, type] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[["MetricsRegistry"], None]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, kind: type, name: str, description: str, labels: Dict[str, Any]) -> Any:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            if self._kinds.setdefault(name, kind) is not kind:
+                raise ValueError(f"Metric {name} is already registered as a {self._kinds[name].__name__}")
+            if description:
+                self._help.setdefault(name, description)
+            family = self._metrics.setdefault(name, {})
+            metric = family.get(key)
+            if metric is None:
+                metric = family[key] = kind()
+            return metric
+
+    def histogram(self, name: str, description: str = "", **labels) -> Histogram:
+        return self._get(Histogram, name, description, labels)
+
+    def counter(self, name: str, description: str = "", **labels) -> Counter:
+        return self._get(Counter, name, description, labels)
+
+    def gauge(self, name: str, description: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, description, labels)
+
+    def timer(self, histogram: Histogram, device: Any = None):
+        """
+        Context manager that records wall time into histogram.
+
+        Pass the device the timed block ran on so queued accelerator work
+        is waited for before the clock stops; on CPU nothing extra runs.
+        """
+        return _Timer(histogram, device) if self.enabled else _NULL_TIMER
+
+    def add_collector(self, collector: Callable[["MetricsRegistry"], None]):
+        """Register a callback that refreshes gauges before each export"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[["MetricsRegistry"], None]):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self):
+        """Run the registered collectors"""
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            collector(self)
+
+    def families(self) -> Iterable[Tuple[str, type, Dict[Labels, Any]]]:
+        with self._lock:
+            return [(name, self._kinds[name], dict(family)) for name, family in self._metrics.items()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly view of every metric"""
+        return {
+            name: [{"labels": dict(labels), "value": metric.snapshot()} for labels, metric in family.items()]
+            for name, _, family in self.families()
+        }
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for name, kind, family in self.families():
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            if kind is Histogram:
+                lines.append(f"# TYPE {name} summary")
+                for labels, histogram in family.items():
+                    for q in (0.5, 0.95, 0.99):
+                        value = histogram.quantile(q)
+                        lines.append(f"{name}{_format_labels(labels + (('quantile', str(q)),))} {_format_value(value)}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+            else:
+                lines.append(f"# TYPE {name} {'counter' if kind is Counter else 'gauge'}")
+                for labels, metric in family.items():
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(metric.value)}")
+        return "\n".join(lines) + "\n"
+
+    def measure_overhead(self, samples: int = 100000) -> Dict[str, float]:
+        """
+        Measure the per-call cost of recording metrics.
+
+        Returns:
+            Nanoseconds per histogram observation, counter increment and
+            timed block
+        """
+        histogram, counter = Histogram(), Counter()
+        start = time.perf_counter_ns()
+        for _ in range(samples):
+            histogram.observe(0.001)
+        observe_ns = (time.perf_counter_ns() - start) / samples
+
+        start = time.perf_counter_ns()
+        for _ in range(samples):
+            counter.inc()
+        counter_ns = (time.perf_counter_ns() - start) / samples
+
+        start = time.perf_counter_ns()
+        for _ in range(samples):
+            with _Timer(histogram, None):
+                pass
+        timer_ns = (time.perf_counter_ns() - start) / samples
+        return {"observe_ns": observe_ns, "counter_ns": counter_ns, "timer_ns": timer_ns}
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _format_value(value: Optional[float]) -> str:
+    if value is None:
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+REGISTRY = MetricsRegistry()
+
+def get_registry() -> MetricsRegistry:
+    """Return the process-wide default registry"""
+    return REGISTRY
+
+def _process_memory_bytes() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            return float(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            # ru_maxrss is the peak, in kilobytes on Linux and bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return float(peak if sys.platform == "darwin" else peak * 1024)
+        except ImportError:
+            return None
+
+def collect_system_metrics(registry: MetricsRegistry, tracked_metrics: Iterable[str]):
+    """Refresh process memory and GPU gauges for the tracked metrics"""
+    tracked = set(tracked_metrics)
+    if "memory_usage" in tracked:
+        memory = _process_memory_bytes()
+        if memory is not None:
+            registry.gauge("process_resident_memory_bytes", "Resident memory of this process").set(memory)
+
+    torch = sys.modules.get("torch")
+    if "gpu_utilization" in tracked and torch is not None and torch.cuda.is_available():
+        for index in range(torch.cuda.device_count()):
+            registry.gauge("gpu_memory_allocated_bytes", "Memory held by tensors", device=index).set(
+                torch.cuda.memory_allocated(index)
+            )
+            try:
+                registry.gauge("gpu_utilization_percent", "GPU busy percentage", device=index).set(
+                    torch.cuda.utilization(index)
+                )
+            except Exception:
+                # Needs pynvml; memory gauges are still reported without it
+                pass
+
+class MetricsExporter:
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        settings: Optional[MetricsSettings] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Periodically collect metrics and export them.
+
+        Every collection_interval the exporter runs the registry's
+        collectors, derives a <name>_per_second throughput gauge from every
+        counter and, if configured, dumps the registry to a JSON file. The
+        Prometheus exporter serves the registry as text on /metrics. The
+        time spent collecting is itself recorded in
+        metrics_collection_seconds.
+
+        Args:
+            registry: Registry to export
+            settings: Metrics settings
+            logger: Optional logger instance
+        """
+        self.registry = registry
+        self.settings = settings or MetricsSettings()
+        self.logger = logger or logging.getLogger(__name__)
+        self.collection_time = registry.histogram(
+            "metrics_collection_seconds", "Time spent collecting and exporting metrics"
+        )
+
+        self._last_counts: Dict[Tuple[str, Labels], Tuple[float, float]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def prometheus_port(self) -> Optional[int]:
+        """Port the Prometheus endpoint is bound to, if it is running"""
+        return self._server.server_address[1] if self._server is not None else None
+
+    def start(self) -> "MetricsExporter":
+        if "prometheus" in self.settings.exporters:
+            self._start_http_server()
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def _start_http_server(self):
+        registry = self.registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(
+                (self.settings.prometheus_host, self.settings.prometheus_port), _Handler
+            )
+        except OSError as e:
+            self.logger.warning(f"Prometheus endpoint disabled: {str(e)}")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        self.logger.info(f"Serving Prometheus metrics on port {self.prometheus_port}")
+
+    def _run(self):
+        while not self._stop.wait(self.settings.collection_interval):
+            try:
+                self.collect()
+            except Exception as e:
+                self.logger.error(f"Metrics collection failed: {str(e)}")
+
+    def collect(self):
+        """Run one collection cycle and write the JSON dump if enabled"""
+        start = time.perf_counter()
+        collect_system_metrics(self.registry, self.settings.tracked_metrics)
+        self.registry.collect()
+        self._update_rates()
+        if "json" in self.settings.exporters:
+            self._write_json()
+        self.collection_time.observe(time.perf_counter() - start)
+
+    def _update_rates(self):
+        now = time.monotonic()
+        for name, kind, family in self.registry.families():
+            if kind is not Counter:
+                continue
+            for labels, counter in family.items():
+                value = counter.value
+                previous = self._last_counts.get((name, labels))
+                self._last_counts[(name, labels)] = (now, value)
+                if previous is None or now <= previous[0]:
+                    continue
+                rate_name = (name[:-len("_total")] if name.endswith("_total") else name) + "_per_second"
+                self.registry.gauge(rate_name, **dict(labels)).set((value - previous[1]) / (now - previous[0]))
+
+    def _write_json(self):
+        path = Path(self.settings.json_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"timestamp": time.time(), "metrics": self.registry.to_dict()}, default=str))
+        os.replace(tmp, path)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,301 @@
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from dataclasses import dataclass
+from collections import OrderedDict
+from concurrent.futures import Future
+import gc
+import logging
+import sys
+import threading
+import time
+
+from metrics import MetricsRegistry, get_registry
+from startup import safetensors_files
+
+@dataclass
+class RegistrySettings:
+    """Model registry settings from the hardware.model_registry config section"""
+    memory_budget_bytes: Optional[int] = None
+
+    @classmethod
+    def from_config(cls, model_registry: Dict[str, Any]) -> "RegistrySettings":
+        budget_mb = model_registry.get("memory_budget_mb")
+        return cls(memory_budget_bytes=int(budget_mb * 1024 * 1024) if budget_mb else None)
+
+@dataclass
+class RegistryStats:
+    """Load, reuse and eviction counters"""
+    loads: int = 0
+    reuses: int = 0
+    evictions: int = 0
+    models: int = 0
+    in_use: int = 0
+    bytes: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+def model_bytes(model: Any) -> int:
+    """Bytes held by a module's parameters and buffers, counting tied weights once"""
+    seen = set()
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        pointer = tensor.data_ptr()
+        if pointer in seen:
+            continue
+        seen.add(pointer)
+        total += tensor.numel() * tensor.element_size()
+    # Quantized layers keep packed weights outside parameters and buffers
+    return total + sum(getattr(module, "packed_bytes", 0) for module in model.modules())
+
+def estimate_checkpoint_bytes(name_or_path: str) -> Optional[int]:
+    """Size of a local safetensors checkpoint, or None when it isn't on disk"""
+    files = safetensors_files(name_or_path)
+    return sum(path.stat().st_size for path in files) if files else None
+
+class _Entry:
+    __slots__ = ("key", "model", "tokenizer", "size", "refs", "last_used", "ready")
+
+    def __init__(self, key: Tuple[Hashable, ...]):
+        self.key = key
+        self.model = None
+        self.tokenizer = None
+        self.size = 0
+        self.refs = 0
+        self.last_used = time.monotonic()
+        self.ready: Future = Future()
+
+class ModelHandle:
+    def __init__(self, registry: "ModelRegistry", entry: _Entry):
+        """A reference to a shared model; release() it (or use it as a context manager) when done"""
+        self._registry = registry
+        self._entry = entry
+        self.key = entry.key
+        self.model = entry.model
+        self.tokenizer = entry.tokenizer
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.model = self.tokenizer = None
+            self._registry._release(self._entry)
+
+    def __enter__(self) -> "ModelHandle":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+class ModelRegistry:
+    def __init__(
+        self,
+        settings: Optional[RegistrySettings] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Process-wide owner of loaded models and tokenizers.
+
+        acquire() returns a reference-counted handle to the model for a
+        (name, revision, variant) key, loading it only if no other owner
+        already has it, so every wrapper and interface in the process shares
+        one copy of each checkpoint. Concurrent requests for a model that is
+        still loading wait for that load instead of starting another.
+
+        Models with no references stay loaded until memory_budget_bytes
+        would be exceeded; the least recently used idle ones are unloaded
+        first and reloaded when next acquired. Models in use are never
+        evicted: if a load can't fit next to them, acquire() raises
+        MemoryError rather than letting the process be OOM-killed.
+
+        Args:
+            settings: Registry settings (no budget by default)
+            metrics: Metrics registry for resident model gauges
+            logger: Optional logger instance
+        """
+        self.settings = settings or RegistrySettings()
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = RegistryStats()
+        self._entries: "OrderedDict[Tuple[Hashable, ...], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        metrics = metrics or get_registry()
+        self._bytes_gauge = metrics.gauge("model_registry_bytes", "Memory held by registry models")
+        self._models_gauge = metrics.gauge("model_registry_models", "Models loaded in the registry")
+        self._evictions_counter = metrics.counter("model_registry_evictions_total", "Idle models unloaded to fit the budget")
+
+    def configure(self, settings: RegistrySettings):
+        """Apply a new memory budget, evicting idle models that no longer fit"""
+        with self._lock:
+            self.settings = settings
+            evicted = self._evict_locked(0)
+        self._unload(evicted)
+
+    def acquire(
+        self,
+        name: str,
+        loader: Callable[[], Tuple[Any, Any]],
+        revision: str = "main",
+        variant: Hashable = None,
+        size_hint: Optional[int] = None
+    ) -> ModelHandle:
+        """
+        Get a shared model and tokenizer, loading them if needed.
+
+        Args:
+            name: Model name or checkpoint path
+            loader: Returns (model, tokenizer); only called on a miss
+            revision: Checkpoint revision
+            variant: Anything else that changes the loaded model, e.g. the
+                model class and dtype; different variants load separately
+            size_hint: Expected model size in bytes, used to make room
+                before loading (defaults to the local checkpoint size)
+
+        Returns:
+            A handle holding one reference to the model
+        """
+        key = (name, revision, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refs += 1
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(key)
+                owner = False
+            else:
+                entry = _Entry(key)
+                entry.refs = 1
+                self._entries[key] = entry
+                owner = True
+
+        if not owner:
+            try:
+                entry.ready.result()
+            except BaseException:
+                with self._lock:
+                    entry.refs -= 1
+                raise
+            with self._lock:
+                self.stats.reuses += 1
+            return ModelHandle(self, entry)
+
+        try:
+            self._make_room(entry, size_hint if size_hint is not None else estimate_checkpoint_bytes(name))
+            start = time.time()
+            model, tokenizer = loader()
+            entry.model, entry.tokenizer = model, tokenizer
+            entry.size = model_bytes(model) if hasattr(model, "parameters") else 0
+            self.logger.info(
+                f"Loaded {name}@{revision} ({entry.size / 1e6:.1f}MB) in {time.time() - start:.2f}s"
+            )
+        except BaseException as e:
+            with self._lock:
+                self._entries.pop(key, None)
+            entry.ready.set_exception(e)
+            raise
+
+        with self._lock:
+            self.stats.loads += 1
+            evicted = self._evict_locked(0)
+            over = self._resident_bytes() - (self.settings.memory_budget_bytes or float("inf"))
+            self._update_gauges()
+        self._unload(evicted)
+        if over > 0:
+            self.logger.warning(f"Models in use exceed the memory budget by {over / 1e6:.1f}MB")
+        entry.ready.set_result(None)
+        return ModelHandle(self, entry)
+
+    def _make_room(self, entry: _Entry, needed: Optional[int]):
+        """Evict idle models so an estimated load fits the budget, then reserve it"""
+        budget = self.settings.memory_budget_bytes
+        if budget is None or not needed:
+            return
+        with self._lock:
+            evicted = self._evict_locked(needed)
+            available = budget - self._resident_bytes()
+            if needed <= available:
+                # Count the load against the budget while it is in progress
+                entry.size = needed
+        self._unload(evicted)
+        if needed > available:
+            raise MemoryError(
+                f"{entry.key[0]} needs ~{needed / 1e6:.1f}MB but only {available / 1e6:.1f}MB of the "
+                f"model memory budget is free; all other models are in use"
+            )
+
+    def _resident_bytes(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def _evict_locked(self, needed: int) -> list:
+        """Drop least recently used idle entries until needed more bytes fit; caller holds the lock"""
+        budget = self.settings.memory_budget_bytes
+        if budget is None:
+            return []
+        evicted = []
+        resident = self._resident_bytes()
+        idle = sorted(
+            (entry for entry in self._entries.values() if entry.refs == 0 and entry.ready.done()),
+            key=lambda entry: entry.last_used
+        )
+        for entry in idle:
+            if resident + needed <= budget:
+                break
+            del self._entries[entry.key]
+            resident -= entry.size
+            evicted.append(entry)
+            self.stats.evictions += 1
+            self._evictions_counter.inc()
+        if evicted:
+            self._update_gauges()
+        return evicted
+
+    def _unload(self, evicted: list):
+        """Free evicted models outside the lock"""
+        if not evicted:
+            return
+        for entry in evicted:
+            self.logger.info(f"Evicted idle model {entry.key[0]}@{entry.key[1]} ({entry.size / 1e6:.1f}MB)")
+            entry.model = entry.tokenizer = None
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.refs -= 1
+            entry.last_used = time.monotonic()
+            self._update_gauges()
+
+    def _update_gauges(self):
+        self.stats.models = len(self._entries)
+        self.stats.in_use = sum(1 for entry in self._entries.values() if entry.refs > 0)
+        self.stats.bytes = self._resident_bytes()
+        self._bytes_gauge.set(self.stats.bytes)
+        self._models_gauge.set(self.stats.models)
+
+    def evict_idle(self):
+        """Unload every model without references"""
+        with self._lock:
+            evicted = [entry for entry in self._entries.values() if entry.refs == 0 and entry.ready.done()]
+            for entry in evicted:
+                del self._entries[entry.key]
+                self.stats.evictions += 1
+            self._update_gauges()
+        self._unload(evicted)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            models = [
+                {"name": entry.key[0], "revision": entry.key[1], "variant": entry.key[2], "bytes": entry.size, "refs": entry.refs}
+                for entry in self._entries.values()
+            ]
+            stats = self.stats.snapshot()
+        return {**stats, "memory_budget_bytes": self.settings.memory_budget_bytes, "loaded": models}
+
+MODEL_REGISTRY = ModelRegistry()
+
+def get_model_registry() -> ModelRegistry:
+    """The process-wide model registry"""
+    return MODEL_REGISTRY
@@ -0,0 +1,253 @@
+from typing import Any, Dict, Optional, Tuple
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import os
+import struct
+import sys
+import zipfile
+
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+TENSOR_FORMATS = ("list", "numpy")
+SAVE_FORMATS = ("json", "npz", "arrow")
+
+# Extension of the array files written for each binary save format
+ARRAY_SUFFIXES = {"npz": ".npz", "arrow": ".arrow"}
+
+@dataclass
+class OutputSettings:
+    """Output settings from the output config section"""
+    tensor_format: str = "list"
+    return_logits: bool = False
+    include_hidden_states: bool = False
+    include_attentions: bool = False
+    save_format: str = "json"
+
+    @classmethod
+    def from_config(cls, output: Dict[str, Any]) -> "OutputSettings":
+        output_format = output.get("format", {})
+        if not isinstance(output_format, dict):
+            output_format = {}
+        settings = cls(
+            tensor_format=output_format.get("tensor_format", "list"),
+            return_logits=output_format.get("return_logits", False),
+            include_hidden_states=output_format.get("include_hidden_states", False),
+            include_attentions=output_format.get("include_attentions", False),
+            save_format=output.get("save_format", "json")
+        )
+        if settings.tensor_format not in TENSOR_FORMATS:
+            raise ValueError(f"Unsupported output tensor_format: {settings.tensor_format}")
+        if settings.save_format not in SAVE_FORMATS:
+            raise ValueError(f"Unsupported output save_format: {settings.save_format}")
+        return settings
+
+def to_numpy(tensor: Any) -> "np.ndarray":
+    """
+    NumPy view of a tensor.
+
+    CPU tensors share their memory with the returned array; tensors on an
+    accelerator are copied to the host once. bfloat16 has no NumPy dtype
+    and is widened to float32, which copies.
+    """
+    tensor = tensor.detach()
+    if tensor.device.type != "cpu":
+        tensor = tensor.cpu()
+    if str(tensor.dtype) == "torch.bfloat16":
+        tensor = tensor.float()
+    return tensor.numpy()
+
+def convert_tensors(value: Any, tensor_format: str = "numpy") -> Any:
+    """Replace every tensor inside dicts, lists and tuples with an array (numpy) or nested lists (list)"""
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.is_tensor(value):
+        array = to_numpy(value)
+        return array if tensor_format == "numpy" else array.tolist()
+    if isinstance(value, dict):
+        return {key: convert_tensors(item, tensor_format) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(convert_tensors(item, tensor_format) for item in value)
+    return value
+
+def split_arrays(value: Any, prefix: str = "") -> Tuple[Any, Dict[str, "np.ndarray"]]:
+    """
+    Separate the arrays in a nested output from the rest of it.
+
+    Returns:
+        (skeleton, arrays): the skeleton has each array replaced by
+        {"__array__": key} and arrays maps those keys to the arrays
+    """
+    if isinstance(value, np.ndarray):
+        return {"__array__": prefix}, {prefix: value}
+    arrays: Dict[str, "np.ndarray"] = {}
+    if isinstance(value, dict):
+        skeleton = {}
+        for key, item in value.items():
+            skeleton[key], found = split_arrays(item, f"{prefix}/{key}" if prefix else str(key))
+            arrays.update(found)
+        return skeleton, arrays
+    if isinstance(value, (list, tuple)):
+        skeleton = []
+        for index, item in enumerate(value):
+            part, found = split_arrays(item, f"{prefix}/{index}" if prefix else str(index))
+            skeleton.append(part)
+            arrays.update(found)
+        return skeleton, arrays
+    return value, arrays
+
+def json_default(value: Any) -> Any:
+    """json.dumps fallback that writes arrays as nested lists"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+def save_arrays(path: str, arrays: Dict[str, "np.ndarray"]):
+    """
+    Write named arrays to a .npy, .npz or .arrow (Arrow IPC) file.
+
+    .npz files are stored uncompressed with every array's data 64-byte
+    aligned, and Arrow files hold each array as a single list cell, so
+    load_arrays can map both without copying and mapped arrays stay on
+    the fast (aligned, BLAS) code paths.
+    A .npy file holds exactly one array.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".npy":
+        if len(arrays) != 1:
+            raise ValueError(f".npy files hold one array, got {len(arrays)}")
+        np.save(path, next(iter(arrays.values())))
+    elif suffix == ".npz":
+        _save_npz(path, arrays)
+    elif suffix == ".arrow":
+        import pyarrow as pa # type: ignore
+
+        columns, fields = [], []
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            offsets = pa.array([0, array.size], type=pa.int64())
+            columns.append(pa.LargeListArray.from_arrays(offsets, pa.array(array.reshape(-1))))
+            fields.append(pa.field(key, columns[-1].type, metadata={"shape": json.dumps(list(array.shape))}))
+        batch = pa.RecordBatch.from_arrays(columns, schema=pa.schema(fields))
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+    else:
+        raise ValueError(f"Unsupported array file: {path}")
+
+# Extra field header ID for the padding record; zip readers skip IDs they don't know
+_PADDING_EXTRA_ID = 0x5050
+
+def _save_npz(path: Path, arrays: Dict[str, "np.ndarray"], alignment: int = 64):
+    """np.savez layout, with each member's local header padded so its data is aligned"""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for key, array in arrays.items():
+            info = zipfile.ZipInfo(f"{key}.npy", date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_STORED
+            # Local header: 30 bytes, the name, our padding record and the 20 byte zip64 record
+            offset = archive.fp.tell() + 30 + len(info.filename.encode("utf-8")) + 4 + 20
+            padding = -offset % alignment
+            info.extra = struct.pack("<HH", _PADDING_EXTRA_ID, padding) + b"\0" * padding
+            # The .npy header is itself padded to a multiple of 64 bytes
+            with archive.open(info, "w", force_zip64=True) as member:
+                np.lib.format.write_array(member, np.asanyarray(array), allow_pickle=False)
+
+def _map_npz(path: Path) -> Dict[str, "np.ndarray"]:
+    """Views of every stored member of an .npz file over a single mapping of it"""
+    mapped = np.memmap(path, dtype=np.uint8, mode="r") if path.stat().st_size else None
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            key = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                # Compressed members can't be mapped; decompress this one
+                arrays[key] = np.load(archive.open(info))
+                continue
+            # The local file header is 30 bytes plus the name and extra field
+            f.seek(info.header_offset)
+            header = f.read(30)
+            f.seek(info.header_offset + 30 + int.from_bytes(header[26:28], "little") + int.from_bytes(header[28:30], "little"))
+            major, _ = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            if dtype.hasobject:
+                raise ValueError(f"{path}:{key} holds Python objects and can't be memory-mapped")
+            start = f.tell()
+            count = int(np.prod(shape))
+            array = mapped[start:start + count * dtype.itemsize].view(dtype)
+            arrays[key] = array.reshape(shape, order="F" if fortran_order else "C")
+    return arrays
+
+def load_arrays(path: str, mmap: bool = True) -> Dict[str, "np.ndarray"]:
+    """
+    Read arrays written by save_arrays.
+
+    With mmap the arrays are read-only views of the memory-mapped file:
+    opening is O(1) and pages are read on first access, so consumers can
+    open large outputs without loading them. A .npy array is returned
+    under the key "arr_0".
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".npy":
+        return {"arr_0": np.load(path, mmap_mode="r" if mmap else None)}
+    if suffix == ".npz":
+        if mmap:
+            return _map_npz(path)
+        with np.load(path) as archive:
+            return {key: archive[key] for key in archive.files}
+    if suffix == ".arrow":
+        import pyarrow as pa # type: ignore
+
+        source = pa.memory_map(str(path), "r") if mmap else pa.OSFile(str(path), "rb")
+        batch = pa.ipc.open_file(source).get_batch(0)
+        arrays = {}
+        for field, column in zip(batch.schema, batch.columns):
+            shape = json.loads(field.metadata[b"shape"])
+            # Primitive values come back as views of the mapped buffer
+            arrays[field.name] = column.values.to_numpy(zero_copy_only=False).reshape(shape)
+        return arrays
+    raise ValueError(f"Unsupported array file: {path}")
+
+class ArrayShards:
+    """Binary files next to a JSONL output holding the arrays of its records"""
+
+    def __init__(self, directory: Path, save_format: str, max_bytes: int):
+        self.directory = directory
+        self.suffix = ARRAY_SUFFIXES[save_format]
+        self.max_bytes = max_bytes
+        self._arrays: Dict[str, Any] = {}
+        self._name: Optional[str] = None
+        self._bytes = 0
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def discard_from(self, records: int):
+        """Delete shards that only hold records past a resume point"""
+        for path in self.directory.glob(f"*{self.suffix}"):
+            if path.stem.isdigit() and int(path.stem) >= records:
+                path.unlink()
+
+    def add(self, index: int, arrays: Dict[str, Any]) -> str:
+        """Queue a record's arrays; returns the shard file they will be written to"""
+        if self._name is None:
+            # Named after its first record, so a resumed job overwrites what it redoes
+            self._name = f"{index:012d}{self.suffix}"
+        name = self._name
+        self._arrays.update(arrays)
+        self._bytes += sum(array.nbytes for array in arrays.values())
+        if self._bytes >= self.max_bytes:
+            self.flush()
+        return name
+
+    def flush(self):
+        """Write the current shard; must run before a checkpoint covers its records"""
+        if self._name is None:
+            return
+        path = self.directory / self._name
+        tmp = path.with_name(f"tmp-{path.name}")
+        save_arrays(str(tmp), self._arrays)
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._arrays, self._name, self._bytes = {}, None, 0
@@ -0,0 +1,148 @@
+from typing import Any, Dict, List, Optional, Sequence
+from dataclasses import dataclass
+import bisect
+import threading
+
+import torch # type: ignore
+
+@dataclass
+class PaddingStats:
+    """Real versus padded token counts across all padded batches"""
+    batches: int = 0
+    real_tokens: int = 0
+    padded_tokens: int = 0
+
+    @property
+    def efficiency(self) -> float:
+        """Fraction of computed positions that hold real tokens"""
+        return self.real_tokens / self.padded_tokens if self.padded_tokens else 1.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.__dict__, "padding_efficiency": self.efficiency}
+
+class BucketedPadder:
+    def __init__(
+        self,
+        tokenizer: Any,
+        max_length: int = 128,
+        strategy: str = "bucket",
+        buckets: Optional[Sequence[int]] = None,
+        pin_memory: bool = False
+    ):
+        """
+        Tokenize once, then pad batches only as far as they need.
+
+        Strategies:
+            max_length: pad every batch to max_length (the old behaviour)
+            longest: pad to the longest sequence in the batch
+            bucket: pad to the smallest configured bucket that fits the
+                longest sequence, so only a handful of shapes ever reach
+                the model
+
+        Padded inputs are written into per-bucket CPU buffers that are
+        allocated once per thread and reused for later batches; pinned
+        buffers make the following device copy asynchronous.
+
+        Args:
+            tokenizer: Hugging Face tokenizer
+            max_length: Truncation length
+            strategy: One of max_length, longest or bucket
+            buckets: Sorted bucket widths used by the bucket strategy
+            pin_memory: Allocate page-locked buffers for faster GPU copies
+        """
+        if strategy not in ("max_length", "longest", "bucket"):
+            raise ValueError(f"Unknown padding strategy: {strategy}")
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.strategy = strategy
+        self.buckets = sorted(b for b in (buckets or [16, 32, 64, 128]) if b < max_length) + [max_length]
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+        self.return_token_type_ids = "token_type_ids" in getattr(tokenizer, "model_input_names", ())
+        self.stats = PaddingStats()
+
+        self._buffers = threading.local()
+        self._lock = threading.Lock()
+
+    def encode(self, texts: Sequence[str]) -> List[List[int]]:
+        """Tokenize without padding, truncating to max_length"""
+        return self.tokenizer(
+            list(texts),
+            padding=False,
+            truncation=True,
+            max_length=self.max_length
+        )["input_ids"]
+
+    def width_for(self, length: int) -> int:
+        """Padded width used for a batch whose longest sequence has length tokens"""
+        if self.strategy == "max_length":
+            return self.max_length
+        if self.strategy == "longest":
+            return length
+        return self.buckets[min(bisect.bisect_left(self.buckets, length), len(self.buckets) - 1)]
+
+    def group(self, encoded: Sequence[Sequence[int]], max_batch_size: Optional[int] = None) -> List[List[int]]:
+        """
+        Group input indices so that sequences of similar length share a batch.
+
+        Indices are sorted by length and split at bucket boundaries (and at
+        max_batch_size), keeping each group's padding waste low.
+        """
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+        groups, current, current_width = [], [], None
+        for index in order:
+            width = self.width_for(len(encoded[index])) if self.strategy == "bucket" else None
+            if current and (width != current_width or (max_batch_size and len(current) >= max_batch_size)):
+                groups.append(current)
+                current = []
+            current.append(index)
+            current_width = width
+        if current:
+            groups.append(current)
+        return groups
+
+    def _buffer(self, width: int, rows: int) -> Dict[str, torch.Tensor]:
+        """Return this thread's reusable buffers for a width, grown to rows"""
+        buffers = getattr(self._buffers, "by_width", None)
+        if buffers is None:
+            buffers = self._buffers.by_width = {}
+        buffer = buffers.get(width)
+        if buffer is None or buffer["input_ids"].shape[0] < rows:
+            capacity = max(rows, 2 * buffer["input_ids"].shape[0]) if buffer is not None else rows
+            buffer = {"input_ids": torch.empty((capacity, width), dtype=torch.long, pin_memory=self.pin_memory)}
+            buffer["attention_mask"] = torch.empty_like(buffer["input_ids"])
+            if self.return_token_type_ids:
+                buffer["token_type_ids"] = torch.zeros_like(buffer["input_ids"])
+            buffers[width] = buffer
+        return buffer
+
+    def pad(self, sequences: Sequence[Sequence[int]]) -> Dict[str, torch.Tensor]:
+        """
+        Pad already tokenized sequences into model inputs.
+
+        The returned tensors are views into reused buffers: they stay valid
+        until the next pad() call with the same width on the same thread.
+        """
+        rows = len(sequences)
+        longest = max(len(seq) for seq in sequences)
+        width = self.width_for(longest)
+        buffer = self._buffer(width, rows)
+
+        input_ids = buffer["input_ids"][:rows]
+        attention_mask = buffer["attention_mask"][:rows]
+        input_ids.fill_(self.pad_token_id)
+        attention_mask.zero_()
+        for row, seq in enumerate(sequences):
+            input_ids[row, :len(seq)] = torch.as_tensor(seq, dtype=torch.long)
+            attention_mask[row, :len(seq)] = 1
+
+        real_tokens = sum(len(seq) for seq in sequences)
+        with self._lock:
+            self.stats.batches += 1
+            self.stats.real_tokens += real_tokens
+            self.stats.padded_tokens += rows * width
+
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if self.return_token_type_ids:
+            inputs["token_type_ids"] = buffer["token_type_ids"][:rows]
+        return inputs
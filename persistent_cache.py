@@ -0,0 +1,429 @@
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass
+from pathlib import Path
+import logging
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+
+from caching import LRUCache
+
+@dataclass
+class PersistenceSettings:
+    """Disk tier settings from the inference.caching.persistence config section"""
+    enabled: bool = False
+    path: str = "./cache"
+    format: str = "sqlite"
+    max_bytes: int = 1024 * 1024 * 1024
+    flush_interval: float = 0.5
+    flush_batch_size: int = 256
+    warmup_entries: int = 1000
+
+    @classmethod
+    def from_config(cls, persistence: Dict[str, Any]) -> "PersistenceSettings":
+        settings = cls(**{k: v for k, v in persistence.items() if k in cls.__dataclass_fields__})
+        if settings.enabled and settings.format != "sqlite":
+            raise ValueError(f"Unsupported cache persistence format: {settings.format}")
+        return settings
+
+def serialize(value: Any) -> bytes:
+    """Compact binary encoding for ModelOutput objects and response dicts"""
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+def deserialize(blob: bytes) -> Any:
+    # The cache file is written only by our own workers; do not point this at untrusted files
+    return pickle.loads(zlib.decompress(blob))
+
+class SQLiteStore:
+    # Bumped whenever the table layout changes; older files are rebuilt on open
+    _SCHEMA_VERSION = 2
+
+    # value goes last so size/accessed/expires_at stay on the row's leaf page
+    # instead of behind the BLOB's overflow pages
+    _SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            accessed REAL NOT NULL,
+            expires_at REAL,
+            value BLOB NOT NULL
+        )
+        """,
+        # Covers the eviction scan, which reads only accessed, size and rowid
+        "CREATE INDEX IF NOT EXISTS idx_cache_accessed_size ON cache_entries(accessed, size)",
+        "CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache_entries(expires_at) WHERE expires_at IS NOT NULL",
+        # Running byte total kept by triggers so eviction never sums the table
+        "CREATE TABLE IF NOT EXISTS cache_meta (total_bytes INTEGER NOT NULL)",
+        """
+        CREATE TRIGGER IF NOT EXISTS cache_entries_insert AFTER INSERT ON cache_entries BEGIN
+            UPDATE cache_meta SET total_bytes = total_bytes + new.size;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS cache_entries_delete AFTER DELETE ON cache_entries BEGIN
+            UPDATE cache_meta SET total_bytes = total_bytes - old.size;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS cache_entries_resize AFTER UPDATE OF size ON cache_entries BEGIN
+            UPDATE cache_meta SET total_bytes = total_bytes + new.size - old.size;
+        END
+        """
+    ]
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+        flush_interval: float = 0.5,
+        flush_batch_size: int = 256,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        SQLite-backed key/value store with batched write-behind.
+
+        The database runs in WAL mode so readers in several worker processes
+        never block each other or the writer. Writes are queued and flushed
+        by a background thread in one transaction per batch, after which the
+        store is trimmed back under max_bytes by dropping the least recently
+        accessed rows. Rows may carry a wall-clock expiry; expired rows are
+        never returned and are deleted at the next flush.
+
+        Args:
+            path: Database file path
+            max_bytes: Limit on the total size of stored values
+            flush_interval: Seconds between write-behind flushes
+            flush_batch_size: Maximum operations written per transaction
+            logger: Optional logger instance
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._local = threading.local()
+        self._create_schema(self._connect())
+
+        self._pending = queue.Queue()
+        self._closed = threading.Event()
+        self._error: Optional[BaseException] = None
+        self.failed_writes = 0
+        self._writer = threading.Thread(target=self._write_loop, name="cache-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Create the tables, rebuilding files written with an older layout"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Checked under the write lock; another process may have just migrated
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < self._SCHEMA_VERSION:
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(cache_entries)")}
+                if columns:
+                    self.logger.info(f"Migrating cache file {self.path} to schema version {self._SCHEMA_VERSION}")
+                    conn.execute("ALTER TABLE cache_entries RENAME TO cache_entries_old")
+                    conn.execute("DROP INDEX IF EXISTS idx_cache_accessed")
+                for statement in self._SCHEMA:
+                    conn.execute(statement)
+                if columns:
+                    expires_at = "expires_at" if "expires_at" in columns else "NULL"
+                    conn.execute(
+                        "INSERT INTO cache_entries (key, size, accessed, expires_at, value)"
+                        f" SELECT key, size, accessed, {expires_at}, value FROM cache_entries_old"
+                    )
+                    conn.execute("DROP TABLE cache_entries_old")
+                conn.execute("DELETE FROM cache_meta")
+                conn.execute("INSERT INTO cache_meta SELECT COALESCE(SUM(size), 0) FROM cache_entries")
+                conn.execute(f"PRAGMA user_version = {self._SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        """Return the stored value and its expiry time, or None if missing or expired"""
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM cache_entries"
+            " WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        # Refresh recency lazily through the writer instead of on the read path
+        self._pending.put(("touch", key, None, None))
+        return row[0], row[1]
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: str, blob: bytes, expires_at: Optional[float] = None):
+        """
+        Queue a write; it becomes durable at the next flush.
+
+        Args:
+            key: Entry key
+            blob: Serialized value
+            expires_at: Optional time.time() after which the entry is dropped
+        """
+        self._check_writer()
+        self._pending.put(("put", key, blob, expires_at))
+
+    def delete(self, key: str):
+        self._check_writer()
+        self._pending.put(("delete", key, None, None))
+
+    def _check_writer(self):
+        if self._error is not None:
+            raise RuntimeError(f"Cache writer stopped: {str(self._error)}") from self._error
+
+    def iter_recent(self, limit: int) -> Iterator[Tuple[str, bytes, Optional[float]]]:
+        """Yield (key, value, expires_at) for the most recently accessed live entries, newest first"""
+        cursor = self._connect().execute(
+            "SELECT key, value, expires_at FROM cache_entries"
+            " WHERE expires_at IS NULL OR expires_at > ?"
+            " ORDER BY accessed DESC LIMIT ?",
+            (time.time(), limit)
+        )
+        yield from cursor
+
+    def total_bytes(self) -> int:
+        return self._connect().execute("SELECT total_bytes FROM cache_meta").fetchone()[0]
+
+    def clear(self):
+        self.flush()
+        self._connect().execute("DELETE FROM cache_entries")
+
+    def _write_loop(self):
+        try:
+            while not self._closed.is_set() or not self._pending.empty():
+                try:
+                    first = self._pending.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = [first]
+                while len(batch) < self.flush_batch_size:
+                    try:
+                        batch.append(self._pending.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    self.logger.error(f"Cache write-behind failed: {str(e)}")
+                    # Retry one operation at a time so only the failing ones are dropped
+                    for operation in batch:
+                        try:
+                            self._write_batch([operation])
+                        except Exception as e:
+                            self.failed_writes += 1
+                            self.logger.error(f"Dropped cache {operation[0]} of {operation[1]}: {str(e)}")
+                finally:
+                    for _ in batch:
+                        self._pending.task_done()
+        except BaseException as e:
+            self._error = e
+            self.logger.error(f"Cache writer failed: {str(e)}")
+            # Release flush() callers; they will see the error
+            while True:
+                try:
+                    self._pending.get_nowait()
+                    self._pending.task_done()
+                except queue.Empty:
+                    break
+
+    def _write_batch(self, batch: List[Tuple[str, str, Optional[bytes], Optional[float]]]):
+        now = time.time()
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent
+        # processes serialize on busy_timeout instead of failing mid-batch
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op, key, blob, expires_at in batch:
+                if op == "put":
+                    # An upsert rather than INSERT OR REPLACE: REPLACE's implicit
+                    # delete skips the triggers that keep the byte total
+                    conn.execute(
+                        "INSERT INTO cache_entries (key, size, accessed, expires_at, value)"
+                        " VALUES (?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET"
+                        " size = excluded.size, accessed = excluded.accessed,"
+                        " expires_at = excluded.expires_at, value = excluded.value",
+                        (key, len(blob), now, expires_at, blob)
+                    )
+                elif op == "touch":
+                    conn.execute("UPDATE cache_entries SET accessed = ? WHERE key = ?", (now, key))
+                elif op == "delete":
+                    conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired rows, then least recently accessed rows until under the size budget"""
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        freed = 0
+        doomed = []
+        for rowid, size in conn.execute("SELECT rowid, size FROM cache_entries ORDER BY accessed ASC"):
+            doomed.append((rowid,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM cache_entries WHERE rowid = ?", doomed)
+
+    def flush(self):
+        """Block until all queued writes have been committed (or dropped after failing)"""
+        pending = self._pending
+        with pending.all_tasks_done:
+            # Stop waiting if the writer thread is gone rather than hang on work nobody drains
+            while pending.unfinished_tasks and self._error is None and self._writer.is_alive():
+                pending.all_tasks_done.wait(timeout=self.flush_interval)
+        self._check_writer()
+
+    def close(self):
+        self._closed.set()
+        self._writer.join()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class TieredCache:
+    def __init__(
+        self,
+        memory: LRUCache,
+        store: SQLiteStore,
+        warmup_entries: int = 0,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        In-memory LRU cache backed by a persistent SQLite tier.
+
+        Misses in memory fall through to disk and are promoted on hit. New
+        entries go to memory immediately and to disk via write-behind. The
+        most recently used disk entries are loaded into memory on startup.
+        The memory tier's TTL is stored with each disk entry, so an entry
+        expires at the same time in both tiers.
+
+        Args:
+            memory: In-memory LRU tier
+            store: Persistent SQLite tier
+            warmup_entries: Number of disk entries preloaded into memory
+            logger: Optional logger instance
+        """
+        self.memory = memory
+        self.store = store
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = memory.stats
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+        if warmup_entries:
+            self.warm_up(warmup_entries)
+
+    @classmethod
+    def from_settings(
+        cls,
+        memory: LRUCache,
+        settings: PersistenceSettings,
+        filename: str,
+        logger: Optional[logging.Logger] = None
+    ) -> "TieredCache":
+        store = SQLiteStore(
+            str(Path(settings.path) / filename),
+            max_bytes=settings.max_bytes,
+            flush_interval=settings.flush_interval,
+            flush_batch_size=settings.flush_batch_size,
+            logger=logger
+        )
+        return cls(memory, store, warmup_entries=settings.warmup_entries, logger=logger)
+
+    def warm_up(self, limit: int) -> int:
+        """Load up to limit of the most recently used disk entries into memory"""
+        loaded = 0
+        # Insert oldest first so the newest entries end up most recently used
+        for key, blob, expires_at in reversed(list(self.store.iter_recent(min(limit, self.memory.max_entries)))):
+            try:
+                self.memory.put(key, deserialize(blob), ttl_seconds=self._remaining(expires_at))
+                loaded += 1
+            except Exception as e:
+                self.logger.warning(f"Skipping unreadable cache entry: {str(e)}")
+        self.logger.info(f"Cache warm-up loaded {loaded} entries")
+        return loaded
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        entry = self.store.get_entry(key)
+        if entry is None:
+            self.disk_misses += 1
+            return default
+        blob, expires_at = entry
+        try:
+            value = deserialize(blob)
+        except Exception as e:
+            self.logger.warning(f"Dropping unreadable cache entry: {str(e)}")
+            self.store.delete(key)
+            return default
+        self.disk_hits += 1
+        self.memory.put(key, value, ttl_seconds=self._remaining(expires_at))
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self.memory.put(key, value)
+        ttl_seconds = self.memory.ttl_seconds
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        try:
+            self.store.put(key, serialize(value), expires_at=expires_at)
+        except Exception as e:
+            # The memory tier still serves the entry; only persistence is lost
+            self.logger.warning(f"Not persisting cache entry: {str(e)}")
+
+    @staticmethod
+    def _remaining(expires_at: Optional[float]) -> Optional[float]:
+        """Seconds a promoted disk entry has left, so promotion does not restart its TTL"""
+        if expires_at is None:
+            return None
+        # Floor keeps a just-expiring entry from falling back to the default TTL
+        return max(expires_at - time.time(), 1e-3)
+
+    def clear(self):
+        self.memory.clear()
+        self.store.clear()
+
+    def __len__(self) -> int:
+        return len(self.memory)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.memory.stats.snapshot(),
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+            "disk_failed_writes": self.store.failed_writes
+        }
+
+    def close(self):
+        self.store.close()
@@ -1,25 +1,24 @@
-from typing import Any, Dict, Optional, Union
-from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+import asyncio
 import logging
+import sys
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
-import torch # type: ignore
 from abc import ABC, abstractmethod
-
-@dataclass
-class ProcessedInput:
-    """Data class for storing processed input with metadata"""
-    data: Any
-    metadata: Dict[str, Any]
-    timestamp: float
-
-@dataclass
-class ModelOutput:
-    """Data class for storing model output with metadata"""
-    raw_output: Any
-    processed_output: Any
-    inference_time: float
-    metadata: Dict[str, Any]
+from batching import BatchSettings, DynamicBatcher
+from caching import CacheSettings, LRUCache, SingleFlight, make_cache_key
+from persistent_cache import PersistenceSettings, TieredCache
+from bulk import BulkRunner, BulkSettings
+from replica_pool import ReplicaPool
+from metrics import MetricsExporter, MetricsRegistry, MetricsSettings, get_registry, null_timer
+from tracing import ProfilingSettings, Tracer
+from autotune import AutotuneSettings, BatchAutotuner
+from startup import get_startup_profile
+from outputs import OutputSettings, convert_tensors
+from result_writer import ResultWriter, WriterSettings
+from columnar import InputBatch, ModelOutput, OutputBatch, ProcessedInput, input_text, preprocess, preprocess_batch
+import tracing
 
 class ModelWrapper(ABC):
     """Abstract base class for model wrappers"""
@@ -27,12 +26,31 @@ class ModelWrapper(ABC):
     def infer(self, processed_input: ProcessedInput) -> Any:
         pass
 
+    def infer_batch(self, processed_inputs: Sequence[ProcessedInput]) -> List[Any]:
+        """
+        Run inference on a batch of inputs, returning one output per input.
+
+        processed_inputs is a list of ProcessedInput objects or an
+        InputBatch, whose items are InputRow views with the same attributes
+        (its texts column holds every input's data at once).
+
+        Subclasses should override this with a single batched forward pass;
+        the default falls back to sequential per-item inference.
+        """
+        return [self.infer(processed_input) for processed_input in processed_inputs]
+
+    @property
+    def model_identity(self) -> str:
+        """Identifier of the served model, used to namespace cache keys"""
+        return type(self).__name__
+
 class InferencePipeline:
     def __init__(
         self,
         model_wrapper: ModelWrapper,
         config: Dict[str, Any],
-        logger: Optional[logging.Logger] = None
+        logger: Optional[logging.Logger] = None,
+        metrics: Optional[MetricsRegistry] = None
     ):
         """
         Enhanced inference pipeline with configuration and logging.
@@ -41,16 +59,178 @@ class InferencePipeline:
             model_wrapper: Model wrapper instance
             config: Configuration dictionary
             logger: Optional logger instance
+            metrics: Metrics registry (defaults to the process-wide registry)
         """
         self.model_wrapper = model_wrapper
         self.config = config
         self.logger = logger or logging.getLogger(__name__)
         self.executor = ThreadPoolExecutor(max_workers=config.get("num_workers", 4))
+        self.output_settings = OutputSettings.from_config(config.get("output", {}))
+        # Read once here rather than on every request
+        self._lowercase = config.get("preprocessing", {}).get("lowercase", True)
+        self._output_format = config.get("output", {}).get("format", "dict")
         
         # Initialize cache if enabled
-        self.cache = {}
-        self.cache_enabled = config.get("caching", {}).get("enabled", False)
-        self.cache_size = config.get("caching", {}).get("cache_size", 1000)
+        self.cache_settings = CacheSettings.from_config(self.config_section("caching"))
+        self.cache_enabled = self.cache_settings.enabled
+        self.cache_size = self.cache_settings.max_entries
+        self.cache = LRUCache(
+            max_entries=self.cache_settings.max_entries,
+            max_bytes=self.cache_settings.max_bytes,
+            ttl_seconds=self.cache_settings.ttl_seconds
+        )
+
+        # Back the in-memory cache with the SQLite tier when persistence is enabled
+        persistence = PersistenceSettings.from_config(
+            self.config_section("caching").get("persistence", {})
+        )
+        if self.cache_enabled and persistence.enabled:
+            self.cache = TieredCache.from_settings(
+                self.cache, persistence, "inference_cache.sqlite", logger=self.logger
+            )
+
+        # Route inference through the micro-batching scheduler when enabled
+        self.batch_settings = BatchSettings.from_config(self.config_section("batch_settings"))
+        # Keep every replica of a replicated wrapper busy with its own batch
+        self.batch_settings.max_concurrent_batches = max(
+            self.batch_settings.max_concurrent_batches,
+            getattr(self.model_wrapper, "max_concurrency", 1)
+        )
+        self.batcher = None
+        self.autotuner = None
+        if self.batch_settings.enabled:
+            batch_fn = self.model_wrapper.infer_batch
+            autotune = AutotuneSettings.from_config(
+                self.config_section("optimization").get("dynamic_optimization", {}),
+                self.config_section("batch_settings")
+            )
+            if autotune.enabled:
+                self.autotuner = BatchAutotuner(
+                    self.batch_settings,
+                    autotune,
+                    getattr(self.model_wrapper, "model_identity", type(self.model_wrapper).__name__),
+                    metrics=metrics,
+                    logger=self.logger
+                )
+                batch_fn = self.autotuner.wrap(batch_fn)
+            self.batcher = DynamicBatcher(
+                batch_fn,
+                self.batch_settings,
+                logger=self.logger
+            )
+
+        # Per-stage latency histograms and throughput counters
+        self.metrics_settings = MetricsSettings.from_config(self.config_section("monitoring").get("metrics", {}))
+        self.metrics = metrics or get_registry()
+        # Disabling metrics only turns this pipeline's timers off, not the shared registry's
+        self._timer = self.metrics.timer if self.metrics_settings.enabled else null_timer
+        self._init_metrics()
+
+        # Identical concurrent requests share one forward pass
+        self.in_flight = SingleFlight(self._coalesced_counter) if self.cache_settings.coalesce_requests else None
+        self.metrics_exporter = None
+        if self.metrics_settings.enabled and self.metrics_settings.exporters:
+            self.metrics_exporter = MetricsExporter(self.metrics, self.metrics_settings, logger=self.logger).start()
+
+        # Results are persisted to output.paths by a background writer
+        self.writer_settings = WriterSettings.from_config(self.config.get("output", {}))
+        self.result_writer = None
+        if self.writer_settings.enabled:
+            self.result_writer = ResultWriter(self.writer_settings, metrics=self.metrics, logger=self.logger)
+
+        # Sampled stage-level tracing exported as Chrome-trace files
+        self.tracer = Tracer(
+            ProfilingSettings.from_config(self.config_section("monitoring").get("profiling", {})),
+            logger=self.logger
+        )
+
+        # Warm up representative shapes (and search batch settings) before serving.
+        # Warmup loads the model, so with startup.lazy_load it waits for warm()
+        # or the first request that reaches the model
+        self._autotune_pending = self.autotuner is not None
+        self._autotune_lock = threading.Lock()
+        if not self.config_section("startup").get("lazy_load", True):
+            self._autotune_warmup()
+
+    @classmethod
+    def with_replicas(
+        cls,
+        wrapper_factory: Callable[[], ModelWrapper],
+        config: Dict[str, Any],
+        num_replicas: Optional[int] = None,
+        logger: Optional[logging.Logger] = None
+    ) -> "InferencePipeline":
+        """
+        Build a pipeline whose model runs in a pool of CPU worker processes.
+
+        The pool is only started when inference.performance.replicas.enabled
+        is set or num_replicas is given; otherwise the wrapper is built in
+        this process. Thread counts per replica come from
+        inference.performance.thread_settings and the replica count from
+        inference.performance.replicas (by default one replica per
+        intra_op_parallelism cores).
+
+        Args:
+            wrapper_factory: Picklable callable building a ModelWrapper in a worker
+            config: Configuration dictionary
+            num_replicas: Optional override of the configured replica count
+            logger: Optional logger instance
+        """
+        performance = dict(config.get("inference", {}).get("performance", {}))
+        replicas = performance.get("replicas", {})
+        if num_replicas is None and not replicas.get("enabled", False):
+            return cls(wrapper_factory(), config, logger=logger)
+        if num_replicas is not None:
+            performance["replicas"] = {**replicas, "num_replicas": num_replicas}
+        pool = ReplicaPool.from_config(wrapper_factory, performance, logger=logger)
+        return cls(pool, config, logger=logger)
+
+    def _init_metrics(self):
+        """Look up the pipeline's metrics once so the hot path skips the registry"""
+        model = getattr(self.model_wrapper, "model_identity", type(self.model_wrapper).__name__)
+        self._stage_latency = {
+            stage: self.metrics.histogram(
+                "pipeline_stage_seconds", "Latency of each pipeline stage", stage=stage, model=model
+            )
+            for stage in ("preprocess", "inference", "postprocess", "persist", "total")
+        }
+        self._requests_counter = self.metrics.counter("pipeline_requests_total", "Completed requests", model=model)
+        self._cache_hits_counter = self.metrics.counter("pipeline_cache_hits_total", "Requests served from cache", model=model)
+        self._errors_counter = self.metrics.counter("pipeline_errors_total", "Failed requests", model=model)
+        self._coalesced_counter = self.metrics.counter(
+            "pipeline_coalesced_requests_total", "Requests answered by an identical request already in flight", model=model
+        )
+        self.metrics.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self, registry: MetricsRegistry):
+        """Refresh queue depth and cache size gauges"""
+        if self.batcher is not None:
+            registry.gauge("batcher_queue_depth", "Requests waiting for a batch").set(self.batcher.stats.queue_depth)
+        registry.gauge("cache_entries", "Entries in the result cache").set(len(self.cache))
+
+    def _autotune_warmup(self):
+        """Run the autotuner's warmup and batch size search once"""
+        if not self._autotune_pending:
+            return
+        with self._autotune_lock:
+            if self._autotune_pending:
+                self.autotuner.warmup(self.model_wrapper.infer_batch, self._warmup_samples())
+                self._autotune_pending = False
+
+    def _warmup_samples(self) -> List[ProcessedInput]:
+        """One synthetic input per padding bucket so every shape gets compiled and measured"""
+        parameters = self.config.get("model", {}).get("parameters", {})
+        lengths = parameters.get("padding_buckets") or [16, 32, 64, 128]
+        max_length = parameters.get("max_seq_length")
+        if max_length:
+            lengths = sorted({min(length, max_length) for length in lengths} | {max_length})
+        return [self.preprocess_input(" ".join(["warmup"] * length)) for length in lengths]
+
+    def config_section(self, name: str) -> Dict[str, Any]:
+        """Look up a config section at top level or under the inference block"""
+        if name in self.config:
+            return self.config[name]
+        return self.config.get("inference", {}).get(name, {})
 
     def preprocess_input(self, input_data: Union[str, Dict[str, Any]]) -> ProcessedInput:
         """
@@ -63,47 +243,43 @@ class InferencePipeline:
             ProcessedInput object containing processed data and metadata
         """
         try:
-            self.logger.debug(f"Preprocessing input: {input_data[:100]}...")
-            
-            # Input validation
-            if not input_data:
-                raise ValueError("Empty input data")
-                
-            # Convert to string if necessary
-            if isinstance(input_data, dict):
-                input_text = input_data.get("text", "")
-            else:
-                input_text = str(input_data)
-            
-            # Apply preprocessing steps based on config
-            processed_data = input_text.strip()
-            if self.config.get("preprocessing", {}).get("lowercase", True):
-                processed_data = processed_data.lower()
-                
-            # Create metadata
-            metadata = {
-                "original_length": len(input_text),
-                "processed_length": len(processed_data),
-                "preprocessing_steps": ["strip", "lowercase"]
-            }
-            
-            return ProcessedInput(
-                data=processed_data,
-                metadata=metadata,
-                timestamp=time.time()
-            )
+            # Only format the message when it will be logged
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Preprocessing input: {input_text(input_data)[:100]}...")
+            return preprocess(input_data, self._lowercase)
             
         except Exception as e:
             self.logger.error(f"Preprocessing failed: {str(e)}")
             raise
 
-    def postprocess_output(self, model_output: Any, input_metadata: Dict[str, Any]) -> ModelOutput:
+    def preprocess_batch(self, inputs: Sequence[Union[str, Dict[str, Any]]]) -> InputBatch:
+        """
+        Preprocess many inputs into one columnar batch.
+        
+        Args:
+            inputs: Raw inputs
+            
+        Returns:
+            InputBatch with the normalized texts, their lengths and timestamps
+        """
+        try:
+            return preprocess_batch(inputs, self._lowercase)
+        except Exception as e:
+            self.logger.error(f"Batch preprocessing failed: {str(e)}")
+            raise
+
+    def postprocess_output(
+        self,
+        model_output: Any,
+        input_metadata: Union[ProcessedInput, Dict[str, Any]]
+    ) -> ModelOutput:
         """
         Enhanced postprocessing with configurable output formatting.
         
         Args:
             model_output: Raw model output
-            input_metadata: Metadata from input processing
+            input_metadata: The ProcessedInput (its metadata is then only
+                built if the output's metadata is read) or its metadata
             
         Returns:
             ModelOutput object containing processed output and metadata
@@ -111,36 +287,62 @@ class InferencePipeline:
         try:
             self.logger.debug("Postprocessing model output...")
             
-            # Convert tensor outputs to numpy/python types if necessary
-            if torch.is_tensor(model_output):
-                processed_output = model_output.cpu().numpy().tolist()
-            else:
-                processed_output = model_output
-                
-            # Format output based on config
-            output_format = self.config.get("output", {}).get("format", "dict")
-            if output_format == "dict":
-                final_output = {
-                    "result": processed_output,
-                    "confidence": self._calculate_confidence(processed_output)
-                }
+            if isinstance(input_metadata, dict):
+                processed_input, timestamp = None, input_metadata["timestamp"]
+                metadata = {"input_metadata": input_metadata, "output_format": self._output_format}
             else:
-                final_output = processed_output
-                
+                processed_input, timestamp, metadata = input_metadata, input_metadata.timestamp, None
             return ModelOutput(
-                raw_output=model_output,
-                processed_output=final_output,
-                inference_time=time.time() - input_metadata["timestamp"],
-                metadata={
-                    "input_metadata": input_metadata,
-                    "output_format": output_format
-                }
+                model_output,
+                self._format_output(self._convert_output(model_output)),
+                time.time() - timestamp,
+                metadata,
+                processed_input,
+                self._output_format
             )
             
         except Exception as e:
             self.logger.error(f"Postprocessing failed: {str(e)}")
             raise
 
+    def postprocess_batch(self, model_outputs: Sequence[Any], inputs: InputBatch) -> OutputBatch:
+        """
+        Postprocess the outputs of a batch in one pass.
+        
+        Args:
+            model_outputs: Raw model output per row of inputs
+            inputs: The batch the outputs were computed from
+            
+        Returns:
+            OutputBatch with the processed outputs and one inference time per row
+        """
+        try:
+            processed = [self._format_output(self._convert_output(output)) for output in model_outputs]
+            return OutputBatch(model_outputs, processed, time.time() - inputs.timestamps, inputs, self._output_format)
+        except Exception as e:
+            self.logger.error(f"Batch postprocessing failed: {str(e)}")
+            raise
+
+    def _convert_output(self, model_output: Any) -> Any:
+        """Convert tensor outputs to numpy/python types if necessary"""
+        # torch is only consulted once a model has imported it
+        torch = sys.modules.get("torch")
+        if self.output_settings.tensor_format == "numpy":
+            # Arrays sharing the tensors' memory instead of nested lists
+            return convert_tensors(model_output, "numpy")
+        if torch is not None and torch.is_tensor(model_output):
+            return model_output.cpu().numpy().tolist()
+        return model_output
+
+    def _format_output(self, processed_output: Any) -> Any:
+        """Format output based on config"""
+        if self._output_format == "dict":
+            return {
+                "result": processed_output,
+                "confidence": self._calculate_confidence(processed_output)
+            }
+        return processed_output
+
     def _calculate_confidence(self, output: Any) -> float:
         """Helper method to calculate confidence scores"""
         # Implement confidence calculation logic
@@ -156,42 +358,282 @@ class InferencePipeline:
         Returns:
             ModelOutput object containing final results
         """
+        with self.tracer.trace("process_input"):
+            return self._process_input(input_data)
+
+    def _process_input(self, input_data: Union[str, Dict[str, Any]]) -> ModelOutput:
+        timer = self._timer
         try:
-            # Check cache
-            cache_key = str(input_data)
-            if self.cache_enabled and cache_key in self.cache:
-                self.logger.info("Cache hit, returning cached result")
-                return self.cache[cache_key]
-            
             # Start timing
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # Preprocessing
-            processed_input = self.preprocess_input(input_data)
-            
-            # Model inference
-            model_output = self.model_wrapper.infer(processed_input)
+            with timer(self._stage_latency["preprocess"]), tracing.span("preprocess"):
+                processed_input = self.preprocess_input(input_data)
             
-            # Postprocessing
-            final_output = self.postprocess_output(model_output, processed_input.metadata)
-            
-            # Update cache
-            if self.cache_enabled:
-                if len(self.cache) >= self.cache_size:
-                    self.cache.pop(next(iter(self.cache)))
-                self.cache[cache_key] = final_output
+            # Check cache on the normalized input
+            cache_key = self._cache_key(processed_input)
+            with tracing.span("cache_lookup"):
+                cached_output = self._lookup_cache(cache_key)
+            if cached_output is not None:
+                self._persist(processed_input, cached_output)
+                return cached_output
+
+            if self.in_flight is not None:
+                final_output = self.in_flight.run(cache_key, lambda: self._run_model(processed_input, cache_key))
+            else:
+                final_output = self._run_model(processed_input, cache_key)
+            self._persist(processed_input, final_output)
             
             # Log performance metrics
-            self.logger.info(f"Processing completed in {time.time() - start_time:.3f}s")
+            elapsed = time.perf_counter() - start_time
+            self._stage_latency["total"].observe(elapsed)
+            if self.autotuner is not None:
+                self.autotuner.observe(elapsed)
+            self._requests_counter.inc()
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"Processing completed in {elapsed:.3f}s")
             
             return final_output
             
         except Exception as e:
+            self._errors_counter.inc()
             self.logger.error(f"Processing pipeline failed: {str(e)}")
             raise
 
+    def _run_model(self, processed_input: ProcessedInput, cache_key: str) -> ModelOutput:
+        """Inference, postprocessing and cache fill for a cache miss"""
+        timer = self._timer
+        self._autotune_warmup()
+
+        # Model inference, batched with concurrent requests when enabled
+        with timer(self._stage_latency["inference"]), tracing.span("inference"):
+            if self.batcher is not None:
+                model_output = self.batcher.infer(processed_input)
+            else:
+                model_output = self.model_wrapper.infer(processed_input)
+        
+        # Postprocessing
+        with timer(self._stage_latency["postprocess"]), tracing.span("postprocess"):
+            final_output = self.postprocess_output(model_output, processed_input)
+        
+        # Update cache
+        self._update_cache(cache_key, final_output)
+        return final_output
+
+    async def _run_model_async(self, processed_input: ProcessedInput, cache_key: str) -> ModelOutput:
+        timer = self._timer
+        if self._autotune_pending:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._autotune_warmup)
+
+        # Await the forward pass without blocking the event loop
+        with timer(self._stage_latency["inference"]), tracing.span("inference"):
+            if self.batcher is not None:
+                future = self.batcher.submit(processed_input)
+            else:
+                future = self._submit_to_executor(self.model_wrapper.infer, processed_input)
+            model_output = await asyncio.wrap_future(future)
+
+        with timer(self._stage_latency["postprocess"]), tracing.span("postprocess"):
+            final_output = self.postprocess_output(model_output, processed_input)
+        self._update_cache(cache_key, final_output)
+        return final_output
+
+    def _result_record(self, processed_input: ProcessedInput, final_output: ModelOutput) -> Dict[str, Any]:
+        """The line persisted for a result"""
+        record = {"timestamp": processed_input.timestamp, "inference_time": final_output.inference_time}
+        if self.writer_settings.include_inputs:
+            record["input"] = processed_input.data
+        record["output"] = final_output.processed_output
+        return record
+
+    def _persist(self, processed_input: ProcessedInput, final_output: ModelOutput):
+        """Hand a result to the background writer; blocks only while its queue is full"""
+        if self.result_writer is None:
+            return
+        with self._timer(self._stage_latency["persist"]), tracing.span("persist"):
+            self.result_writer.submit(self._result_record(processed_input, final_output))
+
+    async def _persist_async(self, processed_input: ProcessedInput, final_output: ModelOutput):
+        if self.result_writer is None:
+            return
+        with self._timer(self._stage_latency["persist"]), tracing.span("persist"):
+            await self.result_writer.submit_async(self._result_record(processed_input, final_output))
+
+    def _cache_key(self, processed_input: ProcessedInput) -> str:
+        """Build the cache key from the processed input and model identity"""
+        model_identity = getattr(self.model_wrapper, "model_identity", type(self.model_wrapper).__name__)
+        return make_cache_key(processed_input.data, model_identity)
+
+    def _lookup_cache(self, cache_key: str) -> Optional[ModelOutput]:
+        """Return the cached result for a key, if caching is enabled"""
+        if not self.cache_enabled:
+            return None
+        cached_output = self.cache.get(cache_key)
+        if cached_output is not None:
+            self._cache_hits_counter.inc()
+            self.logger.info("Cache hit, returning cached result")
+        return cached_output
+
+    def _update_cache(self, cache_key: str, final_output: ModelOutput):
+        """Store a result in the LRU cache"""
+        if self.cache_enabled:
+            self.cache.put(cache_key, final_output)
+
     async def process_input_async(self, input_data: Union[str, Dict[str, Any]]) -> ModelOutput:
         """
         Asynchronous version of process_input for high-throughput scenarios.
+
+        Pre- and postprocessing run inline while the forward pass is awaited
+        on the batching scheduler (or the executor), so the event loop stays
+        responsive. Cancelling the awaiting task withdraws the request if it
+        has not started running yet.
+        
+        Args:
+            input_data: Raw input data
+            
+        Returns:
+            ModelOutput object containing final results
+        """
+        with self.tracer.trace("process_input_async"):
+            return await self._process_input_async(input_data)
+
+    async def _process_input_async(self, input_data: Union[str, Dict[str, Any]]) -> ModelOutput:
+        timer = self._timer
+        try:
+            start_time = time.perf_counter()
+            with timer(self._stage_latency["preprocess"]), tracing.span("preprocess"):
+                processed_input = self.preprocess_input(input_data)
+
+            # Check cache on the normalized input
+            cache_key = self._cache_key(processed_input)
+            with tracing.span("cache_lookup"):
+                cached_output = self._lookup_cache(cache_key)
+            if cached_output is not None:
+                await self._persist_async(processed_input, cached_output)
+                return cached_output
+
+            if self.in_flight is not None:
+                final_output = await self.in_flight.run_async(
+                    cache_key, lambda: self._run_model_async(processed_input, cache_key)
+                )
+            else:
+                final_output = await self._run_model_async(processed_input, cache_key)
+            await self._persist_async(processed_input, final_output)
+
+            elapsed = time.perf_counter() - start_time
+            self._stage_latency["total"].observe(elapsed)
+            if self.autotuner is not None:
+                self.autotuner.observe(elapsed)
+            self._requests_counter.inc()
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"Processing completed in {elapsed:.3f}s")
+
+            return final_output
+
+        except Exception as e:
+            self._errors_counter.inc()
+            self.logger.error(f"Processing pipeline failed: {str(e)}")
+            raise
+
+    def _submit_to_executor(self, fn: Callable, *args) -> Any:
+        """Run fn on the executor, carrying sampled traces and recording queue wait"""
+        traces = tracing.active_traces()
+        if not traces:
+            return self.executor.submit(fn, *args)
+
+        enqueued = tracing.now()
+        def _run():
+            tracing.record_span("executor_queue_wait", enqueued, traces=traces)
+            with tracing.activate(traces):
+                return fn(*args)
+        return self.executor.submit(_run)
+
+    def process_file(self, input_path: str, output_path: str, resume: bool = True) -> Dict[str, Any]:
+        """
+        Bulk inference over a JSONL or CSV file with ordered, optionally gzipped output.
+        
+        Args:
+            input_path: JSONL or CSV input file (optionally .gz)
+            output_path: JSONL output file; with a binary output.save_format
+                the arrays go to files in "<output_path>.arrays"
+            resume: Continue from the last checkpoint if one exists
+            
+        Returns:
+            Summary with record counts and elapsed time
+        """
+        settings = BulkSettings.from_config(
+            self.config_section("bulk"),
+            self.config.get("output", {}).get("compression", {}),
+            batch_size=self.batch_settings.max_batch_size,
+            save_format=self.output_settings.save_format
+        )
+        return BulkRunner(self, settings, logger=self.logger).run(input_path, output_path, resume=resume)
+
+    @property
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counters of the result cache"""
+        return self.cache.snapshot()
+
+    @property
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """Requests that ran the model versus requests that joined an identical one in flight"""
+        return self.in_flight.snapshot() if self.in_flight is not None else {}
+
+    @property
+    def writer_stats(self) -> Dict[str, Any]:
+        """Records and bytes written, rotated files and time spent waiting on the result writer"""
+        return self.result_writer.snapshot() if self.result_writer is not None else {}
+
+    @property
+    def batch_stats(self) -> Dict[str, Any]:
+        """Queue depth and batch fill counters of the batching scheduler"""
+        return self.batcher.stats.snapshot() if self.batcher is not None else {}
+
+    def warm(self) -> Dict[str, Any]:
         """
-        return await self.executor.submit(self.process_input, input_data)
+        Materialize a lazily loaded model now instead of on the first request.
+
+        Also runs the autotuner's warmup and batch size search if it was
+        deferred by startup.lazy_load.
+
+        Returns:
+            The startup time breakdown (import, weight load, first inference)
+        """
+        if hasattr(self.model_wrapper, "warm"):
+            self.model_wrapper.warm()
+        self._autotune_warmup()
+        return get_startup_profile().report()
+
+    @property
+    def startup_report(self) -> Dict[str, Any]:
+        """Cold-start time spent importing, loading weights and running the first inference"""
+        return get_startup_profile().report()
+
+    @property
+    def autotune_stats(self) -> Dict[str, Any]:
+        """Batch settings chosen by the autotuner and its latency profile"""
+        return self.autotuner.chosen_settings if self.autotuner is not None else {}
+
+    @property
+    def latency_stats(self) -> Dict[str, Any]:
+        """p50/p95/p99 latency of every pipeline stage"""
+        return {stage: histogram.snapshot() for stage, histogram in self._stage_latency.items()}
+
+    def close(self):
+        """Flush pending batches and release worker threads"""
+        self.metrics.remove_collector(self._collect_metrics)
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        self.tracer.close()
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.autotuner is not None:
+            self.autotuner.close()
+        if self.result_writer is not None:
+            self.result_writer.close()
+        if isinstance(self.cache, TieredCache):
+            self.cache.close()
+        if hasattr(self.model_wrapper, "close"):
+            self.model_wrapper.close()
+        self.executor.shutdown()
@@ -0,0 +1,198 @@
+from typing import Dict, Optional, Sequence, Tuple
+from dataclasses import dataclass
+from collections import OrderedDict
+import threading
+
+@dataclass
+class PrefixCacheStats:
+    """Lookup and memory counters of the prefix cache"""
+    hits: int = 0
+    misses: int = 0
+    reused_tokens: int = 0
+    inserts: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+class _Node:
+    __slots__ = ("edge", "children", "parent", "depth", "kv", "size")
+
+    def __init__(self, edge: Tuple[int, ...], parent: Optional["_Node"], depth: int):
+        self.edge = edge
+        self.children: Dict[int, "_Node"] = {}
+        self.parent = parent
+        self.depth = depth
+        self.kv = None
+        self.size = 0
+
+def _kv_bytes(kv: Tuple) -> int:
+    return sum(t.element_size() * t.nelement() for layer in kv for t in layer)
+
+def _slice_kv(kv: Tuple, length: int) -> Tuple:
+    """Keep the first length positions of every key/value tensor"""
+    return tuple(tuple(t[:, :, :length] for t in layer) for layer in kv)
+
+class PrefixCache:
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, min_match_tokens: int = 4):
+        """
+        Token-level radix tree of precomputed past_key_values.
+
+        Each stored sequence keeps the KV cache of its tokens at the node
+        where it ends. Since a causal model's KV for the first m tokens only
+        depends on those tokens, a lookup can reuse any stored sequence that
+        shares a prefix with the prompt by slicing its KV down to the
+        shared length. Stored KV is evicted least recently used first once
+        max_bytes is exceeded.
+
+        Args:
+            max_bytes: Memory budget for stored KV tensors
+            min_match_tokens: Shortest shared prefix worth reusing
+        """
+        self.max_bytes = max_bytes
+        self.min_match_tokens = min_match_tokens
+        self.stats = PrefixCacheStats()
+
+        self._root = _Node((), None, 0)
+        self._lru = OrderedDict()
+        self._lock = threading.RLock()
+
+    def match(self, token_ids: Sequence[int]) -> Tuple[int, Optional[Tuple]]:
+        """
+        Find the longest cached prefix of token_ids.
+
+        At most len(token_ids) - 1 tokens are matched so the caller always
+        has at least one token left to feed for next-token logits.
+
+        Returns:
+            Tuple of (matched length, KV sliced to that length), or (0, None)
+        """
+        limit = len(token_ids) - 1
+        with self._lock:
+            node, matched = self._root, 0
+            while matched < limit:
+                child = node.children.get(token_ids[matched])
+                if child is None:
+                    break
+                common = 0
+                for a, b in zip(child.edge, token_ids[matched:limit]):
+                    if a != b:
+                        break
+                    common += 1
+                matched += common
+                node = child
+                if common < len(child.edge):
+                    break
+
+            source = self._find_kv(node) if matched >= self.min_match_tokens else None
+            if source is None:
+                self.stats.misses += 1
+                return 0, None
+
+            self._lru.move_to_end(source)
+            self.stats.hits += 1
+            self.stats.reused_tokens += matched
+            return matched, _slice_kv(source.kv, matched)
+
+    def _find_kv(self, node: _Node) -> Optional[_Node]:
+        """Return a node holding KV in the subtree rooted at node"""
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.kv is not None:
+                return current
+            stack.extend(current.children.values())
+        return None
+
+    def insert(self, token_ids: Sequence[int], kv: Tuple):
+        """Store the KV cache computed for token_ids"""
+        token_ids = tuple(token_ids)
+        size = _kv_bytes(kv)
+        if not token_ids or size > self.max_bytes:
+            return
+
+        with self._lock:
+            node, position = self._root, 0
+            while position < len(token_ids):
+                child = node.children.get(token_ids[position])
+                if child is None:
+                    leaf = _Node(token_ids[position:], node, len(token_ids))
+                    node.children[token_ids[position]] = leaf
+                    node = leaf
+                    position = len(token_ids)
+                    break
+                common = 0
+                for a, b in zip(child.edge, token_ids[position:]):
+                    if a != b:
+                        break
+                    common += 1
+                if common < len(child.edge):
+                    child = self._split(child, common)
+                node = child
+                position += common
+
+            # A longer stored sequence already covers this one
+            if node.kv is None and node.children:
+                covering = self._find_kv(node)
+                if covering is not None:
+                    self._lru.move_to_end(covering)
+                    return
+
+            if node.kv is not None:
+                self.stats.bytes -= node.size
+                self._lru.pop(node, None)
+            node.kv = kv
+            node.size = size
+            self._lru[node] = None
+            self.stats.bytes += size
+            self.stats.inserts += 1
+            self.stats.entries = len(self._lru)
+
+            # Shorter stored prefixes along the path are now redundant
+            ancestor = node.parent
+            while ancestor is not None:
+                if ancestor.kv is not None:
+                    self._drop(ancestor)
+                ancestor = ancestor.parent
+
+            while self.stats.bytes > self.max_bytes and self._lru:
+                victim = next(iter(self._lru))
+                self._drop(victim)
+                self._prune(victim)
+                self.stats.evictions += 1
+
+    def _split(self, child: _Node, at: int) -> _Node:
+        """Split child's edge after at tokens, returning the new middle node"""
+        parent = child.parent
+        middle = _Node(child.edge[:at], parent, parent.depth + at)
+        parent.children[child.edge[0]] = middle
+        child.edge = child.edge[at:]
+        child.parent = middle
+        middle.children[child.edge[0]] = child
+        return middle
+
+    def _drop(self, node: _Node):
+        self._lru.pop(node, None)
+        self.stats.bytes -= node.size
+        self.stats.entries = len(self._lru)
+        node.kv = None
+        node.size = 0
+
+    def _prune(self, node: _Node):
+        """Remove leaves that no longer hold KV"""
+        while node is not self._root and node.kv is None and not node.children:
+            parent = node.parent
+            del parent.children[node.edge[0]]
+            node = parent
+
+    def clear(self):
+        with self._lock:
+            self._root = _Node((), None, 0)
+            self._lru.clear()
+            self.stats.entries = 0
+            self.stats.bytes = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return self.stats.snapshot()
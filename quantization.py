@@ -0,0 +1,522 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field, replace
+from contextlib import contextmanager
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import statistics
+import time
+
+import torch # type: ignore
+import torch.nn.functional as F # type: ignore
+
+from backends import _tensor_outputs
+from startup import get_startup_profile
+
+METHODS = ("dynamic", "static", "weight_only")
+
+@dataclass
+class QuantizationSettings:
+    """Quantization settings from the model.quantization config section"""
+    enabled: bool = False
+    method: str = "dynamic"
+    bits: int = 8
+    group_size: int = 128
+    skip_modules: List[str] = field(default_factory=list)
+    cache_dir: str = "./cache/quantized"
+    calibration_data: Optional[str] = None
+    calibration_samples: int = 64
+
+    @classmethod
+    def from_config(cls, quantization: Dict[str, Any]) -> "QuantizationSettings":
+        method = quantization.get("method", "dynamic")
+        bits = int(quantization.get("bits", 8))
+        if method not in METHODS:
+            raise ValueError(f"Unknown quantization method {method}, expected one of {METHODS}")
+        if bits not in (4, 8) or (bits == 4 and method != "weight_only"):
+            raise ValueError(f"{bits}-bit quantization is not supported with method {method}")
+        return cls(
+            enabled=quantization.get("enabled", False),
+            method=method,
+            bits=bits,
+            group_size=int(quantization.get("group_size", 128)),
+            skip_modules=list(quantization.get("skip_modules", [])),
+            cache_dir=quantization.get("cache_dir", "./cache/quantized"),
+            calibration_data=quantization.get("calibration_data"),
+            calibration_samples=int(quantization.get("calibration_samples", 64))
+        )
+
+    @property
+    def label(self) -> str:
+        return f"{self.method}_int{self.bits}"
+
+def _quantize_per_channel(weight: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Symmetric int8 weight with one scale per output channel"""
+    scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+    return torch.round(weight / scale[:, None]).clamp(-127, 127).to(torch.int8), scale.float()
+
+def _reduce_range() -> bool:
+    # x86 int8 kernels can overflow with full-range activations
+    return torch.backends.quantized.engine in ("fbgemm", "x86")
+
+class _PackedInt8Linear(torch.nn.Module):
+    """Linear layer holding an int8 weight prepacked for the CPU quantized kernels"""
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.has_bias = bias
+        self._packed = None
+
+    @classmethod
+    def from_linear(cls, linear: torch.nn.Linear, **kwargs) -> "_PackedInt8Linear":
+        module = cls(linear.in_features, linear.out_features, linear.bias is not None, **kwargs)
+        weight, scale = _quantize_per_channel(linear.weight.detach().float())
+        module.set_weight(weight, scale, linear.bias.detach().float() if linear.bias is not None else None)
+        return module
+
+    def set_weight(self, weight: torch.Tensor, scale: torch.Tensor, bias: Optional[torch.Tensor]):
+        qweight = torch._make_per_channel_quantized_tensor(
+            weight.contiguous(), scale.double(), torch.zeros(self.out_features, dtype=torch.long), 0
+        )
+        self._packed = torch.ops.quantized.linear_prepack(qweight, bias)
+
+    # Serialized as plain int8 weight and scales so checkpoints stay portable and mappable
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        super()._save_to_state_dict(destination, prefix, keep_vars)
+        qweight, bias = torch.ops.quantized.linear_unpack(self._packed)
+        destination[prefix + "weight"] = qweight.int_repr()
+        destination[prefix + "weight_scale"] = qweight.q_per_channel_scales().float()
+        if bias is not None:
+            destination[prefix + "bias"] = bias
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs):
+        keys = [prefix + "weight", prefix + "weight_scale"]
+        if all(key in state_dict for key in keys):
+            weight, scale = state_dict.pop(keys[0]), state_dict.pop(keys[1])
+            bias = state_dict.pop(prefix + "bias", None)
+            self.set_weight(weight, scale, bias.float() if bias is not None else None)
+        else:
+            missing_keys.extend(key for key in keys if key not in state_dict)
+        super()._load_from_state_dict(state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs)
+
+    @property
+    def packed_bytes(self) -> int:
+        """Memory held by the packed weight, which is not a parameter or buffer"""
+        return self.out_features * (self.in_features + (8 if self.has_bias else 4))
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, bias={self.has_bias}"
+
+class DynamicInt8Linear(_PackedInt8Linear):
+    """int8 weights; activations quantized per call from their observed range"""
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.ops.quantized.linear_dynamic(x.float(), self._packed, _reduce_range()).to(x.dtype)
+
+class StaticInt8Linear(_PackedInt8Linear):
+    """int8 weights; activations quantized with a range fixed by calibration"""
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True):
+        super().__init__(in_features, out_features, bias)
+        self.register_buffer("input_scale", torch.tensor(1.0))
+        self.register_buffer("input_zero_point", torch.tensor(0, dtype=torch.long))
+
+    def set_input_range(self, low: float, high: float):
+        quant_max = 127 if _reduce_range() else 255
+        low, high = min(low, 0.0), max(high, 0.0)
+        scale = max((high - low) / quant_max, 1e-8)
+        self.input_scale.fill_(scale)
+        self.input_zero_point.fill_(int(min(max(round(-low / scale), 0), quant_max)))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.ops.quantized.linear_with_input_q_dq_qweight_dq_output_fp32(
+            x.float(), self.input_scale.item(), self.input_zero_point.item(), self._packed
+        ).to(x.dtype)
+
+class WeightOnlyLinear(torch.nn.Module):
+    # Above this many rows dequantizing once beats the fused int8 kernel
+    FUSED_MAX_ROWS = 16
+
+    def __init__(
+        self,
+        in_features: int,
+        out_features: int,
+        bias: bool = True,
+        bits: int = 8,
+        group_size: int = 128,
+        device: Any = None
+    ):
+        """
+        Linear layer with int8 or int4 weights and floating point activations.
+
+        Meant for memory-bound decoding: the weights take a quarter (int8)
+        or an eighth (int4) of their float32 size. int8 uses per-channel
+        scales and, on CPU with few rows, the fused int8 weight kernel;
+        int4 packs two weights per byte with a scale and offset per group
+        of group_size inputs and is dequantized on the fly.
+        """
+        super().__init__()
+        if bits == 4 and in_features % group_size:
+            raise ValueError(f"in_features {in_features} is not a multiple of group_size {group_size}")
+        self.in_features = in_features
+        self.out_features = out_features
+        self.bits = bits
+        self.group_size = group_size
+        if bits == 8:
+            self.register_buffer("weight", torch.empty((out_features, in_features), dtype=torch.int8, device=device))
+            self.register_buffer("weight_scale", torch.empty(out_features, device=device))
+        else:
+            self.register_buffer("weight", torch.empty((out_features, in_features // 2), dtype=torch.uint8, device=device))
+            self.register_buffer("weight_scale", torch.empty((out_features, in_features // group_size), device=device))
+            self.register_buffer("weight_offset", torch.empty((out_features, in_features // group_size), device=device))
+        self.register_buffer("bias", torch.empty(out_features, device=device) if bias else None)
+
+    @classmethod
+    def from_linear(cls, linear: torch.nn.Linear, bits: int = 8, group_size: int = 128) -> "WeightOnlyLinear":
+        module = cls(linear.in_features, linear.out_features, linear.bias is not None, bits, group_size, device="meta")
+        weight = linear.weight.detach().float()
+        if bits == 8:
+            module.weight, module.weight_scale = _quantize_per_channel(weight)
+        else:
+            groups = weight.reshape(linear.out_features, -1, group_size)
+            low, high = groups.amin(dim=-1), groups.amax(dim=-1)
+            scale = ((high - low) / 15).clamp(min=1e-8)
+            codes = torch.round((groups - low[..., None]) / scale[..., None]).clamp(0, 15).to(torch.uint8)
+            codes = codes.reshape(linear.out_features, -1)
+            module.weight = codes[:, 0::2] | (codes[:, 1::2] << 4)
+            module.weight_scale, module.weight_offset = scale, low
+        if linear.bias is not None:
+            module.bias = linear.bias.detach().float().clone()
+        return module.to(linear.weight.device)
+
+    def dequantize(self, dtype: torch.dtype) -> torch.Tensor:
+        if self.bits == 8:
+            return self.weight.to(dtype) * self.weight_scale.to(dtype)[:, None]
+        codes = torch.stack([self.weight & 0x0F, self.weight >> 4], dim=-1).reshape(self.out_features, -1, self.group_size)
+        weight = codes.to(dtype) * self.weight_scale.to(dtype)[..., None] + self.weight_offset.to(dtype)[..., None]
+        return weight.reshape(self.out_features, self.in_features)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        rows = x.numel() // self.in_features
+        if self.bits == 8 and x.device.type == "cpu" and rows <= self.FUSED_MAX_ROWS:
+            output = torch._weight_int8pack_mm(x.reshape(rows, self.in_features), self.weight, self.weight_scale.to(x.dtype))
+            output = output.reshape(*x.shape[:-1], self.out_features)
+            return output + bias if bias is not None else output
+        return F.linear(x, self.dequantize(x.dtype), bias)
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, bits={self.bits}, group_size={self.group_size}"
+
+def _matches(name: str, patterns: Sequence[str]) -> bool:
+    return any(name == pattern or name.endswith("." + pattern) or name.startswith(pattern + ".") for pattern in patterns)
+
+def _target_linears(model: torch.nn.Module, settings: QuantizationSettings) -> Dict[str, torch.nn.Linear]:
+    return {
+        name: module for name, module in model.named_modules()
+        if type(module) is torch.nn.Linear and not _matches(name, settings.skip_modules)
+        and not (settings.method == "weight_only" and settings.bits == 4 and module.in_features % settings.group_size)
+    }
+
+def _replace_module(model: torch.nn.Module, name: str, module: torch.nn.Module):
+    parent_name, _, child = name.rpartition(".")
+    setattr(model.get_submodule(parent_name) if parent_name else model, child, module)
+
+def _calibrate(model: torch.nn.Module, linears: Dict[str, torch.nn.Linear], calibration: Sequence[Dict[str, torch.Tensor]]) -> Dict[str, Tuple[float, float]]:
+    """Input range of every target layer over the calibration batches"""
+    ranges: Dict[str, Tuple[float, float]] = {}
+
+    def observer(name):
+        def hook(module, inputs):
+            x = inputs[0].detach()
+            low, high = ranges.get(name, (float("inf"), float("-inf")))
+            ranges[name] = (min(low, x.min().item()), max(high, x.max().item()))
+        return hook
+
+    handles = [linear.register_forward_pre_hook(observer(name)) for name, linear in linears.items()]
+    try:
+        with torch.inference_mode():
+            for batch in calibration:
+                model(**batch)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return ranges
+
+def quantize_model(
+    model: torch.nn.Module,
+    settings: QuantizationSettings,
+    calibration: Optional[Sequence[Dict[str, torch.Tensor]]] = None
+) -> torch.nn.Module:
+    """
+    Replace the model's nn.Linear layers with quantized ones, in place.
+
+    dynamic and static use the CPU int8 kernels and need the model on CPU;
+    static also needs calibration batches to fix each layer's input range.
+    weight_only works on any device.
+
+    Returns:
+        The quantized model
+    """
+    linears = _target_linears(model, settings)
+    if settings.method != "weight_only":
+        devices = {linear.weight.device.type for linear in linears.values()}
+        if devices - {"cpu"}:
+            raise ValueError(f"{settings.method} int8 quantization runs on CPU only, model is on {devices}")
+    if settings.method == "static":
+        if not calibration:
+            raise ValueError("static quantization needs calibration batches")
+        ranges = _calibrate(model, linears, calibration)
+
+    for name, linear in linears.items():
+        if settings.method == "dynamic":
+            quantized = DynamicInt8Linear.from_linear(linear)
+        elif settings.method == "static":
+            quantized = StaticInt8Linear.from_linear(linear)
+            # Layers calibration never reached keep the default unit range
+            if name in ranges:
+                quantized.set_input_range(*ranges[name])
+        else:
+            quantized = WeightOnlyLinear.from_linear(linear, settings.bits, settings.group_size)
+        _replace_module(model, name, quantized)
+    return model.eval()
+
+def _empty_module(kind: str, spec: Dict[str, Any], settings: QuantizationSettings) -> torch.nn.Module:
+    if kind == "WeightOnlyLinear":
+        return WeightOnlyLinear(spec["in_features"], spec["out_features"], spec["bias"], settings.bits, settings.group_size, device="meta")
+    cls = {"DynamicInt8Linear": DynamicInt8Linear, "StaticInt8Linear": StaticInt8Linear}[kind]
+    return cls(spec["in_features"], spec["out_features"], spec["bias"])
+
+@contextmanager
+def meta_parameters() -> Iterator[None]:
+    """
+    Create module parameters on the meta device while the block runs.
+
+    Buffers stay real, so non-persistent buffers computed in __init__
+    (position ids, rotary frequencies) survive, while weights cost nothing
+    until a checkpoint is assigned to them. Affects modules built by any
+    thread in the meantime, so only use it around a model constructor.
+    """
+    register_parameter = torch.nn.Module.register_parameter
+
+    def register_on_meta(module, name, param):
+        register_parameter(module, name, param)
+        if param is not None:
+            module._parameters[name] = type(param)(param.to("meta"), requires_grad=param.requires_grad)
+
+    torch.nn.Module.register_parameter = register_on_meta
+    try:
+        yield
+    finally:
+        torch.nn.Module.register_parameter = register_parameter
+
+def save_quantized(model: torch.nn.Module, directory: Path, settings: QuantizationSettings):
+    """Write the quantized state dict and a manifest of the replaced layers"""
+    directory.mkdir(parents=True, exist_ok=True)
+    modules = {
+        name: {
+            "kind": type(module).__name__,
+            "in_features": module.in_features,
+            "out_features": module.out_features,
+            "bias": getattr(module, "has_bias", getattr(module, "bias", None) is not None)
+        }
+        for name, module in model.named_modules()
+        if isinstance(module, (_PackedInt8Linear, WeightOnlyLinear))
+    }
+    tmp = directory / f"model.pt.{os.getpid()}.tmp"
+    torch.save(model.state_dict(), tmp)
+    os.replace(tmp, directory / "model.pt")
+    manifest = {"method": settings.method, "bits": settings.bits, "group_size": settings.group_size, "modules": modules}
+    (directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+def load_quantized(directory: Path, build_skeleton: Callable[[], torch.nn.Module], settings: QuantizationSettings) -> torch.nn.Module:
+    """
+    Rebuild a quantized model from save_quantized output without loading float weights.
+
+    The architecture is built with parameters on the meta device, the
+    quantized layers are swapped in empty and the checkpoint is mapped and
+    assigned, so weights are read straight from the quantized file.
+    """
+    manifest = json.loads((directory / "manifest.json").read_text())
+    with meta_parameters():
+        model = build_skeleton()
+    for name, spec in manifest["modules"].items():
+        _replace_module(model, name, _empty_module(spec["kind"], spec, settings))
+    state_dict = torch.load(directory / "model.pt", mmap=True, weights_only=True, map_location="cpu")
+    model.load_state_dict(state_dict, assign=True)
+    leftover = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers()) if tensor.is_meta]
+    if leftover:
+        raise ValueError(f"Quantized checkpoint is missing {len(leftover)} tensors, e.g. {leftover[:3]}")
+    return model.eval()
+
+def calibration_fingerprint(calibration: Optional[Sequence[Dict[str, torch.Tensor]]]) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    for batch in calibration or []:
+        for name in sorted(batch):
+            digest.update(name.encode())
+            digest.update(batch[name].cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+def quantized_checkpoint_dir(
+    model_identity: str,
+    settings: QuantizationSettings,
+    calibration: Optional[Sequence[Dict[str, torch.Tensor]]] = None
+) -> Path:
+    """Cache directory for one model, mode and calibration set"""
+    key = "|".join([
+        model_identity, settings.method, str(settings.bits), str(settings.group_size), ",".join(sorted(settings.skip_modules)),
+        calibration_fingerprint(calibration) if settings.method == "static" else "",
+        f"torch={torch.__version__}", torch.backends.quantized.engine
+    ])
+    digest = hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+    return Path(settings.cache_dir) / f"{settings.label}-{digest}"
+
+def load_or_quantize(
+    model_identity: str,
+    settings: QuantizationSettings,
+    load_float: Callable[[], torch.nn.Module],
+    build_skeleton: Optional[Callable[[], torch.nn.Module]] = None,
+    calibration: Optional[Sequence[Dict[str, torch.Tensor]]] = None,
+    logger: Optional[logging.Logger] = None
+) -> torch.nn.Module:
+    """
+    Load the cached quantized checkpoint, or quantize the float model once and cache it.
+
+    Args:
+        model_identity: Model name and revision, part of the cache key
+        settings: Quantization settings
+        load_float: Loads the float model (only called on a cache miss)
+        build_skeleton: Builds the architecture from its config; without it
+            cached checkpoints can't be used and the model is re-quantized
+        calibration: Input batches for static quantization
+        logger: Optional logger instance
+
+    Returns:
+        The quantized model
+    """
+    logger = logger or logging.getLogger(__name__)
+    directory = quantized_checkpoint_dir(model_identity, settings, calibration)
+    if build_skeleton is not None and (directory / "manifest.json").exists():
+        try:
+            with get_startup_profile().measure("weight_load", f"{model_identity} ({settings.label})"):
+                model = load_quantized(directory, build_skeleton, settings)
+            logger.info(f"Loaded {settings.label} checkpoint from {directory}")
+            return model
+        except Exception as e:
+            logger.warning(f"Ignoring unusable quantized checkpoint {directory}: {str(e)}")
+
+    model = load_float()
+    start = time.time()
+    quantize_model(model, settings, calibration)
+    logger.info(f"Quantized {model_identity} to {settings.label} in {time.time() - start:.2f}s")
+    if build_skeleton is not None:
+        try:
+            save_quantized(model, directory, settings)
+        except OSError as e:
+            logger.warning(f"Could not cache quantized checkpoint: {str(e)}")
+    return model
+
+def state_bytes(model: torch.nn.Module) -> int:
+    """Serialized size of a model's weights, counting shared tensors once"""
+    seen = set()
+    total = 0
+    for tensor in model.state_dict().values():
+        if not torch.is_tensor(tensor) or tensor.data_ptr() in seen:
+            continue
+        seen.add(tensor.data_ptr())
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+def output_agreement(expected: Any, actual: Any) -> Dict[str, Any]:
+    """
+    How closely quantized outputs follow the float model's.
+
+    Reports the max absolute difference and mean cosine similarity over
+    the last dimension for every output, plus top-1 agreement for logits.
+    """
+    expected, actual = _tensor_outputs(expected), _tensor_outputs(actual)
+    report: Dict[str, Any] = {}
+    for name, value in expected.items():
+        if name not in actual or actual[name].shape != value.shape or not value.is_floating_point():
+            continue
+        value, other = value.float(), actual[name].float()
+        entry = {
+            "max_abs_diff": (other - value).abs().max().item(),
+            "cosine_similarity": F.cosine_similarity(other.flatten(0, -2), value.flatten(0, -2), dim=-1).mean().item()
+        }
+        if name == "logits":
+            entry["top1_agreement"] = (other.argmax(-1) == value.argmax(-1)).float().mean().item()
+        report[name] = entry
+    return report
+
+def _merge_agreement(reports: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Worst max difference and mean similarity/agreement across batches"""
+    merged: Dict[str, Any] = {}
+    for name in reports[0] if reports else []:
+        entries = [report[name] for report in reports if name in report]
+        merged[name] = {
+            key: max(entry[key] for entry in entries) if key == "max_abs_diff" else statistics.fmean(entry[key] for entry in entries)
+            for key in entries[0]
+        }
+    return merged
+
+def compare_quantization(
+    load_float: Callable[[], torch.nn.Module],
+    modes: Sequence[QuantizationSettings],
+    inputs: Sequence[Dict[str, torch.Tensor]],
+    calibration: Optional[Sequence[Dict[str, torch.Tensor]]] = None,
+    iterations: int = 10,
+    logger: Optional[logging.Logger] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Measure latency, weight memory and output agreement of each mode against the float model.
+
+    Args:
+        load_float: Loads a fresh float model (each mode quantizes its own copy)
+        modes: Quantization settings to compare
+        inputs: Evaluation batches, run through every model
+        calibration: Calibration batches for static modes (defaults to inputs)
+        iterations: Timed passes over the inputs per model
+        logger: Optional logger instance
+
+    Returns:
+        Per mode ("float" plus each settings label): latency p50/p95 in ms
+        per batch, weight bytes, compression against float and agreement;
+        modes that fail report the error instead
+    """
+    logger = logger or logging.getLogger(__name__)
+
+    def measure(model):
+        timings: List[float] = []
+        with torch.inference_mode():
+            outputs = [model(**batch) for batch in inputs]
+            for _ in range(iterations):
+                for batch in inputs:
+                    start = time.perf_counter()
+                    model(**batch)
+                    timings.append(time.perf_counter() - start)
+        timings.sort()
+        return outputs, {
+            "latency_p50_ms": statistics.median(timings) * 1000,
+            "latency_p95_ms": timings[int(0.95 * (len(timings) - 1))] * 1000,
+            "weight_bytes": state_bytes(model)
+        }
+
+    reference = load_float().eval()
+    expected, results = measure(reference)
+    results = {"float": results}
+    for settings in modes:
+        try:
+            model = quantize_model(load_float().eval(), replace(settings, enabled=True), calibration or inputs)
+            actual, entry = measure(model)
+            entry["compression"] = results["float"]["weight_bytes"] / max(entry["weight_bytes"], 1)
+            entry["agreement"] = _merge_agreement([output_agreement(e, a) for e, a in zip(expected, actual)])
+            results[settings.label] = entry
+        except Exception as e:
+            logger.warning(f"{settings.label} quantization failed: {str(e)}")
+            results[settings.label] = {"error": f"{type(e).__name__}: {e}"}
+    return results
@@ -0,0 +1,268 @@
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import Future
+import itertools
+import logging
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import os
+import threading
+import time
+
+from startup import lazy_import
+
+torch = lazy_import("torch")
+
+def save_shared_weights(model: "torch.nn.Module", path: str) -> str:
+    """
+    Write a model's weights once so replicas can memory-map them.
+
+    Returns:
+        The checkpoint path
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.save(model.state_dict(), path)
+    return path
+
+def load_shared_weights(model: "torch.nn.Module", path: str) -> "torch.nn.Module":
+    """
+    Attach memory-mapped weights to a model skeleton without copying them.
+
+    The checkpoint is mapped copy-on-write and assigned to the module's
+    parameters directly, so every process mapping the same file shares one
+    set of physical pages through the page cache. Build the skeleton on the
+    meta device to avoid allocating weights that are immediately replaced.
+    """
+    state_dict = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+    model.load_state_dict(state_dict, assign=True)
+    return model.eval()
+
+class MappedModelFactory:
+    def __init__(self, build_model: Callable[[], "torch.nn.Module"], weights_path: str, wrap: Callable[["torch.nn.Module"], Any]):
+        """
+        Picklable factory that builds a wrapper around memory-mapped weights.
+
+        Args:
+            build_model: Builds the model architecture (called on the meta device)
+            weights_path: Checkpoint written by save_shared_weights
+            wrap: Turns the loaded module into an object with infer_batch()
+        """
+        self.build_model = build_model
+        self.weights_path = weights_path
+        self.wrap = wrap
+
+    def __call__(self) -> Any:
+        with torch.device("meta"):
+            model = self.build_model()
+        return self.wrap(load_shared_weights(model, self.weights_path))
+
+def _replica_main(index: int, wrapper_factory: Callable[[], Any], intra_op: int, inter_op: int, requests, responses):
+    """Worker process: pin thread counts, build the wrapper, serve batches"""
+    torch.set_num_threads(intra_op)
+    torch.set_num_interop_threads(inter_op)
+    try:
+        wrapper = wrapper_factory()
+    except Exception as e:
+        responses.send((index, None, None, f"{type(e).__name__}: {e}"))
+        return
+    responses.send((index, None, "ready", None))
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, items = message
+        try:
+            with torch.inference_mode():
+                outputs = wrapper.infer_batch(items)
+            responses.send((index, request_id, outputs, None))
+        except Exception as e:
+            # Exceptions are sent as text since not all of them pickle
+            responses.send((index, request_id, None, f"{type(e).__name__}: {e}"))
+
+class ReplicaPool:
+    def __init__(
+        self,
+        wrapper_factory: Callable[[], Any],
+        num_replicas: int,
+        intra_op_threads: int = 1,
+        inter_op_threads: int = 1,
+        start_method: str = "spawn",
+        model_identity: str = "replica-pool",
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Pool of model replicas in worker processes.
+
+        Each worker pins its intra-op and inter-op thread counts and builds
+        its wrapper through wrapper_factory, which should map shared weights
+        (see MappedModelFactory) so resident memory does not grow with the
+        number of replicas. Requests are routed to the replica with the
+        fewest outstanding items. The pool exposes infer/infer_batch and can
+        be passed to InferencePipeline in place of a ModelWrapper.
+
+        Args:
+            wrapper_factory: Picklable callable building a wrapper inside a worker
+            num_replicas: Number of worker processes
+            intra_op_threads: torch intra-op threads per worker
+            inter_op_threads: torch inter-op threads per worker
+            start_method: multiprocessing start method
+            model_identity: Identity used to namespace cache keys
+            logger: Optional logger instance
+        """
+        self.num_replicas = num_replicas
+        self.max_concurrency = num_replicas
+        self.model_identity = model_identity
+        self.logger = logger or logging.getLogger(__name__)
+
+        context = mp.get_context(start_method)
+        self._requests = [context.Queue() for _ in range(num_replicas)]
+        # One response pipe per replica: a replica killed mid-write cannot
+        # block the others, and its pipe reports EOF once it is gone
+        pipes = [context.Pipe(duplex=False) for _ in range(num_replicas)]
+        self._responses = [reader for reader, _ in pipes]
+        self._processes = [
+            context.Process(
+                target=_replica_main,
+                args=(index, wrapper_factory, intra_op_threads, inter_op_threads, self._requests[index], pipes[index][1]),
+                name=f"replica-{index}",
+                daemon=True
+            )
+            for index in range(num_replicas)
+        ]
+        self._wake, self._waker = mp.Pipe(duplex=False)
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending: Dict[int, Any] = {}
+        self._load = [0] * num_replicas
+        self._completed = [0] * num_replicas
+        self._closed = False
+
+        for process in self._processes:
+            process.start()
+        for _, writer in pipes:
+            writer.close()
+        self._wait_ready()
+
+        self._collector = threading.Thread(target=self._collect, name="replica-collector", daemon=True)
+        self._collector.start()
+
+    @classmethod
+    def from_config(cls, wrapper_factory: Callable[[], Any], performance: Dict[str, Any], logger: Optional[logging.Logger] = None) -> "ReplicaPool":
+        """Build a pool from the inference.performance config section"""
+        threads = performance.get("thread_settings", {})
+        intra_op = int(threads.get("intra_op_parallelism", 1))
+        inter_op = int(threads.get("inter_op_parallelism", 1))
+        num_replicas = int(performance.get("replicas", {}).get("num_replicas", 0))
+        if num_replicas <= 0:
+            num_replicas = max(1, (os.cpu_count() or 1) // intra_op)
+        return cls(
+            wrapper_factory,
+            num_replicas,
+            intra_op_threads=intra_op,
+            inter_op_threads=inter_op,
+            model_identity=getattr(wrapper_factory, "model_identity", "replica-pool"),
+            logger=logger
+        )
+
+    def _wait_ready(self, timeout: float = 600.0):
+        deadline = time.monotonic() + timeout
+        starting = list(self._responses)
+        while starting:
+            ready = wait(starting, timeout=max(0.0, deadline - time.monotonic()))
+            if not ready:
+                self.close()
+                raise RuntimeError("Timed out waiting for replicas to start")
+            for connection in ready:
+                index = self._responses.index(connection)
+                try:
+                    _, _, status, error = connection.recv()
+                except EOFError:
+                    error = f"exited with code {self._processes[index].exitcode}"
+                if error is not None:
+                    self.close()
+                    raise RuntimeError(f"Replica {index} failed to start: {error}")
+                starting.remove(connection)
+        self.logger.info(f"Started {self.num_replicas} model replicas")
+
+    def submit(self, items: List[Any]) -> Future:
+        """Send a batch to the least-loaded replica"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Replica pool is closed")
+            replica = min(range(self.num_replicas), key=self._load.__getitem__)
+            if self._load[replica] == float("inf"):
+                raise RuntimeError("No live replicas")
+            request_id = next(self._ids)
+            self._pending[request_id] = (future, replica, len(items))
+            self._load[replica] += len(items)
+        self._requests[replica].put((request_id, items))
+        return future
+
+    def infer(self, item: Any) -> Any:
+        return self.submit([item]).result()[0]
+
+    def infer_batch(self, items: List[Any]) -> List[Any]:
+        return self.submit(items).result()
+
+    def _collect(self):
+        """Resolve futures from worker responses and detect dead replicas"""
+        listening = [self._wake, *self._responses]
+        while not self._closed:
+            for ready in wait(listening):
+                if ready is self._wake:
+                    return
+                try:
+                    self._resolve(*ready.recv())
+                except EOFError:
+                    # The pipe closes when its replica exits, after every
+                    # response it sent has been read
+                    listening.remove(ready)
+                    self._fail_replica(self._responses.index(ready))
+
+    def _resolve(self, index: int, request_id: int, outputs: Any, error: Optional[str]):
+        with self._lock:
+            future, replica, size = self._pending.pop(request_id)
+            self._load[replica] -= size
+            self._completed[replica] += size
+        if error is not None:
+            future.set_exception(RuntimeError(f"Replica {index} failed: {error}"))
+        else:
+            future.set_result(outputs)
+
+    def _fail_replica(self, index: int):
+        """Fail the requests of a replica that exited and stop routing to it"""
+        process = self._processes[index]
+        process.join(timeout=1)
+        if not self._closed:
+            self.logger.error(f"Replica {index} exited with code {process.exitcode}")
+        with self._lock:
+            dead = [rid for rid, (_, replica, _) in self._pending.items() if replica == index]
+            entries = [self._pending.pop(rid) for rid in dead]
+            self._load[index] = float("inf")
+        for future, _, _ in entries:
+            future.set_exception(RuntimeError(f"Replica {index} exited with code {process.exitcode}"))
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "replicas": self.num_replicas,
+                "outstanding": list(self._load),
+                "completed": list(self._completed),
+                "alive": [process.is_alive() for process in self._processes]
+            }
+
+    def close(self):
+        self._closed = True
+        for requests in self._requests:
+            requests.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        # Wake the collector so it notices the pool is closed
+        self._waker.send(None)
+        if hasattr(self, "_collector"):
+            self._collector.join(timeout=5)
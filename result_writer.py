@@ -0,0 +1,419 @@
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from string import Template
+import asyncio
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import MetricsRegistry, get_registry
+from outputs import SAVE_FORMATS, ArrayShards, convert_tensors, json_default, split_arrays
+
+COMPRESSION_EXECUTORS = ("thread", "process")
+
+def resolve_paths(paths: Dict[str, str]) -> Dict[str, str]:
+    """Expand ${name} references between the entries of output.paths"""
+    resolved = dict(paths)
+    for _ in range(len(resolved)):
+        expanded = {key: Template(value).safe_substitute(resolved) for key, value in resolved.items()}
+        if expanded == resolved:
+            break
+        resolved = expanded
+    return resolved
+
+@dataclass
+class WriterSettings:
+    """Result writer settings from the output.writer, output.paths, output.compression and output.save_format config"""
+    enabled: bool = False
+    directory: str = "./output/predictions"
+    file_prefix: str = "predictions"
+    save_format: str = "json"
+    compress: bool = False
+    compression_level: int = 6
+    compression_workers: int = 2
+    compression_executor: str = "thread"
+    queue_size: int = 1024
+    batch_size: int = 256
+    flush_interval: float = 0.5
+    fsync_interval: Optional[float] = 5.0
+    rotate_bytes: Optional[int] = 256 * 1024 * 1024
+    rotate_seconds: Optional[float] = 3600.0
+    include_inputs: bool = True
+
+    @classmethod
+    def from_config(cls, output: Dict[str, Any]) -> "WriterSettings":
+        writer = output.get("writer", {})
+        compression = output.get("compression", {})
+        algorithm = compression.get("algorithm", "gzip")
+        if compression.get("enabled", False) and algorithm != "gzip":
+            raise ValueError(f"Unsupported output compression: {algorithm}")
+        paths = resolve_paths(output.get("paths", {}))
+        rotate_mb = writer.get("rotate_mb", 256)
+        settings = cls(
+            enabled=writer.get("enabled", False),
+            directory=writer.get("directory", paths.get("model_outputs", "./output/predictions")),
+            file_prefix=writer.get("file_prefix", "predictions"),
+            save_format=output.get("save_format", "json"),
+            compress=compression.get("enabled", False),
+            compression_level=int(compression.get("level", 6)),
+            compression_workers=int(writer.get("compression_workers", 2)),
+            compression_executor=writer.get("compression_executor", "thread"),
+            queue_size=int(writer.get("queue_size", 1024)),
+            batch_size=int(writer.get("batch_size", 256)),
+            flush_interval=float(writer.get("flush_interval", 0.5)),
+            fsync_interval=writer.get("fsync_interval", 5.0),
+            rotate_bytes=int(rotate_mb * 1024 * 1024) if rotate_mb else None,
+            rotate_seconds=writer.get("rotate_seconds", 3600.0) or None,
+            include_inputs=writer.get("include_inputs", True)
+        )
+        if settings.save_format not in SAVE_FORMATS:
+            raise ValueError(f"Unsupported output save_format: {settings.save_format}")
+        if settings.compression_executor not in COMPRESSION_EXECUTORS:
+            raise ValueError(f"Unsupported compression_executor: {settings.compression_executor}")
+        if settings.queue_size < 1 or settings.batch_size < 1:
+            raise ValueError("Result writer queue_size and batch_size must be positive")
+        return settings
+
+@dataclass
+class WriterStats:
+    """Records, bytes, files and time submitters spent blocked on a full queue"""
+    submitted: int = 0
+    written: int = 0
+    batches: int = 0
+    bytes_written: int = 0
+    files: int = 0
+    fsyncs: int = 0
+    blocked_submits: int = 0
+    blocked_seconds: float = 0.0
+    queue_depth: int = 0
+    completed_files: List[str] = field(default_factory=list)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.__dict__, "completed_files": list(self.completed_files)}
+
+def _compress(data: bytes, level: int) -> bytes:
+    # Module level so a process pool can pickle it
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+class _OutputFile:
+    """The file being written, under a .part name until it is rotated out"""
+
+    def __init__(self, path: Path, save_format: str, rotate_bytes: Optional[int]):
+        self.path = path
+        self.part = path.with_name(path.name + ".part")
+        self.stream = open(self.part, "wb")
+        self.opened = time.monotonic()
+        self.bytes = 0
+        self.raw_bytes = 0
+        self.shards = None
+        if save_format != "json":
+            # The same layout as bulk outputs, so bulk.iter_outputs reads these files too
+            self.shards = ArrayShards(
+                Path(str(path) + ".arrays"), save_format, rotate_bytes or 256 * 1024 * 1024
+            )
+
+    def estimated_bytes(self, pending_raw: int) -> float:
+        """Size once pending raw bytes are written, at the compression ratio seen so far"""
+        ratio = self.bytes / self.raw_bytes if self.raw_bytes else 1.0
+        return self.bytes + pending_raw * ratio
+
+    def sync(self):
+        if self.shards is not None:
+            self.shards.flush()
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+
+    def close(self):
+        self.sync()
+        self.stream.close()
+        os.replace(self.part, self.path)
+
+class ResultWriter:
+    def __init__(
+        self,
+        settings: Optional[WriterSettings] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Background writer persisting results to rotated JSONL files.
+
+        submit() puts a record on a bounded queue and returns; a writer
+        thread collects records into batches of up to batch_size (waiting
+        at most flush_interval for a batch to fill), serializes them and
+        hands each batch to a compression pool, writing the compressed
+        batches back in submission order as separate gzip members. When the
+        queue is full submit() blocks until the writer catches up, so a slow
+        disk slows producers down instead of losing results; the time spent
+        blocked is recorded in result_writer_backpressure_seconds.
+
+        Files are written as "<name>.part" and renamed once they exceed
+        rotate_bytes or are older than rotate_seconds, so anything without
+        the suffix is complete. Data is fsynced every fsync_interval seconds
+        (after every batch with 0, only on rotation and close with None).
+        With a binary save_format the arrays in a record's "output" go to
+        shard files in "<name>.arrays", as for bulk outputs.
+
+        Args:
+            settings: Writer settings
+            metrics: Metrics registry for writer counters and queue depth
+            logger: Optional logger instance
+        """
+        self.settings = settings or WriterSettings()
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = WriterStats()
+        self._queue: queue.Queue = queue.Queue(maxsize=self.settings.queue_size)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._next_index = 0
+        self._file_seq = 0
+        self._file: Optional[_OutputFile] = None
+        self._last_sync = time.monotonic()
+        # Batches being compressed, in write order: (future, raw bytes, records)
+        self._pending: deque = deque()
+
+        self._compressor: Optional[Executor] = None
+        if self.settings.compress:
+            if self.settings.compression_executor == "process":
+                self._compressor = ProcessPoolExecutor(max_workers=self.settings.compression_workers)
+            else:
+                # zlib releases the GIL while compressing, so threads run in parallel
+                self._compressor = ThreadPoolExecutor(
+                    max_workers=self.settings.compression_workers, thread_name_prefix="result-compress"
+                )
+
+        self._metrics = metrics or get_registry()
+        self._records_counter = self._metrics.counter("result_writer_records_total", "Results written to disk")
+        self._bytes_counter = self._metrics.counter("result_writer_bytes_total", "Bytes written to result files")
+        self._backpressure = self._metrics.histogram(
+            "result_writer_backpressure_seconds", "Time submitters waited for room in the result queue"
+        )
+        self._metrics.add_collector(self._collect_metrics)
+
+        Path(self.settings.directory).mkdir(parents=True, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name="result-writer", daemon=True)
+        self._writer.start()
+
+    def submit(self, record: Dict[str, Any]):
+        """
+        Queue a record for writing, blocking while the queue is full.
+
+        Raises:
+            RuntimeError: If the writer is closed or has failed
+        """
+        self._check_open()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            start = time.perf_counter()
+            while True:
+                self._check_open()
+                try:
+                    self._queue.put(record, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            waited = time.perf_counter() - start
+            self._backpressure.observe(waited)
+            with self._lock:
+                self.stats.blocked_submits += 1
+                self.stats.blocked_seconds += waited
+        with self._lock:
+            self.stats.submitted += 1
+
+    async def submit_async(self, record: Dict[str, Any]):
+        """Queue a record, waiting off the event loop when the queue is full"""
+        self._check_open()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, self.submit, record)
+            return
+        with self._lock:
+            self.stats.submitted += 1
+
+    def _check_open(self):
+        self._check_error()
+        if self._closed.is_set():
+            raise RuntimeError("Result writer is closed")
+
+    def _write_loop(self):
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                if batch:
+                    self._write_batch(batch)
+                self._drain(wait=False)
+                self._maybe_sync()
+                if self._file is not None and self._rotation_due(0):
+                    self._rotate()
+            self._finish_file()
+        except BaseException as e:
+            self._error = e
+            self.logger.error(f"Result writer failed: {str(e)}")
+            # Release producers blocked on the queue; they will see the error
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:
+                    break
+
+    def _next_batch(self) -> Optional[List[Dict[str, Any]]]:
+        """Up to batch_size records, collected for at most flush_interval; None once closed and empty"""
+        try:
+            first = self._queue.get(timeout=self.settings.flush_interval)
+        except queue.Empty:
+            return None if self._closed.is_set() else []
+        batch = [first]
+        deadline = time.monotonic() + self.settings.flush_interval
+        while len(batch) < self.settings.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed.is_set():
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        if self._file is not None and self._rotation_due(sum(raw for _, raw, _ in self._pending)):
+            # Everything in flight belongs to the current file
+            self._drain(wait=True)
+            if self._rotation_due(0):
+                self._rotate()
+        if self._file is None:
+            self._open_file()
+
+        lines = []
+        for record in batch:
+            line = {"index": self._next_index, **record}
+            if self._file.shards is not None and "output" in record:
+                line["output"], arrays = split_arrays(
+                    convert_tensors(record["output"], "numpy"), prefix=str(self._next_index)
+                )
+                if arrays:
+                    line["arrays"] = self._file.shards.add(self._next_index, arrays)
+                    self._file.bytes += sum(array.nbytes for array in arrays.values())
+            lines.append(json.dumps(line, default=json_default))
+            self._next_index += 1
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+
+        if self._compressor is not None:
+            future = self._compressor.submit(_compress, data, self.settings.compression_level)
+        else:
+            future = Future()
+            future.set_result(data)
+        self._pending.append((future, len(data), len(batch)))
+        # Keep every compression worker busy while bounding memory held in flight
+        while len(self._pending) > 2 * self.settings.compression_workers:
+            self._write_next()
+
+    def _drain(self, wait: bool):
+        """Write compressed batches in order; without wait only those already done"""
+        while self._pending and (wait or self._pending[0][0].done()):
+            self._write_next()
+
+    def _write_next(self):
+        future, raw, records = self._pending.popleft()
+        data = future.result()
+        self._file.stream.write(data)
+        self._file.bytes += len(data)
+        self._file.raw_bytes += raw
+        self._bytes_counter.inc(len(data))
+        self._records_counter.inc(records)
+        with self._lock:
+            self.stats.written += records
+            self.stats.batches += 1
+            self.stats.bytes_written += len(data)
+        for _ in range(records):
+            self._queue.task_done()
+
+    def _rotation_due(self, pending_raw: int) -> bool:
+        settings = self.settings
+        if settings.rotate_seconds and time.monotonic() - self._file.opened >= settings.rotate_seconds:
+            return True
+        return bool(settings.rotate_bytes) and self._file.estimated_bytes(pending_raw) >= settings.rotate_bytes
+
+    def _maybe_sync(self):
+        interval = self.settings.fsync_interval
+        if self._file is None or interval is None or time.monotonic() - self._last_sync < interval:
+            return
+        self._file.sync()
+        self._last_sync = time.monotonic()
+        with self._lock:
+            self.stats.fsyncs += 1
+
+    def _open_file(self):
+        suffix = ".jsonl.gz" if self.settings.compress else ".jsonl"
+        name = f"{self.settings.file_prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._file_seq:05d}{suffix}"
+        self._file_seq += 1
+        self._file = _OutputFile(Path(self.settings.directory) / name, self.settings.save_format, self.settings.rotate_bytes)
+        with self._lock:
+            self.stats.files += 1
+
+    def _rotate(self):
+        path = self._file.path
+        self._finish_file()
+        self.logger.info(f"Rotated result file {path}")
+
+    def _finish_file(self):
+        """Write what is in flight, fsync and publish the current file under its final name"""
+        if self._file is None:
+            return
+        self._drain(wait=True)
+        self._file.close()
+        self._last_sync = time.monotonic()
+        with self._lock:
+            self.stats.fsyncs += 1
+            self.stats.completed_files.append(str(self._file.path))
+        self._file = None
+
+    def _collect_metrics(self, registry: MetricsRegistry):
+        registry.gauge("result_writer_queue_depth", "Results waiting to be written").set(self._queue.qsize())
+
+    def flush(self):
+        """Block until every submitted record has been written (not necessarily fsynced)"""
+        while self._queue.unfinished_tasks and self._error is None and self._writer.is_alive():
+            time.sleep(0.01)
+        self._check_error()
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError(f"Result writer failed: {str(self._error)}") from self._error
+
+    @property
+    def completed_files(self) -> List[str]:
+        """Files that have been rotated out or closed"""
+        with self._lock:
+            return list(self.stats.completed_files)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self.stats.queue_depth = self._queue.qsize()
+            return self.stats.snapshot()
+
+    def close(self):
+        """Write everything queued, publish the current file and stop the writer"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._writer.join()
+        if self._compressor is not None:
+            self._compressor.shutdown()
+        self._metrics.remove_collector(self._collect_metrics)
+        self._check_error()
@@ -0,0 +1,368 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+from metrics import get_registry
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+# Thresholds reported by SemanticCacheStats.snapshot, to compare against the configured one
+REPORTED_THRESHOLDS = (0.8, 0.85, 0.9, 0.95, 0.98)
+
+# Similarity distribution resolution: bins of 0.01 over [-1, 1]
+_SIMILARITY_BINS = 200
+
+# Embeddings of missed prompts kept for the put() that follows the generation
+_MAX_PENDING = 1024
+
+@dataclass
+class SemanticCacheSettings:
+    """
+    Semantic response cache settings from the inference.caching.semantic config section.
+
+    threshold is the cosine similarity a cached prompt needs to answer a
+    new one; raise it if paraphrase hits return wrong answers, lower it if
+    the hit rate is poor. The similarity distribution in the stats shows
+    what hit rate other thresholds would give.
+    """
+    enabled: bool = False
+    encoder: str = "sentence-transformers/all-MiniLM-L6-v2"
+    threshold: float = 0.92
+    max_entries: int = 10000
+    ttl_seconds: Optional[float] = None
+    pooling: str = "mean"
+    max_length: int = 128
+
+    @classmethod
+    def from_config(cls, semantic: Dict[str, Any]) -> "SemanticCacheSettings":
+        settings = cls(**{k: v for k, v in semantic.items() if k in cls.__dataclass_fields__})
+        if not -1.0 <= settings.threshold <= 1.0:
+            raise ValueError(f"Semantic cache threshold must be within [-1, 1], got {settings.threshold}")
+        if settings.max_entries < 1:
+            raise ValueError(f"Semantic cache max_entries must be positive, got {settings.max_entries}")
+        return settings
+
+@dataclass
+class SemanticCacheStats:
+    """Lookup outcomes and the distribution of best-match similarities"""
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0
+    empty: int = 0
+    expirations: int = 0
+    evictions: int = 0
+    inserts: int = 0
+    entries: int = 0
+    similarity_bins: List[int] = field(default_factory=lambda: [0] * _SIMILARITY_BINS)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def observe(self, similarity: float):
+        index = int((similarity + 1.0) * _SIMILARITY_BINS / 2)
+        self.similarity_bins[min(max(index, 0), _SIMILARITY_BINS - 1)] += 1
+
+    def similarity_quantile(self, q: float) -> Optional[float]:
+        """Lower edge of the bin holding the q-quantile of best-match similarities"""
+        total = sum(self.similarity_bins)
+        if not total:
+            return None
+        seen = 0
+        for index, count in enumerate(self.similarity_bins):
+            seen += count
+            if seen > q * (total - 1):
+                return index * 2 / _SIMILARITY_BINS - 1.0
+        return 1.0
+
+    def hit_rate_at(self, threshold: float) -> float:
+        """Share of lookups whose best match reached threshold (ignoring TTL)"""
+        if not self.lookups:
+            return 0.0
+        first = int(round((threshold + 1.0) * _SIMILARITY_BINS / 2))
+        return sum(self.similarity_bins[first:]) / self.lookups
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = {k: v for k, v in self.__dict__.items() if k != "similarity_bins"}
+        return {
+            **stats,
+            "hit_rate": self.hit_rate,
+            "similarity_p50": self.similarity_quantile(0.5),
+            "similarity_p90": self.similarity_quantile(0.9),
+            "hit_rate_at": {threshold: self.hit_rate_at(threshold) for threshold in REPORTED_THRESHOLDS}
+        }
+
+@dataclass
+class SemanticHit:
+    value: Any
+    similarity: float
+
+@dataclass
+class _Entry:
+    namespace: Hashable
+    row: int
+    value: Any
+    expires_at: Optional[float]
+
+class _Partition:
+    """Embeddings of one namespace's entries as the rows of a dense matrix"""
+
+    def __init__(self, dim: int):
+        self.vectors = np.empty((16, dim), dtype=np.float32)
+        self.keys: List[Hashable] = []
+
+    def add(self, key: Hashable, vector: "np.ndarray") -> int:
+        row = len(self.keys)
+        if row == len(self.vectors):
+            grown = np.empty((2 * row, self.vectors.shape[1]), dtype=np.float32)
+            grown[:row] = self.vectors
+            self.vectors = grown
+        self.vectors[row] = vector
+        self.keys.append(key)
+        return row
+
+    def remove(self, row: int) -> Optional[Hashable]:
+        """Drop a row by moving the last one into its place; returns the moved key"""
+        last = len(self.keys) - 1
+        moved = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.keys[row] = moved = self.keys[last]
+        self.keys.pop()
+        return moved
+
+    def search(self, queries: "np.ndarray") -> Any:
+        """Best row and its similarity for each query"""
+        scores = queries @ self.vectors[:len(self.keys)].T
+        rows = scores.argmax(axis=1)
+        return rows, scores[np.arange(len(rows)), rows]
+
+class SemanticCache:
+    def __init__(
+        self,
+        encoder: Any,
+        threshold: float = 0.92,
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Response cache that also answers paraphrases of cached prompts.
+
+        Prompts are embedded with encoder (anything with an embed(texts)
+        method returning one row per text, normally a TextEncoder) and a
+        lookup returns the value of the most similar cached prompt in the
+        same namespace, if its cosine similarity reaches threshold.
+        Namespaces keep responses from answering prompts generated with a
+        different mode or sampling config.
+
+        A lookup batch is embedded in one encoder call and searched with
+        one matrix product per namespace. Entries are evicted least
+        recently used first once there are more than max_entries.
+
+        Args:
+            encoder: Sentence encoder
+            threshold: Minimum cosine similarity of a hit
+            max_entries: Maximum number of entries across namespaces
+            ttl_seconds: Optional time-to-live per entry
+            logger: Optional logger instance
+        """
+        self.encoder = encoder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = SemanticCacheStats()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._partitions: Dict[Hashable, _Partition] = {}
+        # Embeddings computed by lookup() for prompts that missed, reused by put()
+        self._pending: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._owns_encoder = False
+        # Embeds prompts put() without a pending embedding off the caller's thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-cache")
+
+        metrics = get_registry()
+        self._requests = {
+            outcome: metrics.counter("semantic_cache_requests_total", "Semantic cache lookups by outcome", outcome=outcome)
+            for outcome in ("hit", "miss")
+        }
+        self._similarity = metrics.histogram("semantic_cache_similarity", "Similarity of the best cached match per lookup")
+        self._evictions = metrics.counter("semantic_cache_evictions_total", "Semantic cache entries evicted")
+        self._entries_gauge = metrics.gauge("semantic_cache_entries", "Entries in the semantic cache")
+
+    @classmethod
+    def from_settings(
+        cls,
+        settings: SemanticCacheSettings,
+        encoder: Optional[Any] = None,
+        device: str = "auto",
+        logger: Optional[logging.Logger] = None
+    ) -> "SemanticCache":
+        """Cache for settings, with a TextEncoder for settings.encoder unless encoder is given"""
+        if encoder is None:
+            from embeddings import TextEncoder
+
+            encoder = TextEncoder(
+                settings.encoder,
+                device=device,
+                pooling=settings.pooling,
+                max_length=settings.max_length,
+                logger=logger
+            )
+            owns_encoder = True
+        else:
+            owns_encoder = False
+        cache = cls(
+            encoder,
+            threshold=settings.threshold,
+            max_entries=settings.max_entries,
+            ttl_seconds=settings.ttl_seconds,
+            logger=logger
+        )
+        cache._owns_encoder = owns_encoder
+        return cache
+
+    def _embed(self, prompts: Sequence[str]) -> "np.ndarray":
+        vectors = np.asarray(self.encoder.embed(list(prompts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def lookup(self, prompts: Sequence[str], namespaces: Sequence[Hashable]) -> List[Optional[SemanticHit]]:
+        """
+        Find cached responses for several prompts at once.
+
+        Returns:
+            A SemanticHit or None for each prompt, in order
+        """
+        if not prompts:
+            return []
+        prompts = [prompt.strip() for prompt in prompts]
+        vectors = self._embed(prompts)
+        groups: Dict[Hashable, List[int]] = {}
+        for index, namespace in enumerate(namespaces):
+            groups.setdefault(namespace, []).append(index)
+
+        results: List[Optional[SemanticHit]] = [None] * len(prompts)
+        similarities = []
+        now = time.monotonic()
+        with self._lock:
+            for namespace, indices in groups.items():
+                partition = self._partitions.get(namespace)
+                if partition is None:
+                    self.stats.empty += len(indices)
+                    continue
+                rows, scores = partition.search(vectors[indices])
+                # Resolve keys first: removing an expired entry moves rows around
+                keys = [partition.keys[row] for row in rows]
+                for index, key, score in zip(indices, keys, scores.tolist()):
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        continue
+                    self.stats.observe(score)
+                    similarities.append(score)
+                    if entry.expires_at is not None and entry.expires_at <= now:
+                        self._remove(key)
+                        self.stats.expirations += 1
+                    elif score >= self.threshold:
+                        self._entries.move_to_end(key)
+                        results[index] = SemanticHit(entry.value, score)
+
+            for index, prompt in enumerate(prompts):
+                if results[index] is None:
+                    self._pending[(prompt, namespaces[index])] = vectors[index]
+                    self._pending.move_to_end((prompt, namespaces[index]))
+            while len(self._pending) > _MAX_PENDING:
+                self._pending.popitem(last=False)
+
+            hits = sum(result is not None for result in results)
+            self.stats.lookups += len(prompts)
+            self.stats.hits += hits
+            self.stats.misses += len(prompts) - hits
+            self.stats.entries = len(self._entries)
+            self._entries_gauge.set(len(self._entries))
+
+        self._requests["hit"].inc(hits)
+        self._requests["miss"].inc(len(prompts) - hits)
+        for similarity in similarities:
+            self._similarity.observe(max(similarity, 0.0))
+        return results
+
+    def put(self, prompt: str, namespace: Hashable, value: Any):
+        """
+        Cache value for prompt.
+
+        Prompts that just missed a lookup reuse its embedding; others are
+        embedded on a background thread, so this never blocks on the encoder.
+        """
+        prompt = prompt.strip()
+        with self._lock:
+            vector = self._pending.pop((prompt, namespace), None)
+        if vector is not None:
+            self._insert(prompt, namespace, value, vector)
+        else:
+            self._executor.submit(self._embed_and_insert, prompt, namespace, value)
+
+    def _embed_and_insert(self, prompt: str, namespace: Hashable, value: Any):
+        try:
+            self._insert(prompt, namespace, value, self._embed([prompt])[0])
+        except Exception as e:
+            self.logger.error(f"Semantic cache insert failed: {str(e)}")
+
+    def _insert(self, prompt: str, namespace: Hashable, value: Any, vector: "np.ndarray"):
+        key = (prompt, namespace)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                partition = self._partitions[namespace] = _Partition(len(vector))
+            self._entries[key] = _Entry(namespace, partition.add(key, vector), value, expires_at)
+            self.stats.inserts += 1
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+            self.stats.evictions += evicted
+            self.stats.entries = len(self._entries)
+            self._entries_gauge.set(len(self._entries))
+        if evicted:
+            self._evictions.inc(evicted)
+
+    def _remove(self, key: Hashable):
+        """Remove an entry; the lock must be held"""
+        entry = self._entries.pop(key)
+        partition = self._partitions[entry.namespace]
+        moved = partition.remove(entry.row)
+        if moved is not None:
+            self._entries[moved].row = entry.row
+        if not partition.keys:
+            del self._partitions[entry.namespace]
+
+    def flush(self):
+        """Wait for background inserts queued so far"""
+        self._executor.submit(lambda: None).result()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._partitions.clear()
+            self._pending.clear()
+            self.stats.entries = 0
+            self._entries_gauge.set(0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats.snapshot(), "threshold": self.threshold}
+
+    def close(self):
+        """Finish background inserts and release the encoder if this cache created it"""
+        self._executor.shutdown(wait=True)
+        if self._owns_encoder:
+            self.encoder.close()
@@ -0,0 +1,218 @@
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Optional, Union
+from dataclasses import dataclass
+import asyncio
+import logging
+
+from pipeline import InferencePipeline, ModelOutput
+
+class QueueFullError(RuntimeError):
+    """Raised when a request cannot be admitted before its admission timeout"""
+
+@dataclass
+class ServingSettings:
+    """Admission and concurrency limits from the inference.serving config section"""
+    max_queue_size: int = 1024
+    max_in_flight: int = 64
+    admission_timeout: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, serving: Dict[str, Any]) -> "ServingSettings":
+        return cls(
+            max_queue_size=int(serving.get("max_queue_size", 1024)),
+            max_in_flight=max(1, int(serving.get("max_in_flight", 64))),
+            admission_timeout=serving.get("admission_timeout")
+        )
+
+@dataclass
+class ServingStats:
+    """Counters for admitted, rejected and completed requests"""
+    admitted: int = 0
+    rejected: int = 0
+    cancelled: int = 0
+    completed: int = 0
+    failed: int = 0
+    in_flight: int = 0
+    queue_depth: int = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+class AsyncInferenceServer:
+    def __init__(
+        self,
+        pipeline: InferencePipeline,
+        settings: Optional[ServingSettings] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Asyncio-native serving front end for an InferencePipeline.
+
+        Requests pass through a bounded admission queue: when it is full,
+        callers wait (backpressure) or fail with QueueFullError after the
+        admission timeout. A fixed pool of worker tasks caps the number of
+        requests in flight. A caller that goes away cancels its request,
+        whether it is still queued or already waiting on the model.
+
+        Args:
+            pipeline: Inference pipeline used to serve requests
+            settings: Admission and concurrency settings
+            logger: Optional logger instance
+        """
+        self.pipeline = pipeline
+        self.settings = settings or ServingSettings.from_config(pipeline.config_section("serving"))
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = ServingStats()
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._stopping = False
+
+    async def start(self):
+        """Create the admission queue and spawn the worker tasks"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.settings.max_queue_size)
+        self._stopping = False
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.settings.max_in_flight)
+        ]
+        self.pipeline.metrics.add_collector(self._collect_metrics)
+
+    async def stop(self):
+        """Cancel the worker tasks and fail any requests still queued or in flight"""
+        self.pipeline.metrics.remove_collector(self._collect_metrics)
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    def _collect_metrics(self, registry):
+        """Refresh admission queue and in-flight gauges"""
+        registry.gauge("server_queue_depth", "Requests waiting for admission").set(self.stats.queue_depth)
+        registry.gauge("server_in_flight", "Requests being processed").set(self.stats.in_flight)
+        registry.gauge("server_rejected", "Requests rejected by backpressure").set(self.stats.rejected)
+
+    async def __aenter__(self) -> "AsyncInferenceServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def infer(self, input_data: Union[str, Dict[str, Any]]) -> ModelOutput:
+        """
+        Admit a request and await its result.
+
+        Args:
+            input_data: Raw input data
+
+        Returns:
+            ModelOutput object containing final results
+        """
+        if not self._workers:
+            await self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(
+                self._queue.put((input_data, future)),
+                timeout=self.settings.admission_timeout
+            )
+        except asyncio.TimeoutError:
+            self.stats.rejected += 1
+            raise QueueFullError(
+                f"Admission queue full ({self.settings.max_queue_size} requests)"
+            )
+        self.stats.admitted += 1
+        self.stats.queue_depth = self._queue.qsize()
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # The client went away; the worker sees the cancelled future
+            future.cancel()
+            raise
+
+    async def _worker(self):
+        while True:
+            input_data, future = await self._queue.get()
+            self.stats.queue_depth = self._queue.qsize()
+            try:
+                if future.cancelled():
+                    self.stats.cancelled += 1
+                    continue
+                await self._serve(input_data, future)
+            finally:
+                self._queue.task_done()
+
+    async def _serve(self, input_data: Any, future: asyncio.Future):
+        """Run one request, propagating client cancellation into the pipeline"""
+        task = asyncio.ensure_future(self.pipeline.process_input_async(input_data))
+        cancel_on_abandon = lambda f: task.cancel() if f.cancelled() else None
+        future.add_done_callback(cancel_on_abandon)
+
+        self.stats.in_flight += 1
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self.stats.cancelled += 1
+            else:
+                # The server is stopping; release the client before the worker exits
+                future.set_exception(RuntimeError("Server stopped"))
+            if self._stopping:
+                raise
+        except Exception as e:
+            self.stats.failed += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.stats.completed += 1
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self.stats.in_flight -= 1
+            future.remove_done_callback(cancel_on_abandon)
+
+    async def stream(
+        self,
+        inputs: Union[Iterable[Any], AsyncIterable[Any]],
+        window: Optional[int] = None
+    ) -> AsyncIterator[ModelOutput]:
+        """
+        Process a stream of inputs, yielding results in input order.
+
+        At most window requests are outstanding at once, so the input
+        iterable is consumed lazily and memory stays bounded.
+
+        Usage:
+            async for output in server.stream(texts):
+                ...
+        """
+        window = window or self.settings.max_in_flight
+        pending = []
+        try:
+            async for input_data in _aiter(inputs):
+                pending.append(asyncio.ensure_future(self.infer(input_data)))
+                if len(pending) >= window:
+                    yield await pending.pop(0)
+            while pending:
+                yield await pending.pop(0)
+        finally:
+            for task in pending:
+                task.cancel()
+
+async def _aiter(inputs: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+    """Iterate over a sync or async iterable"""
+    if hasattr(inputs, "__aiter__"):
+        async for item in inputs:
+            yield item
+    else:
+        for item in inputs:
+            yield item
@@ -0,0 +1,293 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+import logging
+import threading
+import time
+
+import torch # type: ignore
+import torch.nn.functional as F # type: ignore
+
+from generation import GenerationResult, from_legacy_cache, next_token_probs, to_legacy_cache
+from metrics import MetricsRegistry, get_registry
+
+@dataclass
+class SpeculativeSettings:
+    """
+    Speculative decoding settings.
+
+    num_draft_tokens maps a generation mode (a ModelMode value) to the
+    number of tokens the draft model proposes per target pass; modes that
+    are missing or set to 0 decode normally. Predictable modes such as
+    coding accept more draft tokens, so they can use a longer draft.
+    """
+    enabled: bool = False
+    draft_model: Optional[str] = None
+    num_draft_tokens: Dict[str, int] = field(
+        default_factory=lambda: {"standard": 3, "technical": 4, "coding": 6}
+    )
+
+    @classmethod
+    def from_config(cls, speculative: Dict[str, Any]) -> "SpeculativeSettings":
+        settings = cls(**{k: v for k, v in speculative.items() if k in cls.__dataclass_fields__})
+        for mode, tokens in settings.num_draft_tokens.items():
+            if not isinstance(tokens, int) or tokens < 0:
+                raise ValueError(f"num_draft_tokens for {mode} must be a non-negative integer, got {tokens!r}")
+        return settings
+
+    def draft_tokens_for(self, mode: str) -> int:
+        return self.num_draft_tokens.get(mode, 0) if self.enabled else 0
+
+@dataclass
+class SpeculativeStats:
+    """Draft proposals, acceptances and time split between the two models"""
+    requests: int = 0
+    proposed_tokens: int = 0
+    accepted_tokens: int = 0
+    generated_tokens: int = 0
+    target_passes: int = 0
+    draft_passes: int = 0
+    target_seconds: float = 0.0
+    draft_seconds: float = 0.0
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted_tokens / self.proposed_tokens if self.proposed_tokens else 0.0
+
+    @property
+    def tokens_per_target_pass(self) -> float:
+        return self.generated_tokens / self.target_passes if self.target_passes else 0.0
+
+    @property
+    def estimated_speedup(self) -> float:
+        """
+        Decode speedup over one target pass per token.
+
+        Assumes a verification pass over the draft costs about as much as a
+        single-token pass, which holds while decoding is bandwidth bound.
+        """
+        total = self.target_seconds + self.draft_seconds
+        return self.tokens_per_target_pass * self.target_seconds / total if total else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.__dict__,
+            "acceptance_rate": self.acceptance_rate,
+            "tokens_per_target_pass": self.tokens_per_target_pass,
+            "estimated_speedup": self.estimated_speedup
+        }
+
+def _crop_past(legacy: Tuple, length: int) -> Tuple:
+    """Keep the first length positions of every key/value tensor"""
+    return tuple(tuple(t[:, :, :length] for t in layer) for layer in legacy)
+
+class SpeculativeDecoder:
+    def __init__(
+        self,
+        model: Any,
+        draft_model: Any,
+        tokenizer: Any,
+        metrics: Optional[MetricsRegistry] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Speculative decoding with a small draft model.
+
+        Each step the draft model proposes num_draft_tokens tokens one at a
+        time, then the target model scores all of them in a single forward
+        pass. A proposal x is accepted with probability min(1, p(x) / q(x)),
+        where p and q are the target and draft distributions after the
+        request's temperature, top-k, top-p and repetition penalty; at the
+        first rejection a token is drawn from the normalized max(0, p - q)
+        instead, and if every proposal is accepted one more token is drawn
+        from p. Generated text therefore follows the target model's own
+        sampling distribution (with temperature 0 it is the target's greedy
+        output), while the target runs once per accepted run of tokens.
+
+        Both models must share the tokenizer. Sequences are decoded one at
+        a time; each generate() call keeps its own KV caches, so calls from
+        different threads can run concurrently.
+
+        Args:
+            model: Target causal language model
+            draft_model: Smaller causal language model with the same vocabulary
+            tokenizer: Tokenizer shared by both models
+            metrics: Metrics registry for per-mode acceptance metrics
+            logger: Optional logger instance
+        """
+        self.model = model
+        self.draft_model = draft_model
+        self.tokenizer = tokenizer
+        self.logger = logger or logging.getLogger(__name__)
+        self.vocab_size = model.get_output_embeddings().weight.shape[0]
+        self.eos_token_id = tokenizer.eos_token_id
+        self.stats: Dict[str, SpeculativeStats] = {}
+        self._metrics = metrics or get_registry()
+        self._lock = threading.Lock()
+
+    def generate(
+        self,
+        prompt_ids: List[int],
+        config: Any,
+        num_draft_tokens: int,
+        label: str = "default",
+        on_token: Optional[Callable[[int], None]] = None
+    ) -> GenerationResult:
+        """
+        Generate one sequence.
+
+        Args:
+            prompt_ids: Tokenized prompt
+            config: Sampling config (temperature, top_k, top_p,
+                repetition_penalty, max_length and optional max_new_tokens)
+            num_draft_tokens: Tokens proposed per target pass
+            label: Stats bucket for this request, e.g. the generation mode
+            on_token: Called with every generated token id as it is accepted
+
+        Returns:
+            The generation result
+        """
+        start = time.time()
+        stats = SpeculativeStats(requests=1)
+        tokens = list(prompt_ids)
+        generated: List[int] = []
+        first_token_time = None
+        finish_reason = None
+
+        max_new_tokens = config.max_length - len(prompt_ids)
+        if getattr(config, "max_new_tokens", None) is not None:
+            max_new_tokens = min(max_new_tokens, config.max_new_tokens)
+        if max_new_tokens <= 0:
+            finish_reason = "length"
+
+        # Each cache covers a prefix of tokens; the last token is fed on the next step
+        target_past, target_length = None, 0
+        draft_past, draft_length = None, 0
+
+        with torch.no_grad():
+            while finish_reason is None:
+                # The step adds up to k + 1 tokens
+                k = max(0, min(num_draft_tokens, max_new_tokens - len(generated) - 1))
+
+                draft_start = time.perf_counter()
+                drafts, draft_probs = [], []
+                for _ in range(k):
+                    logits, draft_past = self._forward(
+                        self.draft_model, (tokens + drafts)[draft_length:], draft_past, draft_length
+                    )
+                    draft_length = len(tokens) + len(drafts)
+                    probs = self._probs(logits[-1:, :self.vocab_size], [tokens + drafts], config)[0]
+                    drafts.append(int(torch.multinomial(probs, 1)))
+                    draft_probs.append(probs)
+                stats.draft_seconds += time.perf_counter() - draft_start
+                stats.draft_passes += k
+
+                target_start = time.perf_counter()
+                logits, target_past = self._forward(
+                    self.model, (tokens + drafts)[target_length:], target_past, target_length
+                )
+                target_probs = self._probs(
+                    logits[-(k + 1):], [tokens + drafts[:i] for i in range(k + 1)], config
+                )
+
+                accepted = 0
+                for draft, q, p in zip(drafts, draft_probs, target_probs):
+                    if float(torch.rand(())) * float(q[draft]) >= float(p[draft]):
+                        break
+                    accepted += 1
+                if accepted < k:
+                    # Resample the rejected position from what the target wanted beyond the draft
+                    p, q = target_probs[accepted], draft_probs[accepted]
+                    residual = (p - q).clamp(min=0)
+                    final = torch.multinomial(residual if float(residual.sum()) > 0 else p, 1)
+                else:
+                    final = torch.multinomial(target_probs[k], 1)
+                new_tokens = drafts[:accepted] + [int(final)]
+                stats.target_seconds += time.perf_counter() - target_start
+                stats.target_passes += 1
+                stats.proposed_tokens += k
+                stats.accepted_tokens += accepted
+
+                # Drop cached positions of rejected proposals
+                target_length = len(tokens) + accepted
+                target_past = _crop_past(target_past, target_length)
+                if draft_past is not None and draft_length > target_length:
+                    draft_length = target_length
+                    draft_past = _crop_past(draft_past, draft_length)
+
+                for token in new_tokens:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    tokens.append(token)
+                    generated.append(token)
+                    stats.generated_tokens += 1
+                    if on_token is not None:
+                        on_token(token)
+                    if token == self.eos_token_id:
+                        finish_reason = "eos"
+                    elif len(generated) >= max_new_tokens:
+                        finish_reason = "length"
+                    if finish_reason is not None:
+                        break
+
+        self._record(label, stats)
+        text_tokens = generated[:-1] if finish_reason == "eos" else generated
+        return GenerationResult(
+            text=self.tokenizer.decode(list(prompt_ids) + text_tokens, skip_special_tokens=True),
+            prompt_tokens=len(prompt_ids),
+            generated_tokens=text_tokens,
+            generation_time=time.time() - start,
+            time_to_first_token=first_token_time - start if first_token_time is not None else None,
+            finish_reason=finish_reason
+        )
+
+    def _forward(self, model: Any, ids: List[int], past: Optional[Tuple], past_length: int) -> Tuple[torch.Tensor, Tuple]:
+        """Run ids after past_length cached positions; returns logits per fed position and the new cache"""
+        device = model.device
+        input_ids = torch.tensor([ids], dtype=torch.long, device=device)
+        outputs = model(
+            input_ids=input_ids,
+            attention_mask=torch.ones((1, past_length + len(ids)), dtype=torch.long, device=device),
+            position_ids=torch.arange(past_length, past_length + len(ids), device=device)[None, :],
+            past_key_values=from_legacy_cache(past) if past is not None else None,
+            use_cache=True
+        )
+        return outputs.logits[0], to_legacy_cache(outputs.past_key_values)
+
+    def _probs(self, logits: torch.Tensor, histories: Sequence[List[int]], config: Any) -> torch.Tensor:
+        """Sampling distributions over the target vocabulary, one row per history"""
+        rows = len(histories)
+        length = max(len(history) for history in histories)
+        history = torch.zeros((rows, length), dtype=torch.long)
+        mask = torch.zeros((rows, length), dtype=torch.long)
+        for row, ids in enumerate(histories):
+            history[row, length - len(ids):] = torch.tensor(ids)
+            mask[row, length - len(ids):] = 1
+        device = logits.device
+        probs = next_token_probs(
+            logits,
+            history.to(device),
+            mask.to(device),
+            temperature=torch.full((rows,), float(config.temperature), device=device),
+            top_k=torch.full((rows,), int(config.top_k or 0), device=device),
+            top_p=torch.full((rows,), float(config.top_p), device=device),
+            repetition_penalty=torch.full((rows,), float(config.repetition_penalty), device=device)
+        )
+        if probs.shape[-1] < self.vocab_size:
+            # Tokens past the draft vocabulary are never proposed
+            probs = F.pad(probs, (0, self.vocab_size - probs.shape[-1]))
+        return probs
+
+    def _record(self, label: str, stats: SpeculativeStats):
+        with self._lock:
+            total = self.stats.setdefault(label, SpeculativeStats())
+            for name in stats.__dataclass_fields__:
+                setattr(total, name, getattr(total, name) + getattr(stats, name))
+            snapshot = total.snapshot()
+        self._metrics.counter("speculative_proposed_tokens_total", "Tokens proposed by the draft model", mode=label).inc(stats.proposed_tokens)
+        self._metrics.counter("speculative_accepted_tokens_total", "Draft tokens accepted by the target model", mode=label).inc(stats.accepted_tokens)
+        self._metrics.gauge("speculative_acceptance_rate", "Fraction of draft tokens accepted", mode=label).set(snapshot["acceptance_rate"])
+        self._metrics.gauge("speculative_estimated_speedup", "Estimated decode speedup from speculation", mode=label).set(snapshot["estimated_speedup"])
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {label: stats.snapshot() for label, stats in self.stats.items()}
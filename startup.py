@@ -0,0 +1,224 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from pathlib import Path
+import importlib
+import json
+import logging
+import struct
+import sys
+import threading
+import time
+import types
+
+from metrics import get_registry
+
+PHASES = ("import", "weight_load", "first_inference")
+
+class StartupProfile:
+    def __init__(self):
+        """
+        Process-wide breakdown of cold-start time.
+
+        Each phase (import, weight_load, first_inference) accumulates the
+        time of its named steps, e.g. importing torch or loading one
+        model's weights, so the report shows which cost dominates a cold
+        start. Phase totals are also exported as startup_phase_seconds.
+        """
+        self._steps: Dict[str, Dict[str, float]] = {phase: {} for phase in PHASES}
+        self._weights: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        registry = get_registry()
+        self._gauges = {
+            phase: registry.gauge("startup_phase_seconds", "Cold-start time spent per phase", phase=phase)
+            for phase in PHASES
+        }
+
+    def record(self, phase: str, step: str, seconds: float):
+        if phase not in self._steps:
+            raise ValueError(f"Unknown startup phase: {phase}")
+        with self._lock:
+            steps = self._steps[phase]
+            steps[step] = steps.get(step, 0.0) + seconds
+            total = sum(steps.values())
+        self._gauges[phase].set(total)
+
+    @contextmanager
+    def measure(self, phase: str, step: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, step, time.perf_counter() - start)
+
+    def record_weights(self, step: str, mapped_bytes: int, total_bytes: int):
+        """Note how much of a loaded model's weights stayed memory-mapped"""
+        with self._lock:
+            self._weights[step] = {"mapped_bytes": mapped_bytes, "total_bytes": total_bytes}
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = {phase: dict(values) for phase, values in self._steps.items()}
+            weights = {step: dict(values) for step, values in self._weights.items()}
+        phases = {phase: sum(values.values()) for phase, values in steps.items()}
+        return {
+            "phases": phases,
+            "total_seconds": sum(phases.values()),
+            "steps": steps,
+            "weights": weights
+        }
+
+    def format_report(self) -> str:
+        report = self.report()
+        lines = [f"Startup breakdown ({report['total_seconds']:.2f}s):"]
+        for phase in PHASES:
+            lines.append(f"  {phase:<16} {report['phases'][phase]:8.3f}s")
+            for step, seconds in sorted(report["steps"][phase].items(), key=lambda item: -item[1]):
+                lines.append(f"    {step:<30} {seconds:8.3f}s")
+        for step, weights in report["weights"].items():
+            mapped = weights["mapped_bytes"] / max(weights["total_bytes"], 1)
+            lines.append(f"  weights {step}: {weights['total_bytes'] / 1e6:.1f}MB, {mapped:.0%} memory-mapped")
+        return "\n".join(lines)
+
+STARTUP = StartupProfile()
+
+def get_startup_profile() -> StartupProfile:
+    """The process-wide startup profile"""
+    return STARTUP
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name: str):
+        """
+        Module placeholder that imports the real module on first attribute access.
+
+        The import time is recorded in the startup profile's import phase.
+        """
+        super().__init__(name)
+        self._lazy_module = None
+        self._lazy_lock = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        if self._lazy_module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    with STARTUP.measure("import", self.__name__):
+                        self._lazy_module = importlib.import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self._load(), attribute)
+
+    def __dir__(self) -> List[str]:
+        return dir(self._load())
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Return a module without importing it until it is first used.
+
+    Heavy dependencies such as torch and transformers are bound at module
+    level through this, so importing the serving code stays cheap and the
+    import cost moves to the first code path that actually needs them.
+    Annotations must not reference attributes of a lazy module, as those
+    are evaluated when the function is defined.
+    """
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+def safetensors_files(name_or_path: str) -> List[Path]:
+    """Safetensors weight files of a local checkpoint directory (empty for hub ids)"""
+    path = Path(name_or_path)
+    return sorted(path.glob("*.safetensors")) if path.is_dir() else []
+
+def safetensors_dtype(path: Path) -> Optional[str]:
+    """Most common floating point dtype in a safetensors file, read from its header only"""
+    names = {"F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16"}
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+    counts: Dict[str, int] = {}
+    for name, entry in header.items():
+        if name != "__metadata__" and entry.get("dtype") in names:
+            counts[names[entry["dtype"]]] = counts.get(names[entry["dtype"]], 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+def _mapped_ranges(files: List[Path]) -> Optional[List[Tuple[int, int]]]:
+    """Address ranges where the given files are mapped into this process (Linux only)"""
+    try:
+        maps = Path("/proc/self/maps").read_text()
+    except OSError:
+        return None
+    targets = {str(path.resolve()) for path in files}
+    ranges = []
+    for line in maps.splitlines():
+        fields = line.split(maxsplit=5)
+        if len(fields) == 6 and fields[5] in targets:
+            start, end = fields[0].split("-")
+            ranges.append((int(start, 16), int(end, 16)))
+    return ranges
+
+def mapped_weight_bytes(model: Any, files: List[Path]) -> Optional[Tuple[int, int]]:
+    """
+    Bytes of a model's parameters that live in the mapped checkpoint files.
+
+    Returns:
+        (mapped bytes, total bytes), or None where mappings can't be inspected
+    """
+    ranges = _mapped_ranges(files)
+    if ranges is None:
+        return None
+    mapped = total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        size = tensor.numel() * tensor.element_size()
+        total += size
+        pointer = tensor.data_ptr()
+        if any(start <= pointer < end for start, end in ranges):
+            mapped += size
+    return mapped, total
+
+def load_pretrained(
+    loader: Any,
+    name_or_path: str,
+    torch_dtype: Any = None,
+    logger: Optional[logging.Logger] = None,
+    **kwargs
+) -> Any:
+    """
+    from_pretrained that keeps local safetensors weights memory-mapped.
+
+    For a local checkpoint directory the weights are loaded from its
+    safetensors files, which transformers maps copy-on-write: parameters
+    point into the page cache instead of a private copy, so loading costs
+    page faults on first use rather than a full read, and processes
+    serving the same checkpoint share physical memory. Requesting a dtype
+    other than the stored one forces a converted copy, which is logged.
+    The load time and the mapped fraction go to the startup profile.
+
+    Args:
+        loader: Class with from_pretrained, e.g. transformers.AutoModel
+        name_or_path: Hub id or local checkpoint directory
+        torch_dtype: Requested dtype; None keeps the stored dtype
+        logger: Optional logger instance
+        **kwargs: Passed to from_pretrained
+
+    Returns:
+        The loaded model
+    """
+    logger = logger or logging.getLogger(__name__)
+    files = safetensors_files(name_or_path)
+    if files:
+        kwargs.setdefault("use_safetensors", True)
+        stored = safetensors_dtype(files[0])
+        requested = str(torch_dtype).replace("torch.", "") if torch_dtype is not None else stored
+        if requested != stored:
+            logger.info(f"{name_or_path} stores {stored} weights; loading as {requested} copies them into memory")
+    if torch_dtype is not None:
+        kwargs["torch_dtype"] = torch_dtype
+
+    with STARTUP.measure("weight_load", str(name_or_path)):
+        model = loader.from_pretrained(name_or_path, **kwargs)
+
+    if files:
+        mapped = mapped_weight_bytes(model, files)
+        if mapped is not None:
+            STARTUP.record_weights(str(name_or_path), *mapped)
+            logger.info(f"Loaded {name_or_path}: {mapped[0] / 1e6:.1f}MB of {mapped[1] / 1e6:.1f}MB memory-mapped")
+    return model
@@ -0,0 +1,244 @@
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+from dataclasses import dataclass, field
+from concurrent.futures import Future
+import asyncio
+import queue
+import threading
+import time
+
+class IncrementalDetokenizer:
+    def __init__(self, tokenizer: Any, prompt_ids: Sequence[int] = (), context_tokens: int = 4):
+        """
+        Decode a growing token sequence into text deltas.
+
+        Only a short window of recent tokens is decoded per step, so the
+        cost stays constant instead of growing with the sequence. A delta is
+        held back while the window ends in an incomplete multi-byte
+        character, and a few prompt tokens are kept as context so leading
+        spaces are rendered correctly.
+
+        Args:
+            tokenizer: Tokenizer providing decode()
+            prompt_ids: Prompt token ids used as initial context
+            context_tokens: Number of prompt tokens kept as context
+        """
+        self.tokenizer = tokenizer
+        self.tokens = list(prompt_ids[-context_tokens:]) if context_tokens else []
+        self.prefix_offset = 0
+        self.read_offset = len(self.tokens)
+
+    def _decode(self, tokens: List[int]) -> str:
+        return self.tokenizer.decode(tokens, skip_special_tokens=True)
+
+    def add(self, token_id: int) -> str:
+        """Append one token and return the newly completed text, if any"""
+        self.tokens.append(token_id)
+        prefix_text = self._decode(self.tokens[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.tokens[self.prefix_offset:])
+        if len(new_text) <= len(prefix_text) or new_text.endswith("�"):
+            return ""
+
+        # Slide the window forward and drop tokens that can no longer matter
+        self.tokens = self.tokens[self.read_offset:]
+        self.prefix_offset = 0
+        self.read_offset = len(self.tokens)
+        return new_text[len(prefix_text):]
+
+    def flush(self) -> str:
+        """Return any text still held back at the end of the sequence"""
+        prefix_text = self._decode(self.tokens[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.tokens[self.prefix_offset:])
+        self.prefix_offset = self.read_offset = len(self.tokens)
+        return new_text[len(prefix_text):]
+
+@dataclass
+class StreamStats:
+    """Time-to-first-token and inter-token latency of one stream"""
+    start_time: float = field(default_factory=time.time)
+    first_token_time: Optional[float] = None
+    token_times: List[float] = field(default_factory=list)
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+    @property
+    def inter_token_latencies(self) -> List[float]:
+        return [b - a for a, b in zip(self.token_times, self.token_times[1:])]
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self.inter_token_latencies)
+        return {
+            "tokens": len(self.token_times),
+            "time_to_first_token": self.time_to_first_token,
+            "mean_inter_token_latency": sum(latencies) / len(latencies) if latencies else None,
+            "p95_inter_token_latency": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None
+        }
+
+_END = object()
+
+class TokenStream:
+    def __init__(self, tokenizer: Any, prompt_ids: Sequence[int] = (), stop_token_ids: Sequence[int] = ()):
+        """
+        Stream of decoded text produced by a background generation loop.
+
+        The producer calls push() for every sampled token and finish() or
+        fail() at the end, from any thread. The consumer iterates either
+        synchronously (for chunk in stream) or asynchronously (async for
+        chunk in stream); each chunk is the text added since the last one.
+
+        A consumer that stops early calls close() (breaking out of a for
+        loop or closing the async iterator does so too). That cancels the
+        attached generation future, and producers driving model.generate()
+        stop through stopping_criteria().
+
+        Args:
+            tokenizer: Tokenizer used for incremental detokenization
+            prompt_ids: Prompt token ids used as decoding context
+            stop_token_ids: Tokens that end the stream and are not rendered
+        """
+        self.detokenizer = IncrementalDetokenizer(tokenizer, prompt_ids)
+        self.stop_token_ids = set(stop_token_ids)
+        self.stats = StreamStats()
+        self.result = None
+        self._prompt_seen = False
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._future: Optional[Future] = None
+        self._closed = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_queue: Optional[asyncio.Queue] = None
+
+    def _put(self, item: Any):
+        with self._lock:
+            if self._loop is not None:
+                try:
+                    self._loop.call_soon_threadsafe(self._async_queue.put_nowait, item)
+                except RuntimeError:
+                    # The consumer's event loop is closed; nobody is left to read
+                    pass
+            else:
+                self._queue.put(item)
+
+    def push(self, token_id: int):
+        if self._closed.is_set():
+            return
+        now = time.time()
+        if self.stats.first_token_time is None:
+            self.stats.first_token_time = now
+        self.stats.token_times.append(now)
+        if token_id not in self.stop_token_ids:
+            self._put(token_id)
+
+    def finish(self, result: Any = None):
+        self.result = result
+        self._put(_END)
+
+    def fail(self, error: BaseException):
+        self._put(error)
+
+    # transformers streamer protocol, so a TokenStream can be passed to
+    # model.generate(streamer=...); the first put() carries the prompt
+    def put(self, value: Any):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for token_id in value.reshape(-1).tolist():
+            self.push(token_id)
+
+    def end(self):
+        self.finish()
+
+    def attach(self, future: Future) -> "TokenStream":
+        """Finish or fail the stream when a generation future resolves"""
+        self._future = future
+        if self._closed.is_set():
+            future.cancel()
+
+        def _done(f: Future):
+            if f.cancelled():
+                self.finish()
+            elif f.exception() is not None:
+                self.fail(f.exception())
+            else:
+                self.finish(f.result())
+        future.add_done_callback(_done)
+        return self
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def close(self):
+        """Stop generation by cancelling the attached future"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        # The producer ends the stream once it stops
+        if self._future is not None:
+            self._future.cancel()
+
+    async def aclose(self):
+        self.close()
+
+    def stopping_criteria(self) -> Any:
+        """StoppingCriteriaList for model.generate() that stops once the stream is closed"""
+        from transformers import StoppingCriteria, StoppingCriteriaList # type: ignore
+
+        closed = self._closed
+
+        class _StopWhenClosed(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return input_ids.new_full((input_ids.shape[0],), closed.is_set(), dtype=bool)
+
+        return StoppingCriteriaList([_StopWhenClosed()])
+
+    def _handle(self, item: Any) -> Optional[str]:
+        """Turn a queued item into a text chunk, or None at end of stream"""
+        if item is _END:
+            return None
+        if isinstance(item, BaseException):
+            raise item
+        return self.detokenizer.add(item)
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            while True:
+                chunk = self._handle(self._queue.get())
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+            tail = self.detokenizer.flush()
+            if tail:
+                yield tail
+        finally:
+            # Also reached when the consumer abandons the loop
+            self.close()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._async_queue = asyncio.Queue()
+            # Move anything produced before the consumer attached
+            while not self._queue.empty():
+                self._async_queue.put_nowait(self._queue.get_nowait())
+        try:
+            while True:
+                chunk = self._handle(await self._async_queue.get())
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+            tail = self.detokenizer.flush()
+            if tail:
+                yield tail
+        finally:
+            self.close()
+
+    def text(self) -> str:
+        """Consume the stream synchronously and return the full text"""
+        return "".join(self)
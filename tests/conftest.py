@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def phi():
+    """Tiny randomly initialised Phi model and its tokenizer"""
+    from benchmark import build_tiny_phi
+
+    return build_tiny_phi()
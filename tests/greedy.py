@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+from typing import Any, List
+
+MAX_NEW_TOKENS = 12
+PROMPTS = [
+    "def add(a, b):",
+    "The quick brown fox jumps over",
+    "Once upon a time there was a very long prompt about",
+    "x"
+]
+
+def greedy_config(prompt_length: int, max_new_tokens: int = MAX_NEW_TOKENS) -> SimpleNamespace:
+    """Sampling config that decodes greedily"""
+    return SimpleNamespace(
+        temperature=0.0,
+        top_k=0,
+        top_p=1.0,
+        repetition_penalty=1.0,
+        num_return_sequences=1,
+        max_length=prompt_length + max_new_tokens,
+        max_new_tokens=max_new_tokens
+    )
+
+def greedy_reference(model: Any, tokenizer: Any, prompt_ids: List[int]) -> List[int]:
+    """Tokens model.generate() produces greedily for one prompt"""
+    import torch # type: ignore
+
+    with torch.no_grad():
+        output = model.generate(
+            torch.tensor([prompt_ids]),
+            attention_mask=torch.ones(1, len(prompt_ids), dtype=torch.long),
+            do_sample=False,
+            max_new_tokens=MAX_NEW_TOKENS,
+            pad_token_id=tokenizer.pad_token_id
+        )
+    generated = output[0, len(prompt_ids):].tolist()
+    # generate() keeps the end-of-sequence token; the decoders stop before it
+    if generated and generated[-1] == tokenizer.eos_token_id:
+        generated.pop()
+    return generated
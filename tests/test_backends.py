@@ -0,0 +1,60 @@
+import torch
+
+from backends import BACKENDS, BackendSettings, EagerBackend, compare_backends, create_backend
+
+class _Linear(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.embed = torch.nn.Embedding(16, 4)
+
+    def forward(self, input_ids, attention_mask):
+        return {"logits": self.embed(input_ids) * attention_mask.unsqueeze(-1)}
+
+class _BrokenBackend(EagerBackend):
+    name = "broken"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepare_calls = 0
+
+    def prepare(self, example_inputs):
+        self.prepare_calls += 1
+        raise RuntimeError("compiler exploded")
+
+def _inputs(width):
+    return {
+        "input_ids": torch.arange(2 * width).reshape(2, width) % 16,
+        "attention_mask": torch.ones(2, width, dtype=torch.long)
+    }
+
+def test_failed_preparation_falls_back_to_eager_for_that_width(tmp_path):
+    model = _Linear().eval()
+    backend = _BrokenBackend(model, "tiny", BackendSettings(artifact_dir=str(tmp_path)))
+
+    for _ in range(2):
+        outputs = backend(_inputs(4))
+        with torch.inference_mode():
+            assert torch.equal(outputs["logits"], model(**_inputs(4))["logits"])
+
+    assert backend.prepare_calls == 1
+    assert "compiler exploded" in backend.failures[4]
+
+def test_compare_backends_reports_failed_preparation(tmp_path, monkeypatch):
+    monkeypatch.setitem(BACKENDS, "broken", _BrokenBackend)
+    report = compare_backends(
+        _Linear().eval(), "tiny", _inputs(4), ["eager", "broken"],
+        settings=BackendSettings(artifact_dir=str(tmp_path)), iterations=2
+    )
+
+    assert report["eager"]["equivalence"]["match"]
+    assert "compiler exploded" in report["broken"]["error"]
+
+def test_create_backend_falls_back_when_the_backend_fails_to_start(tmp_path, monkeypatch):
+    class _Unsupported(EagerBackend):
+        def __init__(self, *args, **kwargs):
+            raise RuntimeError("not supported on this platform")
+
+    monkeypatch.setitem(BACKENDS, "unsupported", _Unsupported)
+    settings = BackendSettings(backend="unsupported", artifact_dir=str(tmp_path))
+
+    assert type(create_backend(_Linear().eval(), "tiny", settings)) is EagerBackend
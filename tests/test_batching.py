@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from batching import BatchSettings, DynamicBatcher
+
+def test_close_flushes_queued_requests():
+    release = threading.Event()
+    def _batch_fn(items):
+        release.wait(5)
+        return [item * 2 for item in items]
+    batcher = DynamicBatcher(_batch_fn, BatchSettings(max_batch_size=4, max_wait_ms=1))
+    futures = [batcher.submit(item) for item in range(10)]
+
+    closer = threading.Thread(target=batcher.close)
+    closer.start()
+    release.set()
+    closer.join(5)
+
+    assert not closer.is_alive()
+    assert [future.result(timeout=0) for future in futures] == [item * 2 for item in range(10)]
+    with pytest.raises(RuntimeError, match="closed"):
+        batcher.submit(1)
+
+@pytest.mark.parametrize("max_concurrent_batches", [1, 3])
+def test_close_stops_an_idle_batcher(max_concurrent_batches):
+    settings = BatchSettings(max_batch_size=4, max_wait_ms=1, max_concurrent_batches=max_concurrent_batches)
+    batcher = DynamicBatcher(lambda items: items, settings)
+    assert batcher.infer("a", timeout=5) == "a"
+
+    batcher.close(timeout=5)
+
+    assert not batcher._worker.is_alive()
+    if batcher._slots is not None:
+        # Every dispatch slot is returned, including the one held while waiting
+        assert batcher._slots._value == max_concurrent_batches
+
+def test_failed_batch_fails_only_its_requests():
+    def _batch_fn(items):
+        if "bad" in items:
+            raise ValueError("bad input")
+        return items
+    batcher = DynamicBatcher(_batch_fn, BatchSettings(max_batch_size=2, max_wait_ms=50))
+    try:
+        bad = [batcher.submit("bad"), batcher.submit("x")]
+        for future in bad:
+            with pytest.raises(ValueError, match="bad input"):
+                future.result(timeout=5)
+        assert batcher.infer("good", timeout=5) == "good"
+        assert batcher.stats.failed_batches == 1
+    finally:
+        batcher.close()
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from benchmark import StubModelWrapper, benchmark_config
+from bulk import iter_outputs
+from pipeline import InferencePipeline
+
+RECORDS = 60
+
+@pytest.fixture
+def input_path(tmp_path):
+    path = tmp_path / "input.jsonl"
+    with open(path, "w") as f:
+        for index in range(RECORDS):
+            record = {"id": f"r{index}", "text": "word " * (index % 9 + 1)}
+            if index == 17:
+                record["text"] = ""
+            f.write(json.dumps(record) + "\n")
+    return path
+
+def _pipeline():
+    config = benchmark_config(batch_size=4, cache=False)
+    config["inference"]["bulk"] = {"batch_size": 4, "window_size": 16, "checkpoint_interval": 8}
+    return InferencePipeline(StubModelWrapper(base_ms=0, per_item_ms=0), config)
+
+def _run(input_path, output_path, resume=True):
+    pipeline = _pipeline()
+    try:
+        return pipeline.process_file(str(input_path), str(output_path), resume=resume)
+    finally:
+        pipeline.close()
+
+def test_resume_after_truncation_matches_an_uninterrupted_run(tmp_path, input_path):
+    expected_path = tmp_path / "expected.jsonl"
+    _run(input_path, expected_path, resume=False)
+    expected = list(iter_outputs(str(expected_path)))
+
+    # Fail part way through the job
+    output_path = tmp_path / "output.jsonl"
+    pipeline = _pipeline()
+    infer_batch = pipeline.model_wrapper.infer_batch
+    calls = []
+    def _failing(items):
+        calls.append(len(items))
+        if len(calls) == 6:
+            raise RuntimeError("worker killed")
+        return infer_batch(items)
+    pipeline.model_wrapper.infer_batch = _failing
+    with pytest.raises(RuntimeError, match="worker killed"):
+        pipeline.process_file(str(input_path), str(output_path), resume=False)
+    pipeline.close()
+
+    checkpoint = json.loads((tmp_path / "output.jsonl.ckpt").read_text())
+    assert 0 < checkpoint["records"] < RECORDS
+    # A torn write past the checkpoint is cut off on resume
+    with open(output_path, "ab") as f:
+        f.write(b'{"index": 99, "out')
+
+    summary = _run(input_path, output_path)
+    assert summary["resumed_from"] == checkpoint["records"]
+    assert summary["records"] == RECORDS
+    assert list(iter_outputs(str(output_path))) == expected
+    assert not (tmp_path / "output.jsonl.ckpt").exists()
+
+def test_records_without_text_get_an_error_line(tmp_path, input_path):
+    output_path = tmp_path / "output.jsonl"
+    summary = _run(input_path, output_path, resume=False)
+    lines = list(iter_outputs(str(output_path)))
+
+    assert summary["invalid_records"] == 1
+    assert [line["index"] for line in lines] == list(range(RECORDS))
+    assert lines[17] == {"index": 17, "error": "Empty text field", "id": "r17"}
+    assert "output" in lines[18]
@@ -0,0 +1,53 @@
+import caching
+from caching import LRUCache
+
+def test_evicts_least_recently_used_over_byte_budget():
+    cache = LRUCache(max_entries=100, max_bytes=10, size_fn=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    assert cache.get("a") == "xxxx"
+    cache.put("c", "xxxx")
+
+    assert "b" not in cache
+    assert cache.get("a") == "xxxx"
+    assert cache.get("c") == "xxxx"
+    assert cache.stats.bytes == 8
+    assert cache.stats.evictions == 1
+
+def test_replacing_an_entry_updates_its_size():
+    cache = LRUCache(max_entries=100, max_bytes=10, size_fn=len)
+    cache.put("a", "xxxxxxxx")
+    cache.put("a", "xx")
+    cache.put("b", "xxxxxx")
+
+    assert len(cache) == 2
+    assert cache.stats.bytes == 8
+
+def test_value_larger_than_budget_is_not_cached():
+    cache = LRUCache(max_entries=100, max_bytes=10, size_fn=len)
+    cache.put("a", "xxxx")
+    cache.put("huge", "x" * 11)
+
+    assert "huge" not in cache
+    assert cache.get("a") == "xxxx"
+
+def test_evicts_over_max_entries():
+    cache = LRUCache(max_entries=2)
+    for key in "abc":
+        cache.put(key, key)
+
+    assert "a" not in cache
+    assert len(cache) == 2
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caching.time, "monotonic", lambda: now[0])
+    cache = LRUCache(max_entries=10, ttl_seconds=5)
+    cache.put("a", 1)
+
+    now[0] += 4.9
+    assert cache.get("a") == 1
+    now[0] += 0.2
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+    assert len(cache) == 0
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from caching import SingleFlight
+
+def test_concurrent_calls_share_one_computation():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def _compute():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(flight.run, "key", _compute)
+        while flight.stats.in_flight == 0:
+            time.sleep(0.001)
+        waiters = [pool.submit(flight.run, "key", _compute) for _ in range(3)]
+        while flight.stats.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result(5) for future in [leader] + waiters]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.stats.snapshot() == {"leaders": 1, "coalesced": 3, "in_flight": 0}
+
+def test_waiters_see_the_leaders_exception():
+    flight = SingleFlight()
+    future, leader = flight.join("key")
+    waiter, waiter_leads = flight.join("key")
+    assert leader and not waiter_leads
+
+    flight.complete("key", exception=ValueError("boom"))
+
+    with pytest.raises(ValueError, match="boom"):
+        waiter.result(0)
+    # The key is released once the result is set
+    assert flight.join("key")[1]
+
+def test_cancelled_waiter_does_not_cancel_the_leader():
+    flight = SingleFlight()
+
+    async def _main():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def _compute():
+            started.set()
+            await release.wait()
+            return "result"
+
+        leader = asyncio.ensure_future(flight.run_async("key", _compute))
+        await started.wait()
+        waiter = asyncio.ensure_future(flight.run_async("key", _compute))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await leader, waiter.cancelled()
+
+    assert asyncio.run(_main()) == ("result", True)
+
+def test_cancelled_leader_keeps_running_for_its_waiters():
+    flight = SingleFlight()
+
+    async def _main():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def _compute():
+            started.set()
+            await release.wait()
+            return "result"
+
+        leader = asyncio.ensure_future(flight.run_async("key", _compute))
+        await started.wait()
+        waiter = asyncio.ensure_future(flight.run_async("key", _compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await waiter
+
+    assert asyncio.run(_main()) == "result"
+
+def test_cancelled_leader_without_waiters_cancels_the_computation():
+    flight = SingleFlight()
+    cancelled = []
+
+    async def _main():
+        started = asyncio.Event()
+
+        async def _compute():
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        leader = asyncio.ensure_future(flight.run_async("key", _compute))
+        await started.wait()
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        await asyncio.sleep(0)
+
+    asyncio.run(_main())
+    assert cancelled == [True]
+    assert flight.stats.in_flight == 0
+
+def test_pipeline_runs_identical_concurrent_requests_once():
+    from benchmark import StubModelWrapper, benchmark_config
+    from pipeline import InferencePipeline
+
+    wrapper = StubModelWrapper(base_ms=200, per_item_ms=0)
+    pipeline = InferencePipeline(wrapper, benchmark_config(batch_size=1, cache=False))
+
+    async def _main():
+        return await asyncio.gather(*(pipeline.process_input_async("Same Text") for _ in range(4)))
+
+    try:
+        outputs = asyncio.run(_main())
+    finally:
+        pipeline.close()
+
+    assert wrapper.items == 1
+    assert all(output.processed_output == outputs[0].processed_output for output in outputs)
+    assert pipeline.coalescing_stats["coalesced"] == 3
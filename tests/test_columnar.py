@@ -0,0 +1,40 @@
+import pickle
+
+from columnar import ModelOutput, ProcessedInput, preprocess, preprocess_batch
+
+def test_extra_metadata_is_kept():
+    item = ProcessedInput("hello", {"timestamp": 1.0, "original_length": 7, "source": "upload"})
+
+    assert item.metadata["source"] == "upload"
+    assert item.metadata["timestamp"] == 1.0
+    assert item.metadata["processed_length"] == 5
+
+def test_extra_metadata_survives_pickling():
+    item = ProcessedInput("hello", {"timestamp": 1.0, "original_length": 7, "source": "upload"})
+    restored = pickle.loads(pickle.dumps(item))
+
+    assert restored == item
+    assert restored.metadata["source"] == "upload"
+
+def test_derived_metadata_is_not_duplicated():
+    item = preprocess("  Hello ")
+    restored = ProcessedInput(item.data, item.metadata)
+
+    assert restored._extra is None
+    assert restored == item
+
+def test_records_compare_by_value():
+    item = ProcessedInput("hello", timestamp=1.0, original_length=5)
+
+    assert item == ProcessedInput("hello", timestamp=1.0, original_length=5)
+    assert item != ProcessedInput("hello", timestamp=2.0, original_length=5)
+    assert ModelOutput("x", "y", 0.5, {"a": 1}) == ModelOutput("x", "y", 0.5, {"a": 1})
+    assert ModelOutput("x", "y", 0.5, {"a": 1}) != ModelOutput("x", "z", 0.5, {"a": 1})
+
+def test_batch_rows_pickle_as_processed_inputs():
+    batch = preprocess_batch(["Hello", {"text": " World "}])
+    restored = pickle.loads(pickle.dumps(batch[1]))
+
+    assert isinstance(restored, ProcessedInput)
+    assert restored.data == "world"
+    assert restored.metadata == batch[1].metadata
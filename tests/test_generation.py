@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from generation import ContinuousBatchingEngine
+from greedy import PROMPTS, greedy_config, greedy_reference
+
+def test_continuous_batching_matches_greedy_generate(phi):
+    model, tokenizer = phi
+    engine = ContinuousBatchingEngine(model, tokenizer, max_batch_size=3)
+    try:
+        prompt_ids = [tokenizer(prompt)["input_ids"] for prompt in PROMPTS]
+        futures = [engine.submit_ids(ids, greedy_config(len(ids))) for ids in prompt_ids]
+        results = [future.result(timeout=120) for future in futures]
+    finally:
+        engine.close()
+
+    for ids, result in zip(prompt_ids, results):
+        assert result.generated_tokens == greedy_reference(model, tokenizer, ids)
+
+def test_cancelling_one_request_leaves_the_rest_of_its_batch(phi):
+    model, tokenizer = phi
+    engine = ContinuousBatchingEngine(model, tokenizer, max_batch_size=4)
+    try:
+        prompt_ids = [tokenizer(prompt)["input_ids"] for prompt in PROMPTS[:3]]
+        started = threading.Event()
+        long_config = greedy_config(len(prompt_ids[0]), max_new_tokens=400)
+        long_config.max_length = 10_000
+        futures = [engine.submit_ids(prompt_ids[0], long_config, on_token=lambda token: started.set())]
+        futures += [engine.submit_ids(ids, greedy_config(len(ids))) for ids in prompt_ids[1:]]
+        assert started.wait(60)
+        assert futures[0].cancel()
+
+        for ids, future in zip(prompt_ids[1:], futures[1:]):
+            assert future.result(timeout=120).generated_tokens == greedy_reference(model, tokenizer, ids)
+        # A request cancelled before admission is never prefilled
+        queued = engine.submit_ids(prompt_ids[0], long_config)
+        queued.cancel()
+        assert engine.submit_ids(prompt_ids[1], greedy_config(len(prompt_ids[1]))).result(timeout=120)
+    finally:
+        engine.close()
+
+    assert engine.stats.cancelled == 2
+    assert engine.stats.active_sequences == 0
@@ -0,0 +1,80 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import Histogram, MetricsExporter, MetricsRegistry, MetricsSettings
+
+def test_histogram_quantiles_are_within_bucket_error():
+    histogram = Histogram()
+    for value in range(1, 1001):
+        histogram.observe(value / 1000)
+
+    for q, expected in ((0.5, 0.5), (0.95, 0.95), (0.99, 0.99)):
+        assert histogram.quantile(q) == pytest.approx(expected, rel=0.03)
+    assert histogram.count == 1000
+    assert histogram.snapshot()["max"] == 1.0
+
+def test_empty_histogram_has_no_quantiles():
+    snapshot = Histogram().snapshot()
+
+    assert snapshot["count"] == 0
+    assert snapshot["p50"] is None
+    assert snapshot["min"] is None
+
+def test_metric_kind_is_fixed_per_name():
+    registry = MetricsRegistry()
+    registry.counter("requests_total")
+
+    with pytest.raises(ValueError, match="already registered"):
+        registry.gauge("requests_total")
+
+def test_prometheus_rendering():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests served", model='m"1').inc(3)
+    registry.histogram("latency_seconds", stage="infer").observe(0.25)
+
+    text = registry.render_prometheus()
+
+    assert "# HELP requests_total Requests served" in text
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{model="m\\"1"} 3.0' in text
+    assert "# TYPE latency_seconds summary" in text
+    assert 'latency_seconds{stage="infer",quantile="0.5"} 0.25' in text
+    assert 'latency_seconds_count{stage="infer"} 1' in text
+
+def test_exporter_derives_rates_and_writes_json(tmp_path):
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total")
+    path = tmp_path / "metrics.json"
+    exporter = MetricsExporter(
+        registry, MetricsSettings(exporters=["json"], tracked_metrics=[], json_path=str(path))
+    )
+
+    exporter.collect()
+    counter.inc(10)
+    exporter.collect()
+
+    dump = json.loads(path.read_text())
+    assert dump["metrics"]["requests_total"][0]["value"] == 10.0
+    assert dump["metrics"]["requests_per_second"][0]["value"] > 0
+    assert registry.histogram("metrics_collection_seconds").count == 2
+
+def test_exporter_serves_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("requests_total").inc()
+    exporter = MetricsExporter(
+        registry, MetricsSettings(exporters=["prometheus"], prometheus_port=0, collection_interval=60)
+    ).start()
+    try:
+        base = f"http://127.0.0.1:{exporter.prometheus_port}"
+        with urllib.request.urlopen(f"{base}/metrics", timeout=5) as response:
+            body = response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{base}/other", timeout=5)
+    finally:
+        exporter.stop()
+
+    assert "requests_total 1.0" in body
+    assert exporter.prometheus_port is None
@@ -0,0 +1,153 @@
+import sqlite3
+import time
+
+import pytest
+
+from caching import LRUCache
+from persistent_cache import SQLiteStore, TieredCache
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.sqlite"), flush_interval=0.01)
+    yield store
+    store.close()
+
+def _stop_writer(store):
+    def _fatal(batch):
+        raise SystemExit("writer stopped")
+    store._write_batch = _fatal
+
+def test_flush_writes_queued_entries(store):
+    store.put("a", b"1")
+    store.put("b", b"22")
+    store.delete("a")
+    store.flush()
+
+    assert store.get("a") is None
+    assert store.get("b") == b"22"
+
+def test_failed_write_is_dropped_and_the_writer_keeps_going(store):
+    store.put("a", b"1")
+    store.put("bad", None)
+    store.put("b", b"2")
+    store.flush()
+
+    assert store.failed_writes == 1
+    assert store.get("a") == b"1"
+    assert store.get("b") == b"2"
+
+    store.put("c", b"3")
+    store.flush()
+    assert store.get("c") == b"3"
+
+def test_flush_raises_once_the_writer_has_died(store):
+    _stop_writer(store)
+    store.put("a", b"1")
+
+    with pytest.raises(RuntimeError, match="Cache writer stopped"):
+        store.flush()
+    with pytest.raises(RuntimeError, match="Cache writer stopped"):
+        store.put("b", b"2")
+
+def test_tiered_cache_keeps_serving_when_the_store_fails(store):
+    cache = TieredCache(LRUCache(max_entries=10), store)
+    _stop_writer(store)
+    cache.put("a", {"value": 1})
+    store._writer.join(timeout=5)
+
+    cache.put("b", {"value": 2})
+    assert cache.get("b") == {"value": 2}
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TieredCache(LRUCache(max_entries=10), SQLiteStore(path, flush_interval=0.01))
+    cache.put("a", {"value": 1})
+    cache.close()
+
+    reopened = TieredCache(LRUCache(max_entries=10), SQLiteStore(path, flush_interval=0.01))
+    try:
+        assert reopened.get("a") == {"value": 1}
+        assert reopened.disk_hits == 1
+    finally:
+        reopened.close()
+
+def test_expired_entries_are_not_served_from_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TieredCache(LRUCache(max_entries=10, ttl_seconds=0.2), SQLiteStore(path, flush_interval=0.01))
+    try:
+        cache.put("a", {"value": 1})
+        cache.store.flush()
+        assert cache.get("a") == {"value": 1}
+
+        time.sleep(0.3)
+        assert cache.get("a") is None
+        assert cache.disk_hits == 0
+        assert cache.disk_misses == 1
+        assert list(cache.store.iter_recent(10)) == []
+    finally:
+        cache.close()
+
+def test_warm_up_skips_expired_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TieredCache(LRUCache(max_entries=10, ttl_seconds=0.2), SQLiteStore(path, flush_interval=0.01))
+    cache.put("a", {"value": 1})
+    cache.close()
+    time.sleep(0.3)
+
+    reopened = TieredCache(
+        LRUCache(max_entries=10, ttl_seconds=60), SQLiteStore(path, flush_interval=0.01), warmup_entries=10
+    )
+    try:
+        assert len(reopened) == 0
+    finally:
+        reopened.close()
+
+def test_flush_deletes_expired_rows(store):
+    store.put("old", b"1", expires_at=time.time() - 1)
+    store.put("live", b"2")
+    store.flush()
+
+    rows = store._connect().execute("SELECT key FROM cache_entries").fetchall()
+    assert rows == [("live",)]
+
+def test_opens_databases_with_the_old_layout(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    with sqlite3.connect(str(path)) as conn:
+        conn.execute(
+            "CREATE TABLE cache_entries (key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX idx_cache_accessed ON cache_entries(accessed)")
+        conn.execute("INSERT INTO cache_entries VALUES ('a', x'01', 1, 0)")
+    conn.close()
+
+    store = SQLiteStore(str(path), flush_interval=0.01)
+    try:
+        assert store.get("a") == b"\x01"
+        assert store.total_bytes() == 1
+        columns = [row[1] for row in store._connect().execute("PRAGMA table_info(cache_entries)")]
+        assert columns[-1] == "value"
+    finally:
+        store.close()
+
+def test_byte_total_tracks_writes_and_eviction(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.sqlite"), max_bytes=10, flush_interval=0.01)
+    try:
+        store.put("a", b"1234")
+        store.put("b", b"12")
+        store.put("a", b"123")
+        store.flush()
+        assert store.total_bytes() == 5
+
+        store.delete("b")
+        store.put("c", b"12345678")
+        store.flush()
+        # Over budget at 11 bytes; the least recently written entry goes
+        assert store.get("a") is None
+        assert store.get("c") == b"12345678"
+        assert store.total_bytes() == 8
+
+        actual = store._connect().execute("SELECT SUM(size) FROM cache_entries").fetchone()[0]
+        assert store.total_bytes() == actual
+    finally:
+        store.close()
@@ -0,0 +1,87 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from prefix_cache import PrefixCache
+
+def _kv(token_ids, layers=2):
+    """Fake past_key_values whose positions hold their token ids"""
+    values = torch.tensor(token_ids, dtype=torch.float32).reshape(1, 1, -1, 1)
+    return tuple((values.clone(), values.clone()) for _ in range(layers))
+
+def _positions(kv):
+    return kv[0][0].flatten().tolist()
+
+def test_match_reuses_the_longest_shared_prefix():
+    cache = PrefixCache(min_match_tokens=2)
+    cache.insert([1, 2, 3, 4, 5], _kv([1, 2, 3, 4, 5]))
+
+    matched, kv = cache.match([1, 2, 3, 9, 9])
+
+    assert matched == 3
+    assert _positions(kv) == [1, 2, 3]
+    assert cache.stats.hits == 1
+    assert cache.stats.reused_tokens == 3
+
+def test_match_leaves_one_token_to_feed():
+    cache = PrefixCache(min_match_tokens=2)
+    cache.insert([1, 2, 3], _kv([1, 2, 3]))
+
+    matched, kv = cache.match([1, 2, 3])
+
+    assert matched == 2
+    assert _positions(kv) == [1, 2]
+
+def test_short_matches_are_misses():
+    cache = PrefixCache(min_match_tokens=4)
+    cache.insert([1, 2, 3, 4, 5], _kv([1, 2, 3, 4, 5]))
+
+    assert cache.match([1, 2, 3, 7, 8]) == (0, None)
+    assert cache.stats.misses == 1
+
+def test_longer_sequence_replaces_its_stored_prefix():
+    cache = PrefixCache(min_match_tokens=2)
+    cache.insert([1, 2, 3], _kv([1, 2, 3]))
+    cache.insert([1, 2, 3, 4, 5], _kv([1, 2, 3, 4, 5]))
+    # Already covered by the longer entry
+    cache.insert([1, 2], _kv([1, 2]))
+
+    assert cache.stats.entries == 1
+    assert cache.stats.bytes == 2 * 2 * 5 * 4
+    assert cache.match([1, 2, 3, 4, 5, 6])[0] == 5
+
+def test_least_recently_used_entries_are_evicted():
+    entry_bytes = 2 * 2 * 4 * 4
+    cache = PrefixCache(max_bytes=2 * entry_bytes, min_match_tokens=2)
+    cache.insert([1, 1, 1, 1], _kv([1, 1, 1, 1]))
+    cache.insert([2, 2, 2, 2], _kv([2, 2, 2, 2]))
+    cache.match([1, 1, 1, 1, 0])
+    cache.insert([3, 3, 3, 3], _kv([3, 3, 3, 3]))
+
+    assert cache.stats.evictions == 1
+    assert cache.stats.bytes == 2 * entry_bytes
+    assert cache.match([2, 2, 2, 2, 0]) == (0, None)
+    assert cache.match([1, 1, 1, 1, 0])[0] == 4
+    assert cache.match([3, 3, 3, 3, 0])[0] == 4
+
+def test_engine_with_prefix_cache_matches_greedy_generate(phi):
+    pytest.importorskip("transformers")
+    from generation import ContinuousBatchingEngine
+    from greedy import greedy_config, greedy_reference
+
+    model, tokenizer = phi
+    cache = PrefixCache(min_match_tokens=2)
+    engine = ContinuousBatchingEngine(model, tokenizer, max_batch_size=2, prefix_cache=cache)
+    prompts = ["def add(a, b):\n    return", "def add(a, b):\n    print", "def add(a, b):"]
+    try:
+        results = []
+        for prompt in prompts:
+            ids = tokenizer(prompt)["input_ids"]
+            # One at a time so every prompt after the first can reuse the cache
+            results.append((ids, engine.submit_ids(ids, greedy_config(len(ids))).result(timeout=120)))
+    finally:
+        engine.close()
+
+    assert cache.stats.hits >= 2
+    for ids, result in results:
+        assert result.generated_tokens == greedy_reference(model, tokenizer, ids)
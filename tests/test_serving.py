@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from benchmark import StubModelWrapper, benchmark_config
+from pipeline import InferencePipeline
+from serving import AsyncInferenceServer, ServingSettings
+
+@pytest.fixture
+def pipeline():
+    pipeline = InferencePipeline(StubModelWrapper(base_ms=500, per_item_ms=0), benchmark_config(batch_size=1, cache=False))
+    yield pipeline
+    pipeline.close()
+
+def test_serves_requests(pipeline):
+    async def _run():
+        async with AsyncInferenceServer(pipeline, ServingSettings(max_in_flight=2)) as server:
+            return await asyncio.gather(server.infer("a"), server.infer("bb"))
+
+    outputs = asyncio.run(_run())
+    assert [output.processed_output["label"] for output in outputs] == [1, 0]
+
+def test_stop_releases_clients_of_in_flight_and_queued_requests(pipeline):
+    async def _run():
+        server = AsyncInferenceServer(pipeline, ServingSettings(max_in_flight=1))
+        await server.start()
+        in_flight = asyncio.ensure_future(server.infer("first"))
+        queued = asyncio.ensure_future(server.infer("second"))
+        await asyncio.sleep(0.1)
+        await server.stop()
+        return await asyncio.wait_for(asyncio.gather(in_flight, queued, return_exceptions=True), timeout=5)
+
+    in_flight, queued = asyncio.run(_run())
+    assert isinstance(in_flight, RuntimeError) and "Server stopped" in str(in_flight)
+    assert isinstance(queued, asyncio.CancelledError)
+
+def test_client_cancellation_is_counted_and_stop_still_returns(pipeline):
+    async def _run():
+        server = AsyncInferenceServer(pipeline, ServingSettings(max_in_flight=1))
+        await server.start()
+        request = asyncio.ensure_future(server.infer("a"))
+        await asyncio.sleep(0.1)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        # The worker is still unwinding the abandoned request
+        await asyncio.wait_for(server.stop(), timeout=5)
+        return server.stats
+
+    stats = asyncio.run(_run())
+    assert stats.cancelled == 1
+    assert stats.in_flight == 0
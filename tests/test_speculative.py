@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from benchmark import build_draft_phi
+from greedy import PROMPTS, greedy_config, greedy_reference
+from speculative import SpeculativeDecoder
+
+@pytest.mark.parametrize("num_draft_tokens", [1, 4])
+def test_speculative_decoding_matches_greedy_generate(phi, num_draft_tokens):
+    model, tokenizer = phi
+    decoder = SpeculativeDecoder(model, build_draft_phi(model), tokenizer)
+    for prompt in PROMPTS:
+        ids = tokenizer(prompt)["input_ids"]
+        result = decoder.generate(ids, greedy_config(len(ids)), num_draft_tokens)
+        assert result.generated_tokens == greedy_reference(model, tokenizer, ids)
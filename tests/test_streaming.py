@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from benchmark import load_interface_module
+from streaming import TokenStream
+
+PROMPT = "The quick brown fox jumps over"
+
+@pytest.fixture
+def interface(phi):
+    module = load_interface_module()
+    model, tokenizer = phi
+    interface = module.Phi2Interface(
+        device="cpu",
+        use_cache=False,
+        prefix_cache_bytes=None,
+        model=model,
+        tokenizer=tokenizer
+    )
+    yield interface, module.ModelConfig(temperature=0.0, repetition_penalty=1.0, max_length=500)
+    interface.generation_engine.close()
+
+def _wait_until(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_stream_yields_the_completion(interface):
+    interface, config = interface
+    config.max_length = 40
+    stream = interface.stream_response(PROMPT, config)
+
+    text = "".join(stream)
+    assert stream.result.text.endswith(text)
+    assert stream.result.finish_reason in ("eos", "length")
+
+def test_abandoned_iteration_cancels_generation(interface):
+    interface, config = interface
+    engine = interface.generation_engine
+    stream = interface.stream_response(PROMPT, config)
+    for _ in stream:
+        break
+
+    assert stream.closed
+    _wait_until(lambda: engine.stats.cancelled == 1 and engine.stats.active_sequences == 0)
+    assert len(stream.stats.token_times) < 100
+
+def test_closing_the_async_iterator_cancels_generation(interface):
+    interface, config = interface
+    engine = interface.generation_engine
+
+    async def _consume():
+        stream = interface.stream_response(PROMPT, config)
+        chunks = stream.__aiter__()
+        await chunks.__anext__()
+        await chunks.aclose()
+        return stream
+
+    stream = asyncio.run(_consume())
+    assert stream.closed
+    _wait_until(lambda: engine.stats.cancelled == 1 and engine.stats.active_sequences == 0)
+
+def test_close_stops_model_generate(phi):
+    model, tokenizer = phi
+    prompt_ids = tokenizer(PROMPT, return_tensors="pt").input_ids
+    stream = TokenStream(tokenizer, prompt_ids[0].tolist())
+
+    outputs = []
+    def _generate():
+        outputs.append(model.generate(
+            prompt_ids,
+            do_sample=False,
+            min_new_tokens=400,
+            max_new_tokens=400,
+            pad_token_id=tokenizer.pad_token_id,
+            streamer=stream,
+            stopping_criteria=stream.stopping_criteria()
+        ))
+    producer = threading.Thread(target=_generate)
+    producer.start()
+    _wait_until(lambda: stream.stats.token_times)
+    stream.close()
+    producer.join(30)
+
+    assert not producer.is_alive()
+    assert outputs[0].shape[1] - prompt_ids.shape[1] < 400
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from vector_index import IndexSettings, VectorIndex, create_index, load_index
+
+def _vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+def _exact(vectors, queries, k, metric):
+    if metric == "cosine":
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    if metric == "l2":
+        distances = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(-1)
+        return np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.argsort(-(queries @ vectors.T), axis=1, kind="stable")[:, :k]
+
+def test_vector_index_is_abstract():
+    with pytest.raises(TypeError):
+        VectorIndex(4)
+
+@pytest.mark.parametrize("metric", ["ip", "cosine", "l2"])
+def test_flat_search_is_exact(metric):
+    vectors, queries = _vectors(500), _vectors(20, seed=1)
+    index = create_index(16, IndexSettings(metric=metric, search_block=128))
+    index.add(vectors)
+
+    scores, ids = index.search(queries, k=5)
+
+    assert np.array_equal(ids, _exact(vectors, queries, 5, metric))
+    assert len(index) == 500
+
+def test_ivf_probing_every_list_matches_flat():
+    vectors, queries = _vectors(1000), _vectors(20, seed=1)
+    index = create_index(16, IndexSettings(type="ivf", nlist=8, nprobe=8))
+    index.add(vectors)
+
+    _, ids = index.search(queries, k=5)
+
+    assert np.array_equal(ids, _exact(vectors, queries, 5, "cosine"))
+
+def test_short_results_are_padded():
+    index = create_index(16)
+    index.add(_vectors(3))
+
+    _, ids = index.search(_vectors(2, seed=1), k=5)
+
+    assert (ids[:, 3:] == -1).all()
+    assert (ids[:, :3] >= 0).all()
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf"])
+def test_saved_index_loads_and_accepts_new_vectors(tmp_path, index_type):
+    vectors, queries = _vectors(300), _vectors(10, seed=1)
+    index = create_index(16, IndexSettings(type=index_type, nlist=4, nprobe=4))
+    index.add(vectors)
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    loaded = load_index(path)
+    assert len(loaded) == 300
+    assert np.array_equal(loaded.search(queries, k=5)[1], index.search(queries, k=5)[1])
+
+    new_ids = loaded.add(_vectors(2, seed=2))
+    assert list(new_ids) == [300, 301]
+    assert len(loaded) == 302
@@ -0,0 +1,249 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+@dataclass
+class ProfilingSettings:
+    """Tracing settings from the monitoring.profiling config section"""
+    enabled: bool = False
+    sample_rate: float = 0.01
+    export_trace: bool = True
+    trace_path: str = "./traces"
+    torch_profiler: bool = False
+
+    @classmethod
+    def from_config(cls, profiling: Dict[str, Any]) -> "ProfilingSettings":
+        sample_rate = float(profiling.get("sample_rate", 0.01))
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+        return cls(
+            enabled=profiling.get("enabled", False),
+            sample_rate=sample_rate,
+            export_trace=profiling.get("export_trace", True),
+            trace_path=profiling.get("trace_path", "./traces"),
+            torch_profiler=profiling.get("torch_profiler", False)
+        )
+
+def now() -> int:
+    """Trace clock in nanoseconds"""
+    return time.perf_counter_ns()
+
+class Trace:
+    def __init__(self, trace_id: str, name: str):
+        """
+        Spans recorded for one sampled request.
+
+        Spans are stored as Chrome-trace complete events, so a finished
+        trace can be opened directly in Perfetto or chrome://tracing.
+        """
+        self.trace_id = trace_id
+        self.name = name
+        self.events: List[Dict[str, Any]] = []
+        self.threads: Dict[int, str] = {}
+        self.torch_trace: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, category: str = "stage", **args):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start_ns / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": args
+        }
+        with self._lock:
+            self.events.append(event)
+            self.threads.setdefault(thread.ident, thread.name)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"trace_id": self.trace_id, "name": self.name, "torch_trace": self.torch_trace}
+        }
+
+_active: ContextVar[Tuple[Trace, ...]] = ContextVar("active_traces", default=())
+
+def active_traces() -> Tuple[Trace, ...]:
+    """Traces that spans opened in the current context are recorded into"""
+    return _active.get()
+
+@contextmanager
+def activate(traces: Sequence[Trace]) -> Iterator[None]:
+    """
+    Record spans into traces while the block runs.
+
+    Used where work for sampled requests continues on another thread, e.g.
+    the batcher's dispatch of a batch holding several sampled requests.
+    """
+    token = _active.set(tuple(traces))
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+class _Span:
+    __slots__ = ("name", "traces", "args", "start")
+
+    def __init__(self, name: str, traces: Tuple[Trace, ...], args: Dict[str, Any]):
+        self.name = name
+        self.traces = traces
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.start = now()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = now()
+        for trace in self.traces:
+            trace.add_span(self.name, self.start, end, **self.args)
+        return False
+
+class _NullSpan:
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name: str, **args):
+    """
+    Time a block as a span of every active trace.
+
+    When no sampled request is active this returns a shared no-op context
+    manager, so unsampled requests pay only a context variable lookup.
+    """
+    traces = _active.get()
+    if not traces:
+        return _NULL_SPAN
+    return _Span(name, traces, args)
+
+def record_span(name: str, start_ns: int, end_ns: Optional[int] = None, traces: Optional[Sequence[Trace]] = None, **args):
+    """Record a span measured elsewhere, such as time spent waiting in a queue"""
+    end_ns = now() if end_ns is None else end_ns
+    for trace in (active_traces() if traces is None else traces):
+        trace.add_span(name, start_ns, end_ns, **args)
+
+class Tracer:
+    def __init__(self, settings: Optional[ProfilingSettings] = None, logger: Optional[logging.Logger] = None):
+        """
+        Sampled request tracing with Chrome-trace export.
+
+        A fraction sample_rate of requests is traced. Inside a traced
+        request every span() call, in the pipeline, the batcher and the
+        model wrapper, is recorded, including time spent waiting in queues.
+        Finished traces are written to trace_path as one JSON file per
+        request on a background thread. With torch_profiler enabled, the
+        sampled request is also run under torch.profiler and its
+        operator-level trace is written next to the stage trace.
+
+        Args:
+            settings: Profiling settings
+            logger: Optional logger instance
+        """
+        self.settings = settings or ProfilingSettings()
+        self.logger = logger or logging.getLogger(__name__)
+        self.sampled = 0
+        self._ids = itertools.count()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-writer")
+        # torch.profiler allows one session per process at a time
+        self._profiler_lock = threading.Lock()
+
+    def should_sample(self) -> bool:
+        return self.settings.enabled and random.random() < self.settings.sample_rate
+
+    @contextmanager
+    def trace(self, name: str, force: bool = False, **args) -> Iterator[Optional[Trace]]:
+        """
+        Trace the enclosed request if it is sampled.
+
+        Yields:
+            The Trace, or None when the request is not sampled
+        """
+        if not (force or self.should_sample()):
+            yield None
+            return
+
+        self.sampled += 1
+        trace = Trace(f"{os.getpid()}-{int(time.time() * 1000)}-{next(self._ids)}", name)
+        profiler = self._start_profiler() if self.settings.torch_profiler else None
+        token = _active.set(_active.get() + (trace,))
+        start = now()
+        try:
+            yield trace
+        finally:
+            trace.add_span(name, start, now(), category="request", **args)
+            _active.reset(token)
+            if profiler is not None:
+                self._stop_profiler(profiler)
+            if self.settings.export_trace:
+                self._writer.submit(self._export, trace, profiler)
+
+    def _start_profiler(self):
+        """Start a torch profiler session unless one is already running"""
+        try:
+            import torch # type: ignore
+        except ImportError:
+            self.logger.warning("torch_profiler requested but torch is not installed")
+            return None
+        if not self._profiler_lock.acquire(blocking=False):
+            return None
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+        try:
+            profiler.start()
+        except Exception:
+            self._profiler_lock.release()
+            raise
+        return profiler
+
+    def _stop_profiler(self, profiler: Any):
+        try:
+            profiler.stop()
+        finally:
+            self._profiler_lock.release()
+
+    def _export(self, trace: Trace, profiler: Any = None):
+        try:
+            directory = Path(self.settings.trace_path)
+            directory.mkdir(parents=True, exist_ok=True)
+            if profiler is not None:
+                torch_path = directory / f"trace-{trace.trace_id}.torch.json"
+                profiler.export_chrome_trace(str(torch_path))
+                trace.torch_trace = str(torch_path)
+            path = directory / f"trace-{trace.trace_id}.json"
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(json.dumps(trace.to_chrome_trace(), default=str))
+            os.replace(tmp, path)
+        except Exception as e:
+            self.logger.error(f"Trace export failed: {str(e)}")
+
+    def close(self):
+        """Wait for pending trace files to be written"""
+        self._writer.shutdown(wait=True)
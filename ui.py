@@ -1,4 +1,5 @@
 # phi2_explorer_ui.py
+import logging
 import gradio as gr # type: ignore
 from phi2_explorer import Phi2ExplorerIntegration # type: ignore
 
@@ -72,15 +73,25 @@ class Phi2ExplorerUI:
         return interface
     
     def generate_response(self, prompt, temperature, max_length):
+        # Yield the growing text so Gradio renders the output as it streams
+        stream = None
         try:
-            response = self.model.generate_text(
+            stream = self.model.stream_text(
                 prompt,
                 temperature=temperature,
-                max_length=max_length
+                max_length=int(max_length)
             )
-            return response
+            response = prompt
+            for chunk in stream:
+                response += chunk
+                yield response
+            logging.info(f"Streaming stats: {stream.stats.snapshot()}")
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            yield f"Error generating response: {str(e)}"
+        finally:
+            # Gradio closes this generator when the client goes away
+            if stream is not None:
+                stream.close()
 
 # Launch the interface
 if __name__ == "__main__":
@@ -1,10 +1,21 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer # type: ignore
-import torch # type: ignore
-from typing import Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Sequence, Union
 import logging
+import threading
 import time
-from dataclasses import dataclass
+from concurrent.futures import Future
+from dataclasses import dataclass, asdict
 from enum import Enum
+from caching import LRUCache, SingleFlight, make_cache_key
+from metrics import get_registry
+from persistent_cache import PersistenceSettings, TieredCache
+from streaming import TokenStream
+from prefix_cache import PrefixCache
+from semantic_cache import SemanticCache
+from startup import get_startup_profile, lazy_import, load_pretrained
+from model_registry import get_model_registry
+
+torch = lazy_import("torch")
+transformers = lazy_import("transformers")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,46 +36,205 @@ class ModelConfig:
     num_return_sequences: int = 1
 
 class Phi2Interface:
-    def __init__(self, device: str = "auto", use_cache: bool = True):
+    def __init__(
+        self,
+        device: str = "auto",
+        use_cache: bool = True,
+        cache_size: int = 1000,
+        cache_max_bytes: Optional[int] = 64 * 1024 * 1024,
+        cache_ttl: Optional[float] = None,
+        cache_persistence: Optional[PersistenceSettings] = None,
+        max_batch_size: int = 8,
+        prefix_cache_bytes: Optional[int] = 512 * 1024 * 1024,
+        model: Optional[Any] = None,
+        tokenizer: Optional[Any] = None,
+        lazy_load: bool = True,
+        quantization: Optional[Any] = None,
+        speculative: Optional[Any] = None,
+        draft_model: Optional[Any] = None,
+        semantic_cache: Optional[Any] = None,
+        encoder: Optional[Any] = None
+    ):
+        """
+        Phi-2 generation interface.
+
+        model and tokenizer can be passed in to serve an already loaded (or
+        locally built) model instead of downloading microsoft/phi-2. With
+        lazy_load the model is loaded on first use or by warm() rather than
+        in the constructor. quantization (a QuantizationSettings, normally
+        weight_only int8 or int4) is applied to the loaded model, and the
+        quantized checkpoint is cached so later starts load it directly.
+
+        speculative (a SpeculativeSettings) turns on speculative decoding for
+        single-sequence generate_response calls in the modes it lists: a
+        small draft model sharing Phi-2's tokenizer (draft_model, or loaded
+        from speculative.draft_model) proposes tokens that Phi-2 verifies in
+        one pass. Sampled output keeps Phi-2's own distribution.
+
+        With use_cache, identical concurrent requests (same normalized
+        prompt, mode and config) share one generation, just as later ones
+        share its cached response.
+
+        semantic_cache (a SemanticCacheSettings) adds a second cache level
+        for prompts that miss the exact one: prompts are embedded with a
+        small encoder (encoder, or loaded from semantic_cache.encoder) and a
+        cached response is returned for a paraphrase generated with the same
+        mode and config, tagged with its "semantic_similarity".
+        """
         self.model_name = "microsoft/phi-2"
+        if model is not None:
+            self.model_name = model.config.name_or_path or type(model).__name__
         self.device = device
+        self.quantization = quantization if quantization is not None and quantization.enabled else None
+        self.speculative = speculative if speculative is not None and speculative.enabled else None
+        if self.speculative is not None and draft_model is None and not self.speculative.draft_model:
+            raise ValueError("Speculative decoding needs a draft model")
+        self._draft_model = draft_model
+        self._draft_handle = None
+        self._speculative_decoder = None
         self.use_cache = use_cache
-        self._initialize_model()
-        self.response_cache = {}
+        self.in_flight = SingleFlight(
+            get_registry().counter(
+                "generation_coalesced_requests_total", "Generations answered by an identical request already in flight"
+            )
+        )
+        self.max_batch_size = max_batch_size
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self.prefix_cache = PrefixCache(max_bytes=prefix_cache_bytes) if prefix_cache_bytes else None
+        self._model, self._tokenizer = model, tokenizer
+        self._model_handle = None
+        self._load_lock = threading.Lock()
+        if not lazy_load:
+            self._ensure_loaded()
+        self.response_cache = LRUCache(
+            max_entries=cache_size,
+            max_bytes=cache_max_bytes,
+            ttl_seconds=cache_ttl
+        )
+        if use_cache and cache_persistence is not None and cache_persistence.enabled:
+            self.response_cache = TieredCache.from_settings(
+                self.response_cache, cache_persistence, "phi2_responses.sqlite", logger=logger
+            )
+        self.semantic_cache = None
+        if use_cache and semantic_cache is not None and semantic_cache.enabled:
+            self.semantic_cache = SemanticCache.from_settings(semantic_cache, encoder=encoder, device=device, logger=logger)
         
+    def _ensure_loaded(self):
+        """Load the model and tokenizer once, on first use"""
+        if self._model is not None and self._tokenizer is not None:
+            return
+        with self._load_lock:
+            if self._model is None or self._tokenizer is None:
+                # Shared with every other owner of the same checkpoint in the process
+                self._model_handle = get_model_registry().acquire(
+                    self.model_name,
+                    self._initialize_model,
+                    variant=("AutoModelForCausalLM", "float16", self.device, self.quantization and self.quantization.label)
+                )
+                self._model, self._tokenizer = self._model_handle.model, self._model_handle.tokenizer
+
     def _initialize_model(self):
         """Initialize model with error handling and logging"""
         try:
             logger.info(f"Initializing Phi-2 model on device: {self.device}")
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
-                torch_dtype=torch.float16,
-                device_map=self.device,
-                trust_remote_code=True
-            )
+            tokenizer = transformers.AutoTokenizer.from_pretrained(self.model_name)
+            def load_float():
+                return load_pretrained(
+                    transformers.AutoModelForCausalLM,
+                    self.model_name,
+                    torch_dtype=torch.float16,
+                    logger=logger,
+                    device_map=self.device,
+                    trust_remote_code=True
+                )
+            if self.quantization is not None:
+                from quantization import load_or_quantize
+                model_config = transformers.AutoConfig.from_pretrained(self.model_name, trust_remote_code=True)
+                model = load_or_quantize(
+                    f"{self.model_name}@main|float16",
+                    self.quantization,
+                    load_float,
+                    build_skeleton=lambda: transformers.AutoModelForCausalLM.from_config(model_config, trust_remote_code=True),
+                    logger=logger
+                )
+            else:
+                model = load_float()
             logger.info("Model initialization successful")
+            return model, tokenizer
         except Exception as e:
             logger.error(f"Model initialization failed: {str(e)}")
             raise
 
+    @property
+    def model(self) -> Any:
+        self._ensure_loaded()
+        return self._model
+
+    @property
+    def tokenizer(self) -> Any:
+        self._ensure_loaded()
+        return self._tokenizer
+
+    def warm(self) -> Dict[str, Any]:
+        """
+        Load the model and run a first generation step ahead of the first request.
+
+        Returns:
+            The startup time breakdown
+        """
+        profile = get_startup_profile()
+        with profile.measure("first_inference", self.model_name):
+            inputs = self.tokenizer("Hello", return_tensors="pt").to(self.model.device)
+            with torch.no_grad():
+                self.model.generate(**inputs, max_new_tokens=1, pad_token_id=self.tokenizer.eos_token_id)
+            # Starting the engine also caches the mode prefixes
+            self.generation_engine
+        logger.info(profile.format_report())
+        return profile.report()
+
     def generate_response(
         self,
         prompt: str,
         config: Optional[ModelConfig] = None,
         mode: ModelMode = ModelMode.STANDARD,
         stream: bool = False
-    ) -> Dict[str, Union[str, float, int]]:
+    ) -> Union[Dict[str, Union[str, float, int]], TokenStream]:
         """
         Generate response with enhanced features and performance metrics
+
+        With stream=True a TokenStream is returned instead; see stream_response.
         """
         config = config or ModelConfig()
+        if stream:
+            return self.stream_response(prompt, config, mode)
         
+        num_draft_tokens = self.speculative.draft_tokens_for(mode.value) if self.speculative is not None else 0
+        if config.num_return_sequences == 1 and not num_draft_tokens:
+            # Single sequences share the engine's running batch and prefix cache
+            return self.generate_batch([prompt], [config], [mode])[0]
+
         # Check cache if enabled
-        cache_key = f"{prompt}_{mode.value}_{config}"
-        if self.use_cache and cache_key in self.response_cache:
-            return self.response_cache[cache_key]
+        cache_key = self._cache_key(prompt, config, mode)
+        if self.use_cache:
+            cached_response = self._lookup_caches([prompt], [config], [mode], [cache_key])[0]
+            if cached_response is not None:
+                return cached_response
 
+        if config.num_return_sequences == 1:
+            generate = lambda: self._generate_speculative(prompt, config, mode, cache_key, num_draft_tokens)
+        else:
+            generate = lambda: self._generate_sequences(prompt, config, mode, cache_key)
+        return self.in_flight.run(cache_key, generate) if self.use_cache else generate()
+
+    def _generate_sequences(
+        self,
+        prompt: str,
+        config: ModelConfig,
+        mode: ModelMode,
+        cache_key: str
+    ) -> Dict[str, Union[str, float, int]]:
+        """Generate num_return_sequences samples for one prompt with model.generate"""
         try:
             start_time = time.time()
             
@@ -109,7 +279,7 @@ class Phi2Interface:
 
             # Cache response if enabled
             if self.use_cache:
-                self.response_cache[cache_key] = response_data
+                self._store_response(cache_key, prompt, config, mode, response_data)
 
             return response_data
 
@@ -117,6 +287,258 @@ class Phi2Interface:
             logger.error(f"Generation failed: {str(e)}")
             raise
 
+    def _generate_speculative(
+        self,
+        prompt: str,
+        config: ModelConfig,
+        mode: ModelMode,
+        cache_key: str,
+        num_draft_tokens: int
+    ) -> Dict[str, Union[str, float, int]]:
+        """Generate one response with the draft model proposing num_draft_tokens tokens per Phi-2 pass"""
+        try:
+            prompt_ids = self.tokenizer(self._format_prompt_for_mode(prompt, mode))["input_ids"]
+            result = self.speculative_decoder.generate(prompt_ids, config, num_draft_tokens, label=mode.value)
+            response_data = {
+                "text": result.text,
+                "generation_time": result.generation_time,
+                "token_count": result.prompt_tokens + len(result.generated_tokens),
+                "mode": mode.value,
+                "model_name": self.model_name
+            }
+            if self.use_cache:
+                self._store_response(cache_key, prompt, config, mode, response_data)
+            return response_data
+
+        except Exception as e:
+            logger.error(f"Speculative generation failed: {str(e)}")
+            raise
+
+    @property
+    def speculative_decoder(self) -> "SpeculativeDecoder":
+        """Speculative decoder over Phi-2 and the draft model, created on first use"""
+        if self._speculative_decoder is None:
+            from speculative import SpeculativeDecoder
+
+            model, tokenizer = self.model, self.tokenizer
+            with self._load_lock:
+                if self._speculative_decoder is None:
+                    if self._draft_model is None:
+                        name = self.speculative.draft_model
+                        self._draft_handle = get_model_registry().acquire(
+                            name,
+                            lambda: (self._load_draft_model(name), None),
+                            variant=("AutoModelForCausalLM", "float16", self.device)
+                        )
+                        self._draft_model = self._draft_handle.model
+                    if self._draft_model.config.vocab_size > model.config.vocab_size:
+                        raise ValueError(
+                            f"Draft model vocabulary ({self._draft_model.config.vocab_size}) is larger than "
+                            f"{self.model_name}'s ({model.config.vocab_size}); they must share a tokenizer"
+                        )
+                    self._speculative_decoder = SpeculativeDecoder(model, self._draft_model, tokenizer, logger=logger)
+        return self._speculative_decoder
+
+    def _load_draft_model(self, name: str) -> Any:
+        logger.info(f"Loading draft model {name} on device: {self.device}")
+        return load_pretrained(
+            transformers.AutoModelForCausalLM,
+            name,
+            torch_dtype=torch.float16,
+            logger=logger,
+            device_map=self.device,
+            trust_remote_code=True
+        )
+
+    def generate_batch(
+        self,
+        prompts: Sequence[str],
+        configs: Optional[Sequence[Optional[ModelConfig]]] = None,
+        modes: Optional[Sequence[ModelMode]] = None
+    ) -> List[Dict[str, Union[str, float, int]]]:
+        """
+        Generate responses for several prompts through one batched decode loop.
+
+        Prompts are left padded and decoded together by the continuous
+        batching engine, each with its own sampling config and mode. Prompts
+        submitted concurrently from other threads join the running batch.
+        """
+        configs = configs or [None] * len(prompts)
+        modes = modes or [ModelMode.STANDARD] * len(prompts)
+        if not len(prompts) == len(configs) == len(modes):
+            raise ValueError("prompts, configs and modes must have the same length")
+        configs = [config or ModelConfig() for config in configs]
+
+        responses = [None] * len(prompts)
+        futures = {}
+        try:
+            cache_keys = [self._cache_key(prompt, config, mode) for prompt, config, mode in zip(prompts, configs, modes)]
+            if self.use_cache:
+                responses = self._lookup_caches(prompts, configs, modes, cache_keys)
+            for index, (prompt, config, mode) in enumerate(zip(prompts, configs, modes)):
+                if responses[index] is None:
+                    futures[index] = self._submit_generation(prompt, config, mode, cache_keys[index])
+
+            for index, future in futures.items():
+                responses[index] = future.result()
+
+            return responses
+
+        except Exception as e:
+            logger.error(f"Batched generation failed: {str(e)}")
+            raise
+
+    def _submit_generation(self, prompt: str, config: ModelConfig, mode: ModelMode, cache_key: str) -> "Future":
+        """
+        Queue a prompt on the generation engine; the future resolves to its response dict.
+
+        With use_cache, a prompt identical to one already being generated
+        gets that generation's future instead of queueing again.
+        """
+        if self.use_cache:
+            future, leader = self.in_flight.join(cache_key)
+            if not leader:
+                return future
+        else:
+            future = Future()
+
+        def _resolve(result: Any = None, exception: Optional[BaseException] = None):
+            if self.use_cache:
+                self.in_flight.complete(cache_key, result, exception)
+            elif exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+        def _finish(engine_future: "Future"):
+            try:
+                result = engine_future.result()
+            except BaseException as e:
+                _resolve(exception=e)
+                return
+            response_data = {
+                "text": result.text,
+                "generation_time": result.generation_time,
+                "token_count": result.prompt_tokens + len(result.generated_tokens),
+                "mode": mode.value,
+                "model_name": self.model_name
+            }
+            if self.use_cache:
+                self._store_response(cache_key, prompt, config, mode, response_data)
+            _resolve(response_data)
+
+        try:
+            engine_future = self.generation_engine.submit(self._format_prompt_for_mode(prompt, mode), config)
+        except Exception as e:
+            _resolve(exception=e)
+            return future
+        engine_future.add_done_callback(_finish)
+        return future
+
+    def stream_response(
+        self,
+        prompt: str,
+        config: Optional[ModelConfig] = None,
+        mode: ModelMode = ModelMode.STANDARD
+    ) -> TokenStream:
+        """
+        Stream a response as it is generated.
+
+        The returned TokenStream yields decoded text deltas of the
+        completion (without the prompt) and can be consumed with either
+        "for chunk in stream" or "async for chunk in stream". Its stats
+        report time to first token and inter-token latency; the full
+        response dict is cached once generation finishes. Closing the
+        stream, or abandoning its iteration, cancels the generation and
+        frees its batch slot.
+        """
+        config = config or ModelConfig()
+        cache_key = self._cache_key(prompt, config, mode)
+        formatted_prompt = self._format_prompt_for_mode(prompt, mode)
+        prompt_ids = self.tokenizer(formatted_prompt)["input_ids"]
+        token_stream = TokenStream(
+            self.tokenizer,
+            prompt_ids,
+            stop_token_ids=[self.tokenizer.eos_token_id]
+        )
+
+        future = self.generation_engine.submit_ids(prompt_ids, config, on_token=token_stream.push)
+        token_stream.stats.start_time = time.time()
+
+        def _cache_result(f):
+            if self.use_cache and not f.cancelled() and f.exception() is None:
+                result = f.result()
+                self._store_response(cache_key, prompt, config, mode, {
+                    "text": result.text,
+                    "generation_time": result.generation_time,
+                    "token_count": result.prompt_tokens + len(result.generated_tokens),
+                    "mode": mode.value,
+                    "model_name": self.model_name
+                })
+                logger.info(f"Stream finished: {token_stream.stats.snapshot()}")
+        future.add_done_callback(_cache_result)
+        return token_stream.attach(future)
+
+    @property
+    def generation_engine(self) -> "ContinuousBatchingEngine":
+        """Continuous batching engine, started on first use"""
+        if self._engine is None:
+            from generation import ContinuousBatchingEngine
+
+            model, tokenizer = self.model, self.tokenizer
+            with self._engine_lock:
+                if self._engine is None:
+                    engine = ContinuousBatchingEngine(
+                        model,
+                        tokenizer,
+                        max_batch_size=self.max_batch_size,
+                        prefix_cache=self.prefix_cache,
+                        logger=logger
+                    )
+                    # Every CODING/TECHNICAL prompt starts with its mode prefix
+                    engine.warm_prefixes([self._format_prompt_for_mode("", mode) for mode in ModelMode])
+                    self._engine = engine
+        return self._engine
+
+    def _cache_key(self, prompt: str, config: ModelConfig, mode: ModelMode) -> str:
+        return make_cache_key(prompt.strip(), self.model_name, mode=mode.value, **asdict(config))
+
+    def _semantic_namespace(self, config: ModelConfig, mode: ModelMode) -> str:
+        """Semantic cache partition: responses are only reused within a mode and sampling config"""
+        return make_cache_key("", self.model_name, mode=mode.value, **asdict(config))
+
+    def _lookup_caches(
+        self,
+        prompts: Sequence[str],
+        configs: Sequence[ModelConfig],
+        modes: Sequence[ModelMode],
+        cache_keys: Sequence[str]
+    ) -> List[Optional[Dict[str, Union[str, float, int]]]]:
+        """Exact cache lookups, then one semantic cache lookup for the prompts that missed"""
+        responses = [self.response_cache.get(cache_key) for cache_key in cache_keys]
+        misses = [index for index, response in enumerate(responses) if response is None]
+        if self.semantic_cache is not None and misses:
+            hits = self.semantic_cache.lookup(
+                [prompts[index] for index in misses],
+                [self._semantic_namespace(configs[index], modes[index]) for index in misses]
+            )
+            for index, hit in zip(misses, hits):
+                if hit is not None:
+                    responses[index] = {**hit.value, "semantic_similarity": hit.similarity}
+        return responses
+
+    def _store_response(
+        self,
+        cache_key: str,
+        prompt: str,
+        config: ModelConfig,
+        mode: ModelMode,
+        response_data: Dict[str, Union[str, float, int]]
+    ):
+        self.response_cache.put(cache_key, response_data)
+        if self.semantic_cache is not None:
+            self.semantic_cache.put(prompt, self._semantic_namespace(config, mode), response_data)
+
     def _format_prompt_for_mode(self, prompt: str, mode: ModelMode) -> str:
         """Format prompt based on selected mode"""
         mode_prefixes = {
@@ -127,10 +549,31 @@ class Phi2Interface:
         return f"{mode_prefixes[mode]}{prompt}"
 
     def clear_cache(self):
-        """Clear the response cache"""
+        """Clear the response caches"""
         self.response_cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
         logger.info("Response cache cleared")
 
+    def close(self):
+        """Stop the generation engine, release the models and flush the persistent response cache"""
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+        self._speculative_decoder = None
+        if self._draft_handle is not None:
+            self._draft_handle.release()
+            self._draft_handle = None
+            self._draft_model = None
+        if self._model_handle is not None:
+            self._model_handle.release()
+            self._model_handle = None
+            self._model = self._tokenizer = None
+        if isinstance(self.response_cache, TieredCache):
+            self.response_cache.close()
+        if self.semantic_cache is not None:
+            self.semantic_cache.close()
+
     @property
     def model_info(self) -> Dict:
         """Return model information and current configuration"""
@@ -139,5 +582,10 @@ class Phi2Interface:
             "device": self.device,
             "model_parameters": "2.7B",
             "context_window": 2048,
-            "cache_enabled": self.use_cache
+            "cache_enabled": self.use_cache,
+            "cache_stats": self.response_cache.snapshot(),
+            "semantic_cache_stats": self.semantic_cache.snapshot() if self.semantic_cache is not None else None,
+            "prefix_cache_stats": self.prefix_cache.snapshot() if self.prefix_cache is not None else None,
+            "speculative_stats": self._speculative_decoder.snapshot() if self._speculative_decoder is not None else None,
+            "coalescing_stats": self.in_flight.snapshot()
         }
@@ -0,0 +1,419 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from outputs import load_arrays, save_arrays
+
+INDEX_TYPES = ("flat", "ivf")
+METRICS = ("ip", "cosine", "l2")
+
+@dataclass
+class IndexSettings:
+    """
+    Vector index settings from the inference.vector_index config section.
+
+    flat scores every vector; ivf clusters the vectors into nlist lists
+    with k-means and scores only the nprobe lists closest to each query.
+    """
+    type: str = "flat"
+    metric: str = "cosine"
+    nlist: int = 1024
+    nprobe: int = 16
+    train_size: int = 65536
+    kmeans_iterations: int = 10
+    search_block: int = 65536
+
+    @classmethod
+    def from_config(cls, index: Dict[str, Any]) -> "IndexSettings":
+        settings = cls(**{k: v for k, v in index.items() if k in cls.__dataclass_fields__})
+        if settings.type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported vector index type: {settings.type}")
+        if settings.metric not in METRICS:
+            raise ValueError(f"Unsupported vector index metric: {settings.metric}")
+        if settings.nlist < 1 or settings.nprobe < 1:
+            raise ValueError("nlist and nprobe must be positive")
+        return settings
+
+class _Rows:
+    """
+    Growable float32 matrix with an id per row.
+
+    Rows live in one contiguous buffer whose capacity doubles, so inserts
+    are amortized O(1) and reads are views. A buffer loaded read-only from
+    a memory-mapped file is copied on the first insert. With l2 the half
+    squared norm of every row is kept for scoring.
+    """
+
+    def __init__(self, dim: int, l2: bool, vectors=None, ids=None, half_norms=None):
+        self.dim = dim
+        self.l2 = l2
+        self._vectors = vectors if vectors is not None else np.empty((0, dim), dtype=np.float32)
+        self._ids = ids if ids is not None else np.empty(0, dtype=np.int64)
+        self._half_norms = half_norms if half_norms is not None or not l2 else np.empty(0, dtype=np.float32)
+        self.count = len(self._ids)
+
+    def append(self, vectors: "np.ndarray", ids: "np.ndarray"):
+        needed = self.count + len(ids)
+        if needed > len(self._ids) or not self._vectors.flags.writeable:
+            capacity = max(needed, 2 * len(self._ids), 16)
+            self._vectors = self._grow(self._vectors, (capacity, self.dim))
+            self._ids = self._grow(self._ids, (capacity,))
+            if self.l2:
+                self._half_norms = self._grow(self._half_norms, (capacity,))
+        self._vectors[self.count:needed] = vectors
+        self._ids[self.count:needed] = ids
+        if self.l2:
+            self._half_norms[self.count:needed] = 0.5 * np.einsum("ij,ij->i", vectors, vectors)
+        # Publish the rows only once they are written, for concurrent readers
+        self.count = needed
+
+    def _grow(self, array: "np.ndarray", shape: Tuple[int, ...]) -> "np.ndarray":
+        grown = np.empty(shape, dtype=array.dtype)
+        grown[:self.count] = array[:self.count]
+        return grown
+
+    def view(self) -> Tuple["np.ndarray", "np.ndarray", Optional["np.ndarray"]]:
+        """The rows written so far; stays valid while more are appended"""
+        count = self.count
+        half_norms = self._half_norms[:count] if self.l2 else None
+        return self._vectors[:count], self._ids[:count], half_norms
+
+def _merge_topk(
+    scores: "np.ndarray",
+    ids: "np.ndarray",
+    k: int,
+    best: Optional[Tuple["np.ndarray", "np.ndarray"]] = None
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Best k of a block of scores per row, merged with the best found so far (unsorted)"""
+    if best is not None:
+        scores = np.concatenate([best[0], scores], axis=1)
+        ids = np.concatenate([best[1], ids], axis=1)
+    if scores.shape[1] <= k:
+        return scores, ids
+    top = np.argpartition(scores, -k, axis=1)[:, -k:]
+    return np.take_along_axis(scores, top, axis=1), np.take_along_axis(ids, top, axis=1)
+
+def _score(queries: "np.ndarray", vectors: "np.ndarray", half_norms: Optional["np.ndarray"]) -> "np.ndarray":
+    """Higher is closer; for l2 this is q.x - |x|^2 / 2, which ranks like -|q - x|^2"""
+    scores = queries @ vectors.T
+    if half_norms is not None:
+        scores -= half_norms
+    return scores
+
+class VectorIndex(ABC):
+    def __init__(self, dim: int, settings: Optional[IndexSettings] = None, logger: Optional[logging.Logger] = None):
+        """
+        Top-k nearest neighbour search over embedding vectors.
+
+        search() takes a matrix of queries and scores them together with
+        one matrix multiply per block of stored vectors, returning the k
+        best (score, id) pairs per query, best first. Scores are inner
+        products for ip and cosine (vectors and queries are normalized for
+        cosine) and squared distances for l2. add() may be called at any
+        time; each call assigns consecutive ids unless ids are given.
+
+        Args:
+            dim: Vector dimension
+            settings: Index settings
+            logger: Optional logger instance
+        """
+        self.dim = dim
+        self.settings = settings or IndexSettings()
+        self.logger = logger or logging.getLogger(__name__)
+        self.next_id = 0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def _prepare(self, vectors: Any) -> "np.ndarray":
+        """Contiguous float32 rows, unit length for cosine"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got shape {vectors.shape}")
+        if self.settings.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def add(self, vectors: Any, ids: Optional[Sequence[int]] = None) -> "np.ndarray":
+        """
+        Insert vectors.
+
+        Returns:
+            The ids of the inserted vectors
+        """
+        vectors = self._prepare(vectors)
+        with self._lock:
+            if ids is None:
+                ids = np.arange(self.next_id, self.next_id + len(vectors), dtype=np.int64)
+            else:
+                ids = np.asarray(ids, dtype=np.int64)
+                if ids.shape != (len(vectors),):
+                    raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+            if len(ids):
+                self.next_id = max(self.next_id, int(ids.max()) + 1)
+                self._add(vectors, ids)
+        return ids
+
+    def search(self, queries: Any, k: int = 10, **kwargs) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Find the k nearest stored vectors of every query.
+
+        Returns:
+            (scores, ids), each of shape (queries, k) and best first; rows
+            with fewer than k results are padded with id -1
+        """
+        queries = self._prepare(queries)
+        return self._finish(queries, self._search(queries, k, **kwargs), k)
+
+    def _finish(self, queries: "np.ndarray", best, k: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if best is not None:
+            found = best[0].shape[1]
+            order = np.argsort(-best[0], axis=1, kind="stable")
+            scores[:, :found] = np.take_along_axis(best[0], order, axis=1)
+            ids[:, :found] = np.take_along_axis(best[1], order, axis=1)
+        if self.settings.metric == "l2":
+            # Back from q.x - |x|^2 / 2 to |q - x|^2
+            scores = np.einsum("ij,ij->i", queries, queries)[:, None] - 2 * scores
+            scores[ids < 0] = np.inf
+        return scores, ids
+
+    @abstractmethod
+    def _add(self, vectors: "np.ndarray", ids: "np.ndarray"):
+        """Store prepared vectors under their ids; called with the lock held"""
+
+    @abstractmethod
+    def _search(self, queries: "np.ndarray", k: int, **kwargs):
+        """Return (scores, ids) of up to k candidates per query in any order, or None if empty"""
+
+    @abstractmethod
+    def _arrays(self) -> Dict[str, "np.ndarray"]:
+        """Arrays written by save(), keyed by name"""
+
+    def save(self, path: str):
+        """
+        Write the index to a single uncompressed .npz file.
+
+        load_index() memory-maps it, so a large index opens without being
+        read into memory and pages in as lists are searched.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {"type": self.settings.type, "dim": self.dim, "next_id": self.next_id, "settings": self.settings.__dict__}
+        with self._lock:
+            arrays = self._arrays()
+        arrays["meta"] = np.array(json.dumps(meta))
+        tmp = path.with_name(f"tmp-{path.name}")
+        save_arrays(str(tmp), arrays)
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+class FlatIndex(VectorIndex):
+    """Exact search: every stored vector is scored, search_block rows per matrix multiply"""
+
+    def __init__(self, dim: int, settings: Optional[IndexSettings] = None, logger: Optional[logging.Logger] = None):
+        super().__init__(dim, settings, logger)
+        self.rows = _Rows(dim, self.settings.metric == "l2")
+
+    def __len__(self) -> int:
+        return self.rows.count
+
+    def _add(self, vectors: "np.ndarray", ids: "np.ndarray"):
+        self.rows.append(vectors, ids)
+
+    def _search(self, queries: "np.ndarray", k: int):
+        vectors, ids, half_norms = self.rows.view()
+        best = None
+        block = self.settings.search_block
+        for start in range(0, len(ids), block):
+            end = start + block
+            scores = _score(queries, vectors[start:end], half_norms[start:end] if half_norms is not None else None)
+            block_ids = np.broadcast_to(ids[start:end], scores.shape)
+            best = _merge_topk(scores, block_ids, k, best)
+        return best
+
+    def _arrays(self) -> Dict[str, "np.ndarray"]:
+        vectors, ids, half_norms = self.rows.view()
+        arrays = {"vectors": vectors, "ids": ids}
+        if half_norms is not None:
+            arrays["half_norms"] = half_norms
+        return arrays
+
+class IVFIndex(VectorIndex):
+    """
+    Approximate search over an inverted file.
+
+    The first add() trains nlist centroids with k-means on up to
+    train_size of its vectors; every vector is then stored in the list of
+    its closest centroid. A query is scored against the centroids and
+    then only against the vectors of its nprobe closest lists, so the
+    work per query is about nprobe / nlist of a flat search. Queries that
+    probe the same list are scored against it in one matrix multiply.
+    """
+
+    def __init__(self, dim: int, settings: Optional[IndexSettings] = None, logger: Optional[logging.Logger] = None):
+        super().__init__(dim, settings, logger)
+        self.centroids: Optional["np.ndarray"] = None
+        self.lists: List[_Rows] = []
+
+    def __len__(self) -> int:
+        return sum(rows.count for rows in self.lists)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: Any):
+        """Fit the centroids; called by the first add() if the index is untrained"""
+        vectors = self._prepare(vectors)
+        if not len(vectors):
+            raise ValueError("IVF index needs vectors to train on")
+        nlist = self.settings.nlist
+        if len(vectors) < nlist:
+            self.logger.warning(f"Training IVF index on {len(vectors)} vectors; using that many lists instead of nlist={nlist}")
+            nlist = len(vectors)
+        start = time.time()
+        rng = np.random.default_rng(0)
+        if len(vectors) > self.settings.train_size:
+            vectors = vectors[rng.choice(len(vectors), self.settings.train_size, replace=False)]
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(self.settings.kmeans_iterations):
+            assignment = self._assign(vectors, centroids)
+            counts = np.bincount(assignment, minlength=nlist)
+            order = np.argsort(assignment, kind="stable")
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            filled = counts > 0
+            sums = np.add.reduceat(vectors[order], starts[filled], axis=0)
+            centroids[filled] = sums / counts[filled, None]
+            # Restart empty lists from random vectors
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+            if self.settings.metric == "cosine":
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self.centroids = centroids
+        self.lists = [_Rows(self.dim, self.settings.metric == "l2") for _ in range(nlist)]
+        self.logger.info(f"Trained {nlist} IVF lists on {len(vectors)} vectors in {time.time() - start:.2f}s")
+
+    def _centroid_half_norms(self, centroids: "np.ndarray") -> Optional["np.ndarray"]:
+        if self.settings.metric != "l2":
+            return None
+        return 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+
+    def _assign(self, vectors: "np.ndarray", centroids: "np.ndarray", block: int = 16384) -> "np.ndarray":
+        """Closest centroid of every vector, scored block rows at a time"""
+        half_norms = self._centroid_half_norms(centroids)
+        return np.concatenate([
+            np.argmax(_score(vectors[start:start + block], centroids, half_norms), axis=1)
+            for start in range(0, len(vectors), block)
+        ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+    def _add(self, vectors: "np.ndarray", ids: "np.ndarray"):
+        if not self.trained:
+            self.train(vectors)
+        assignment = self._assign(vectors, self.centroids)
+        order = np.argsort(assignment, kind="stable")
+        lists, starts = np.unique(assignment[order], return_index=True)
+        for number, start, end in zip(lists, starts, list(starts[1:]) + [len(order)]):
+            rows = order[start:end]
+            self.lists[number].append(vectors[rows], ids[rows])
+
+    def _search(self, queries: "np.ndarray", k: int, nprobe: Optional[int] = None):
+        if not self.trained:
+            return None
+        nprobe = min(nprobe or self.settings.nprobe, len(self.lists))
+        centroid_scores = _score(queries, self.centroids, self._centroid_half_norms(self.centroids))
+        if nprobe < len(self.lists):
+            probes = np.argpartition(centroid_scores, -nprobe, axis=1)[:, -nprobe:]
+        else:
+            probes = np.broadcast_to(np.arange(nprobe), (len(queries), nprobe))
+
+        # Candidate slots per query: k for each probed list
+        scores = np.full((len(queries), nprobe * k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), nprobe * k), -1, dtype=np.int64)
+        flat = probes.ravel()
+        order = np.argsort(flat, kind="stable")
+        lists, starts = np.unique(flat[order], return_index=True)
+        for number, start, end in zip(lists, starts, list(starts[1:]) + [len(order)]):
+            vectors, list_ids, half_norms = self.lists[number].view()
+            if not len(list_ids):
+                continue
+            entries = order[start:end]
+            rows, slots = entries // nprobe, entries % nprobe
+            list_scores = _score(queries[rows], vectors, half_norms)
+            found = min(k, len(list_ids))
+            if found < len(list_ids):
+                top = np.argpartition(list_scores, -found, axis=1)[:, -found:]
+            else:
+                top = np.broadcast_to(np.arange(found), (len(rows), found))
+            columns = slots[:, None] * k + np.arange(found)
+            scores[rows[:, None], columns] = np.take_along_axis(list_scores, top, axis=1)
+            ids[rows[:, None], columns] = list_ids[top]
+        return _merge_topk(scores, ids, k)
+
+    def _arrays(self) -> Dict[str, "np.ndarray"]:
+        if not self.trained:
+            return {}
+        views = [rows.view() for rows in self.lists]
+        arrays = {
+            "centroids": self.centroids,
+            "offsets": np.cumsum([0] + [len(view[1]) for view in views]).astype(np.int64),
+            "vectors": np.concatenate([view[0] for view in views]),
+            "ids": np.concatenate([view[1] for view in views])
+        }
+        if self.settings.metric == "l2":
+            arrays["half_norms"] = np.concatenate([view[2] for view in views])
+        return arrays
+
+INDEXES = {"flat": FlatIndex, "ivf": IVFIndex}
+
+def create_index(dim: int, settings: Optional[IndexSettings] = None, logger: Optional[logging.Logger] = None) -> VectorIndex:
+    """Build an empty index of the configured type"""
+    settings = settings or IndexSettings()
+    return INDEXES[settings.type](dim, settings, logger=logger)
+
+def load_index(path: str, mmap: bool = True, logger: Optional[logging.Logger] = None) -> VectorIndex:
+    """
+    Open an index written by VectorIndex.save().
+
+    With mmap the stored vectors stay in the page cache-backed file and
+    are only copied into memory for lists that receive new inserts.
+    """
+    arrays = load_arrays(path, mmap=mmap)
+    meta = json.loads(arrays.pop("meta").item())
+    settings = IndexSettings(**meta["settings"])
+    index = create_index(meta["dim"], settings, logger=logger)
+    index.next_id = meta["next_id"]
+    half_norms = arrays.get("half_norms")
+    if isinstance(index, FlatIndex):
+        if "ids" in arrays:
+            index.rows = _Rows(index.dim, settings.metric == "l2", arrays["vectors"], arrays["ids"], half_norms)
+    elif "centroids" in arrays:
+        index.centroids = np.asarray(arrays["centroids"])
+        offsets = arrays["offsets"]
+        index.lists = [
+            _Rows(
+                index.dim,
+                settings.metric == "l2",
+                arrays["vectors"][start:end],
+                arrays["ids"][start:end],
+                half_norms[start:end] if half_norms is not None else None
+            )
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+    return index
@@ -1,11 +1,23 @@
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 from dataclasses import dataclass
-import torch
-from transformers import AutoTokenizer, AutoModel, AutoConfig
 import logging
 from pathlib import Path
 import json
+import threading
 from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from metrics import get_registry, synchronize
+from model_registry import ModelHandle, RegistrySettings, get_model_registry
+from startup import get_startup_profile, lazy_import, load_pretrained
+from outputs import OutputSettings, to_numpy
+from embeddings import EmbeddingSettings, hidden_states, pool
+from columnar import InputBatch
+import tracing
+
+# Imported on first use so constructing the wrapper stays cheap
+torch = lazy_import("torch")
+transformers = lazy_import("transformers")
+np = lazy_import("numpy")
 
 @dataclass
 class ModelMetadata:
@@ -26,6 +38,10 @@ class ModelWrapper:
     ):
         """
         Enhanced model wrapper with comprehensive initialization and management.
+
+        With inference.startup.lazy_load (the default) torch and the model
+        are only loaded on the first request or an explicit warm() call, so
+        a new replica starts accepting connections immediately.
         
         Args:
             config: Configuration dictionary containing model settings
@@ -34,20 +50,67 @@ class ModelWrapper:
         """
         self.config = config
         self.logger = logger or logging.getLogger(__name__)
-        self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.requested_device = device
+        self.output_settings = OutputSettings.from_config(config.get('output', {}))
+        self.embedding_settings = EmbeddingSettings.from_config(config['model'].get('embeddings', {}))
         
         # Initialize model metadata
         self.metadata = self._initialize_metadata()
         
-        # Set up model execution environment
-        self._setup_environment()
-        
-        # Load model and tokenizer
-        self.model, self.tokenizer = self._load_model()
-        
         # Initialize thread pool for parallel processing
         self.executor = ThreadPoolExecutor(max_workers=config.get('num_workers', 4))
 
+        # Throughput counter for this model; the latency histogram needs the device
+        self.metrics = get_registry()
+        self.samples = self.metrics.counter(
+            'model_samples_total', 'Samples run through the model', model=self.metadata.model_name
+        )
+
+        self.loaded = False
+        self._load_lock = threading.Lock()
+        self._first_inference = True
+        if not config.get('inference', {}).get('startup', {}).get('lazy_load', True):
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        """Materialize the model, tokenizer, padder and backend once"""
+        if self.loaded:
+            return
+        with self._load_lock:
+            if self.loaded:
+                return
+            self.device = self.requested_device or ('cuda' if torch.cuda.is_available() else 'cpu')
+
+            # Set up model execution environment
+            self._setup_environment()
+
+            # Share one copy of the model and tokenizer with every other owner in the process
+            self._model_handle = self._acquire_model()
+            self.model, self.tokenizer = self._model_handle.model, self._model_handle.tokenizer
+
+            # Tokenize once and pad each batch only to its length bucket
+            self.padder = self._create_padder()
+
+            # Run forward passes through the configured execution backend
+            self.backend = self._create_backend()
+
+            self.latency = self.metrics.histogram(
+                'model_inference_seconds', 'Forward pass latency', model=self.metadata.model_name, device=self.device
+            )
+            self.loaded = True
+
+    def warm(self) -> Dict[str, Any]:
+        """
+        Load the model and run one forward pass ahead of the first request.
+
+        Returns:
+            The startup time breakdown
+        """
+        self._ensure_loaded()
+        if self._first_inference:
+            self.infer_sync('warmup')
+        return get_startup_profile().report()
+
     def _initialize_metadata(self) -> ModelMetadata:
         """Initialize and validate model metadata"""
         return ModelMetadata(
@@ -76,38 +139,94 @@ class ModelWrapper:
             self.logger.error(f"Environment setup failed: {str(e)}")
             raise
 
+    def _acquire_model(self) -> ModelHandle:
+        """Get the model from the process-wide registry, loading it only if no one else has"""
+        registry = get_model_registry()
+        registry_config = self.config['hardware'].get('model_registry')
+        if registry_config is not None:
+            registry.configure(RegistrySettings.from_config(registry_config))
+        quantization = self.config['model']['quantization']
+        return registry.acquire(
+            self.config['model']['name'],
+            self._load_model,
+            revision=self.config['model'].get('revision', 'main'),
+            variant=(
+                'AutoModel',
+                self.config['model']['tokenizer_name'],
+                self.config['hardware']['compute_precision']['dtype'],
+                (quantization['method'], quantization.get('bits', 8)) if quantization['enabled'] else None,
+                str(self.device),
+                (self.output_settings.include_hidden_states, self.output_settings.include_attentions)
+            )
+        )
+
     def _load_model(self):
         """Load and configure model and tokenizer"""
         try:
             # Load model configuration
-            model_config = AutoConfig.from_pretrained(
+            model_config = transformers.AutoConfig.from_pretrained(
                 self.config['model']['name'],
+                revision=self.config['model'].get('revision', 'main'),
                 trust_remote_code=self.config['model']['trust_remote_code']
             )
-
-            # Load model with optimizations
-            model = AutoModel.from_pretrained(
-                self.config['model']['name'],
-                config=model_config,
-                device_map=self.config['hardware']['device_map'],
-                torch_dtype=self._get_torch_dtype()
-            )
-
-            # Apply quantization if enabled
-            if self.config['model']['quantization']['enabled']:
-                model = self._quantize_model(model)
+            # Only compute the optional outputs the config asks for
+            model_config.output_hidden_states = self.output_settings.include_hidden_states
+            model_config.output_attentions = self.output_settings.include_attentions
 
             # Load tokenizer
-            tokenizer = AutoTokenizer.from_pretrained(
+            tokenizer = transformers.AutoTokenizer.from_pretrained(
                 self.config['model']['tokenizer_name']
             )
 
+            # Load model with optimizations; local safetensors stay memory-mapped
+            def load_float():
+                return load_pretrained(
+                    transformers.AutoModel,
+                    self.config['model']['name'],
+                    torch_dtype=self._get_torch_dtype(),
+                    logger=self.logger,
+                    config=model_config,
+                    revision=self.config['model'].get('revision', 'main'),
+                    device_map=self.config['hardware']['device_map']
+                )
+
+            # Apply quantization if enabled, reusing a cached quantized checkpoint
+            if self.config['model']['quantization']['enabled']:
+                model = self._quantize_model(load_float, model_config, tokenizer)
+            else:
+                model = load_float()
+
             return model.to(self.device), tokenizer
 
         except Exception as e:
             self.logger.error(f"Model loading failed: {str(e)}")
             raise
 
+    def _create_backend(self):
+        """Build the eager, compiled, traced or ONNX Runtime backend from optimization.compiler_optimizations"""
+        from backends import BackendSettings, create_backend
+
+        settings = BackendSettings.from_config(
+            self.config.get('optimization', {}).get('compiler_optimizations', {})
+        )
+        return create_backend(self.model, self.model_identity, settings, logger=self.logger)
+
+    def _create_padder(self) -> 'BucketedPadder':
+        """Build the padder from model.parameters padding settings"""
+        from padding import BucketedPadder
+
+        parameters = self.config['model']['parameters']
+        strategy = parameters.get('padding', 'bucket')
+        if strategy is True:
+            strategy = 'longest'
+        return BucketedPadder(
+            self.tokenizer,
+            max_length=parameters['max_seq_length'],
+            strategy=strategy,
+            buckets=parameters.get('padding_buckets'),
+            pin_memory=self.config.get('inference', {}).get('performance', {}).get('pin_memory', False)
+        )
+
     def _get_torch_dtype(self):
         """Convert config dtype string to torch dtype"""
         dtype_map = {
@@ -117,19 +236,47 @@ class ModelWrapper:
         }
         return dtype_map[self.config['hardware']['compute_precision']['dtype']]
 
-    def _quantize_model(self, model):
+    def _quantize_model(self, load_float, model_config, tokenizer):
         """Apply quantization based on config settings"""
-        if self.config['model']['quantization']['method'] == 'dynamic':
-            return torch.quantization.quantize_dynamic(
-                model, 
-                {torch.nn.Linear}, 
-                dtype=torch.qint8
-            )
-        return model
+        from quantization import QuantizationSettings, load_or_quantize
+
+        settings = QuantizationSettings.from_config(self.config['model']['quantization'])
+        calibration = self._calibration_batches(tokenizer, settings) if settings.method == 'static' else None
+        return load_or_quantize(
+            f"{self.model_identity}|{self.config['hardware']['compute_precision']['dtype']}",
+            settings,
+            load_float,
+            build_skeleton=lambda: transformers.AutoModel.from_config(
+                model_config, trust_remote_code=self.config['model']['trust_remote_code']
+            ),
+            calibration=calibration,
+            logger=self.logger
+        )
+
+    def _calibration_batches(self, tokenizer, settings, batch_size: int = 8) -> List[Dict[str, Any]]:
+        """Tokenized calibration set for static quantization, one text per line of calibration_data"""
+        if settings.calibration_data:
+            with open(settings.calibration_data) as f:
+                texts = [line.strip() for line in f if line.strip()][:settings.calibration_samples]
+        else:
+            self.logger.warning("No quantization.calibration_data set; calibrating on synthetic text")
+            texts = [' '.join(['calibration'] * length) for length in (8, 16, 32, 64, 128)]
+        max_length = self.config['model']['parameters']['max_seq_length']
+        return [
+            dict(tokenizer(texts[start:start + batch_size], padding=True, truncation=True, max_length=max_length, return_tensors='pt'))
+            for start in range(0, len(texts), batch_size)
+        ]
+
+    @property
+    def model_identity(self) -> str:
+        """Model name and revision, used to namespace cache keys"""
+        return f"{self.metadata.model_name}@{self.config['model'].get('revision', 'main')}"
 
     async def infer(self, input_data: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Perform model inference with performance tracking and error handling.
+        Awaitable inference that keeps the event loop responsive.
+
+        The blocking forward pass runs on the wrapper's thread pool.
         
         Args:
             input_data: Input text or dictionary containing input data
@@ -137,35 +284,41 @@ class ModelWrapper:
         Returns:
             Dictionary containing model outputs and metadata
         """
-        try:
-            # Record start time
-            start_time = torch.cuda.Event(enable_timing=True)
-            end_time = torch.cuda.Event(enable_timing=True)
-            start_time.record()
+        loop = asyncio.get_running_loop()
+        traces = tracing.active_traces()
+        if not traces:
+            return await loop.run_in_executor(self.executor, self.infer_sync, input_data)
 
-            # Prepare input
-            inputs = self.tokenizer(
-                input_data,
-                return_tensors="pt",
-                padding=self.config['model']['parameters']['padding'],
-                truncation=self.config['model']['parameters']['truncation'],
-                max_length=self.config['model']['parameters']['max_seq_length']
-            ).to(self.device)
+        # Carry sampled traces to the pool thread and record the queue wait
+        enqueued = tracing.now()
+        def _run():
+            tracing.record_span('executor_queue_wait', enqueued, traces=traces)
+            with tracing.activate(traces):
+                return self.infer_sync(input_data)
+        return await loop.run_in_executor(self.executor, _run)
 
-            # Perform inference with automatic mixed precision if enabled
-            with torch.cuda.amp.autocast(enabled=self.config['hardware']['compute_precision']['use_amp']):
-                outputs = self.model(**inputs)
-
-            # Record end time
-            end_time.record()
-            torch.cuda.synchronize()
-            inference_time = start_time.elapsed_time(end_time)
+    def infer_sync(self, input_data: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Perform model inference with performance tracking and error handling.
+        
+        Args:
+            input_data: Input text or dictionary containing input data
+            
+        Returns:
+            Dictionary containing model outputs and metadata
+        """
+        self._ensure_loaded()
+        try:
+            with tracing.span('tokenize'):
+                encoded = self.padder.encode([self._get_text(input_data)])
+            outputs, inputs, inference_time = self._forward(encoded)
 
             # Process outputs
-            result = self._process_outputs(outputs)
-            
-            # Update performance metrics
-            self._update_metrics(inference_time, inputs['input_ids'].shape)
+            with tracing.span('process_outputs'):
+                if self.embedding_settings.enabled:
+                    result = {'embedding': self._pool(outputs, inputs)[0]}
+                else:
+                    result = self._process_outputs(outputs)
 
             return {
                 'result': result,
@@ -181,23 +334,185 @@ class ModelWrapper:
             self.logger.error(f"Inference failed: {str(e)}")
             raise
 
+    def infer_batch(self, batch: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Run batched forward passes and split the outputs per input.
+
+        Inputs are tokenized once and grouped by length, so each forward
+        pass only pads to its group's bucket rather than max_seq_length.
+        
+        Args:
+            batch: Input texts, input dictionaries, ProcessedInput objects or an InputBatch
+            
+        Returns:
+            One result dictionary per input, in input order
+        """
+        self._ensure_loaded()
+        try:
+            with tracing.span('tokenize', batch_size=len(batch)):
+                encoded = self.padder.encode(self._get_texts(batch))
+            results = [None] * len(batch)
+
+            for group in self.padder.group(encoded):
+                outputs, inputs, inference_time = self._forward([encoded[index] for index in group])
+                embeddings = self._pool(outputs, inputs) if self.embedding_settings.enabled else None
+                for row, index in enumerate(group):
+                    results[index] = {
+                        'result': (
+                            {'embedding': embeddings[row]} if embeddings is not None
+                            else self._process_outputs(self._select_row(outputs, row))
+                        ),
+                        'metadata': {
+                            'inference_time_ms': inference_time,
+                            'input_shape': inputs['input_ids'][row:row + 1].shape,
+                            'batch_size': len(group),
+                            'model_name': self.metadata.model_name,
+                            'device': str(self.device)
+                        }
+                    }
+            return results
+
+        except Exception as e:
+            self.logger.error(f"Batched inference failed: {str(e)}")
+            raise
+
+    def embed(self, texts: List[Any], batch_size: Optional[int] = None) -> 'np.ndarray':
+        """
+        Pooled sentence embeddings of many texts.
+
+        Texts are tokenized once, sorted into length buckets and run in
+        forward passes of up to batch_size, and each pooled batch is
+        written straight into its rows of one preallocated matrix.
+        
+        Args:
+            texts: Input texts, input dictionaries, ProcessedInput objects or an InputBatch
+            batch_size: Texts per forward pass (model.embeddings.batch_size by default)
+            
+        Returns:
+            C-contiguous (len(texts), hidden_size) matrix in input order, with
+            the configured pooling, normalization and dtype
+        """
+        self._ensure_loaded()
+        settings = self.embedding_settings
+        try:
+            with tracing.span('tokenize', batch_size=len(texts)):
+                encoded = self.padder.encode(self._get_texts(texts))
+            embeddings = np.empty((len(texts), self.model.config.hidden_size), dtype=settings.dtype)
+            for group in self.padder.group(encoded, max_batch_size=batch_size or settings.batch_size):
+                outputs, inputs, _ = self._forward([encoded[index] for index in group])
+                embeddings[group] = self._pool(outputs, inputs)
+            return embeddings
+
+        except Exception as e:
+            self.logger.error(f"Embedding failed: {str(e)}")
+            raise
+
+    def build_index(self, texts: List[Any], ids: Optional[List[int]] = None) -> 'VectorIndex':
+        """
+        Embed texts into a new vector index configured by inference.vector_index.
+
+        Args:
+            texts: Texts to index
+            ids: Optional id per text (consecutive from 0 by default)
+            
+        Returns:
+            The index; search it with index.search(self.embed(queries), k)
+        """
+        from vector_index import IndexSettings, create_index
+
+        settings = IndexSettings.from_config(self.config.get('inference', {}).get('vector_index', {}))
+        embeddings = self.embed(texts)
+        index = create_index(embeddings.shape[1], settings, logger=self.logger)
+        index.add(embeddings, ids)
+        return index
+
+    def _pool(self, outputs: Any, inputs: Dict[str, Any]) -> 'np.ndarray':
+        """Pooled embedding per row of a forward pass, in the configured dtype"""
+        settings = self.embedding_settings
+        with tracing.span('pool'):
+            pooled = pool(hidden_states(outputs), inputs['attention_mask'], settings.pooling, settings.normalize)
+            return to_numpy(pooled).astype(settings.dtype, copy=False)
+
+    def _forward(self, encoded: List[List[int]]):
+        """Pad tokenized sequences and run one timed forward pass over them"""
+        # Host-side timer; waits for queued device work only off the CPU
+        with self.metrics.timer(self.latency, device=self.device) as timer:
+            # Prepare input
+            with tracing.span('pad_and_copy'):
+                inputs = {
+                    name: tensor.to(self.device, non_blocking=True)
+                    for name, tensor in self.padder.pad(encoded).items()
+                }
+
+            # Perform inference with automatic mixed precision if enabled
+            use_amp = self.config['hardware']['compute_precision']['use_amp']
+            with torch.autocast('cuda', enabled=use_amp and torch.device(self.device).type == 'cuda'):
+                with tracing.span('forward', shape=list(inputs['input_ids'].shape)):
+                    outputs = self.backend(inputs)
+                    if tracing.active_traces():
+                        # Attribute queued device work to the forward span
+                        synchronize(self.device)
+        inference_time = timer.elapsed * 1000
+        with self._load_lock:
+            first, self._first_inference = self._first_inference, False
+        if first:
+            # Includes one-off costs such as backend compilation for this shape
+            get_startup_profile().record('first_inference', self.metadata.model_name, timer.elapsed)
+            self.logger.info(get_startup_profile().format_report())
+
+        # Update performance metrics
+        self._update_metrics(inference_time, inputs['input_ids'].shape)
+
+        return outputs, inputs, inference_time
+
+    @staticmethod
+    def _get_text(input_data: Any) -> str:
+        """Extract input text from a string, dictionary or ProcessedInput"""
+        if hasattr(input_data, 'data'):
+            input_data = input_data.data
+        if isinstance(input_data, dict):
+            return input_data.get('text', '')
+        return str(input_data)
+
+    @staticmethod
+    def _get_texts(batch: Any) -> List[str]:
+        """Input texts of a batch; an InputBatch hands over its texts column as is"""
+        if isinstance(batch, InputBatch):
+            return batch.texts
+        return [ModelWrapper._get_text(item) for item in batch]
+
+    @staticmethod
+    def _select_row(outputs: Any, index: int) -> Dict[str, Any]:
+        """Slice every batched tensor in the model outputs down to one row"""
+        return {
+            key: value[index:index + 1]
+            for key, value in outputs.items()
+            if torch.is_tensor(value)
+        }
+
     def _process_outputs(self, outputs: Any) -> Dict[str, Any]:
         """Process model outputs based on model type and configuration"""
         # Implement specific output processing logic
         pass
 
-    def _update_metrics(self, inference_time: float, input_shape: torch.Size):
+    def _update_metrics(self, inference_time: float, input_shape: 'torch.Size'):
         """Update performance metrics for monitoring"""
+        self.samples.inc(input_shape[0])
         self.metadata.performance_metrics.update({
             'last_inference_time': inference_time,
             'average_inference_time': self._calculate_running_average(inference_time),
-            'throughput': input_shape[0] / (inference_time / 1000)  # samples per second
+            'p50_inference_time': (self.latency.quantile(0.5) or 0.0) * 1000,
+            'p95_inference_time': (self.latency.quantile(0.95) or 0.0) * 1000,
+            'p99_inference_time': (self.latency.quantile(0.99) or 0.0) * 1000,
+            'throughput': input_shape[0] / (inference_time / 1000) if inference_time else 0.0,  # samples per second
+            'padding_efficiency': self.padder.stats.efficiency
         })
 
     def _calculate_running_average(self, new_value: float) -> float:
         """Calculate running average for performance metrics"""
-        # Implement running average calculation
-        pass
+        # The histogram already holds every observed forward pass
+        mean = self.latency.mean
+        return mean * 1000 if mean is not None else new_value
 
     def save_metrics(self, path: str):
         """Save performance metrics to file"""
@@ -209,4 +524,7 @@ class ModelWrapper:
     def cleanup(self):
         """Clean up resources"""
         self.executor.shutdown()
-        torch.cuda.empty_cache()
+        if self.loaded:
+            # The registry keeps the model cached until its memory is needed
+            self._model_handle.release()
+            torch.cuda.empty_cache()